@@ -4,9 +4,12 @@
 PDF → Parquet extractor (local paths OR S3 prefixes)
 - Recursively lists PDFs under an S3 prefix
 - Extracts page text with layout-aware ordering + optional OCR fallback
-- WRITES OUTPUT to:
-    s3://<bucket>/env=prod/zone=text/state=<STATE>/county=<COUNTY>/<filename>_text.parquet
-  where <STATE> and <COUNTY> are parsed from the INPUT S3 KEY.
+- WRITES OUTPUT as one hive-partitioned dataset per run:
+    s3://<bucket>/env=prod/zone=text_dataset/state=<STATE>/county=<COUNTY>/part-<run>-<n>-<i>.parquet
+  where <STATE> and <COUNTY> are parsed from the INPUT S3 KEY. state and county
+  also stay columns in every file, so files can be read on their own. Existing
+  files are never deleted; every run writes part-<run>-<n>-<i>.parquet names of its own.
+  (--per-pdf keeps the old zone=text/.../<filename>_text.parquet file per PDF).
 
 Args:
   --input : local file/folder OR s3://bucket/prefix OR s3://bucket/file.pdf
@@ -14,29 +17,46 @@ Args:
   --env/--zone/--state/--county : optional metadata (still written into parquet)
   --no-ocr : disable OCR fallback
   --s3-max : limit number of PDFs processed from S3 (0 = no limit)
+  --per-pdf : write one parquet per PDF instead of one dataset per run
+  --workers : number of extraction processes (default: min(cpu_count, 6))
 
 Notes:
-- For LOCAL inputs, --out is treated as a directory/prefix and we’ll write <stem>.parquet (no state/county mapping).
+- For LOCAL inputs, --out is treated as a directory/prefix: the dataset goes to <out>/dataset, partitioned
+  by --state/--county when both are given (unpartitioned otherwise),
+  or with --per-pdf we’ll write <stem>.parquet (no state/county mapping).
 - For S3 inputs, the output path is derived from INPUT KEY’s state=... and county=...
 """
 
 import argparse
+import asyncio
+import functools
 import hashlib
 import os
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
+from itertools import compress, groupby
+from operator import itemgetter
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 import re
-import tempfile
-import shutil
+
+# Native libs (MuPDF/Tesseract/BLAS) must not spawn their own threads per worker.
+# Set before numpy/numba/tesserocr are imported: their thread pools are sized at
+# import time and inherited by forked workers.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
 
 import fitz  # PyMuPDF
+import numpy as np
+from numba import njit  # JIT for the row-grouping pass
 from PIL import Image
 import pytesseract
-import pandas as pd
 import pyarrow as pa
+import pyarrow.dataset as pads
 import pyarrow.parquet as pq
 
 # Optional pyarrow fs for s3 write
@@ -45,7 +65,20 @@ try:
 except Exception:
     pafs = None
 
+# Optional in-process Tesseract (no PNG/tempfile/subprocess round-trip); pytesseract otherwise
+try:
+    from tesserocr import PyTessBaseAPI
+except Exception:
+    PyTessBaseAPI = None
+
+# Optional asyncio S3 client: overlaps LIST pages with GETs for prefix inputs
+try:
+    import aioboto3
+except Exception:
+    aioboto3 = None
+
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # ------------------------ Tunables ------------------------
@@ -56,6 +89,11 @@ OCR_LANG       = os.getenv("OCR_LANG", "eng")
 OCR_TIMEOUT_S  = int(os.getenv("OCR_TIMEOUT_S", "12"))
 MAX_OCR_PAGES  = int(os.getenv("MAX_OCR_PAGES", "20"))
 ALLOW_OCR      = os.getenv("ALLOW_OCR", "true").lower() != "false"  # --no-ocr overrides
+OCR_OEM        = int(os.getenv("OCR_OEM", "1"))   # 1 = LSTM only
+OCR_PSM        = int(os.getenv("OCR_PSM", "6"))   # 6 = single text block, skips page layout analysis
+# Tesseract threads per extraction process (Tesseract releases the GIL; PyMuPDF does not).
+# 0 = cpu_count // workers, so all processes together don't oversubscribe the cores
+OCR_THREADS    = int(os.getenv("OCR_THREADS", "0"))
 
 # Two-column detection (tuned)
 MIN_GAP_RATIO         = 0.12     # ~12% of page width
@@ -70,13 +108,24 @@ Y_TOL = 2.0  # row grouping tolerance (points)
 
 APPLY_ENUMERATOR_CLEAN = True
 
-# ------------------------ Small helpers ------------------------
+MAX_WORKERS = min(os.cpu_count() or 1, 6)  # process pool size for PDF extraction
+S3_FETCH_WORKERS = 16                      # threads for concurrent S3 GETs (I/O-bound)
+S3_ASYNC_CONCURRENCY = 64                  # in-flight GETs when streaming a prefix via aioboto3
+UPLOAD_WORKERS   = 4                       # threads writing parquet (pyarrow releases the GIL)
+
+# Dataset output (default): rows buffered across PDFs, flushed as one partitioned dataset.
+# The buffer is the pipeline's main memory cost (a page row is a few KB of text).
+DATASET_FLUSH_ROWS    = int(os.getenv("DATASET_FLUSH_ROWS", "50000"))
+DATASET_ROWS_PER_FILE = 500_000
+DATASET_ROWS_PER_GROUP = 64 * 1024
 
-def sha256_text(s: str) -> str:
-    return hashlib.sha256((s or "").encode("utf-8")).hexdigest()
+S3_UPLOAD_BUFFER = 64 * 1024 * 1024  # output-stream buffer = multipart part size
+PARQUET_BATCH_BYTES = 64 * 1024 * 1024  # encode in ~64 MiB batches so parts upload while the next encodes
+
+# ------------------------ Small helpers ------------------------
 
-def now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def now_utc() -> datetime:
+    return datetime.now(timezone.utc)
 
 def as_str(s: Optional[str]) -> Optional[str]:
     if s is None: return None
@@ -100,78 +149,105 @@ def slugify_filename(name: str) -> str:
 
 # ------------------------ OCR ------------------------
 
-def ocr_page_to_text(page: fitz.Page, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> str:
-    zoom = dpi / 72.0
-    mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    try:
-        txt = pytesseract.image_to_string(img, lang=lang, timeout=OCR_TIMEOUT_S) or ""
-    except RuntimeError:
-        return ""
+_tess_local = threading.local()
+
+def _tess_api(lang: str):
+    # One PyTessBaseAPI per thread per language; init (model load) is the expensive part
+    apis = getattr(_tess_local, "apis", None)
+    if apis is None:
+        apis = _tess_local.apis = {}
+    api = apis.get(lang)
+    if api is None:
+        api = apis[lang] = PyTessBaseAPI(lang=lang, psm=OCR_PSM, oem=OCR_OEM)
+    return api
+
+_OCR_MAT = fitz.Matrix(OCR_DPI / 72.0, OCR_DPI / 72.0)
+
+def render_for_ocr(page: fitz.Page, dpi: int = OCR_DPI) -> Tuple[bytes, int, int, int]:
+    """Rasterize a page for OCR. Touches the Document, so callers keep this on one thread."""
+    mat = _OCR_MAT if dpi == OCR_DPI else fitz.Matrix(dpi / 72.0, dpi / 72.0)
+    # Tesseract binarizes grayscale anyway; 1 byte/pixel instead of 3
+    pix = page.get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csGRAY)
+    return pix.samples, pix.width, pix.height, pix.stride
+
+def ocr_pixels(samples: bytes, width: int, height: int, stride: int, lang: str = OCR_LANG) -> str:
+    """OCR a grayscale raster from render_for_ocr. Pure Tesseract work, safe to run on any thread."""
+    if PyTessBaseAPI is not None:
+        api = _tess_api(lang)
+        api.SetImageBytes(samples, width, height, 1, stride)  # no copy; samples stays referenced here
+        if not api.Recognize(timeout=OCR_TIMEOUT_S * 1000):
+            return ""
+        txt = api.GetUTF8Text() or ""
+    else:
+        img = Image.frombytes("L", [width, height], samples)
+        try:
+            txt = pytesseract.image_to_string(img, lang=lang, config=f"--oem {OCR_OEM} --psm {OCR_PSM}",
+                                              timeout=OCR_TIMEOUT_S) or ""
+        except RuntimeError:
+            return ""
     return txt.replace("\r\n", "\n").replace("\r", "\n").strip()
 
+def ocr_page_to_text(page: fitz.Page, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> str:
+    return ocr_pixels(*render_for_ocr(page, dpi), lang=lang)
+
+@functools.lru_cache(maxsize=1)
+def _ocr_pool() -> ThreadPoolExecutor:
+    # Per-process and long-lived, so thread-local Tesseract handles survive across PDFs
+    return ThreadPoolExecutor(max_workers=OCR_THREADS, thread_name_prefix="ocr")
+
 # ------------------------ Layout-aware extraction ------------------------
 
-def _collect_items_dict(page: fitz.Page):
-    d = page.get_text("dict") or {}
+_WORD_LINE_KEY = itemgetter(5, 6, 7)  # (block_no, line_no, word_no)
+# Default text flags minus image/ligature bookkeeping we never read (ligatures expand to plain letters)
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES & ~fitz.TEXT_PRESERVE_LIGATURES
+
+def _collect_items(page: fitz.Page):
+    # "words" yields flat C-built tuples (x0, y0, x1, y1, word, block_no, line_no, word_no);
+    # far cheaper than materializing the span dicts of get_text("dict") we never read.
+    words = sorted(page.get_text("words", flags=_TEXT_FLAGS), key=_WORD_LINE_KEY)
     items = []
-    for b_idx, b in enumerate(d.get("blocks", [])):
-        if b.get("type", 0) != 0:
-            continue
-        for ln in b.get("lines", []):
-            spans = ln.get("spans", [])
-            if not spans:
-                continue
-            x0, y0, x1, y1 = ln.get("bbox", (0, 0, 0, 0))
-            txt = "".join((s.get("text") or "") for s in spans)
-            txt = txt.replace("\r\n", "\n").replace("\r", "\n")
-            if not txt.strip():
-                continue
-            items.append({"bidx": b_idx, "y": y0, "x": x0, "x1": x1, "text": txt.rstrip()})
+    for (b_idx, _), grp in groupby(words, key=itemgetter(5, 6)):
+        grp = list(grp)
+        items.append({
+            "bidx": b_idx,
+            "y": min(w[1] for w in grp),
+            "x": grp[0][0],
+            "x1": max(w[2] for w in grp),
+            "text": " ".join(w[4] for w in grp),
+        })
     return items
 
+def _line_center(it: dict) -> float:
+    # True line center (x0+x1)/2. Fallback to x if x1 missing.
+    x0 = it.get("x", 0.0)
+    x1 = it.get("x1", None)
+    return 0.5 * (x0 + x1) if isinstance(x1, (int, float)) else float(x0)
+
 def _items_to_columns(items: List[dict], page_width: float):
     # Need enough signals to even consider a split
     need = max(4, 2 * MIN_BLOCKS_PER_COLUMN)
-    if len(items) < need:
+    n = len(items)
+    if n < need:
         return items, [], None
 
-    # Trim top/bottom bands to avoid headers/footers polluting gutter search
-    ys = sorted(it["y"] for it in items)
-    if ys:
-        k = int(len(ys) * TRIM_TOP_BOTTOM_RATIO)
-        y_lo = ys[k] if k < len(ys) else ys[0]
-        y_hi = ys[-k-1] if k > 0 else ys[-1]
-        trimmed = [it for it in items if y_lo <= it["y"] <= y_hi]
-        if len(trimmed) >= need:
-            work = trimmed
-        else:
-            work = items
-    else:
-        work = items
+    ys = np.fromiter((it["y"] for it in items), dtype=np.float64, count=n)
+    centers_all = np.fromiter((_line_center(it) for it in items), dtype=np.float64, count=n)
 
-    # Use true line centers (x0+x1)/2. Fallback to x if x1 missing.
-    centers = []
-    for it in work:
-        x0 = it.get("x", 0.0)
-        x1 = it.get("x1", None)
-        c  = 0.5 * (x0 + x1) if isinstance(x1, (int, float)) else float(x0)
-        centers.append(c)
-
-    if len(centers) < need:
-        return items, [], None
+    # Trim top/bottom bands to avoid headers/footers polluting gutter search
+    k = int(n * TRIM_TOP_BOTTOM_RATIO)
+    hi_idx = n - 1 - k
+    part = np.partition(ys, (k, hi_idx))
+    y_lo, y_hi = part[k], part[hi_idx]
+    in_band = (ys >= y_lo) & (ys <= y_hi)
+    centers = centers_all[in_band] if int(in_band.sum()) >= need else centers_all.copy()
 
     centers.sort()
-    max_gap, mid = 0.0, None
-    for i in range(len(centers) - 1):
-        gap = centers[i+1] - centers[i]
-        if gap > max_gap:
-            max_gap = gap
-            mid = 0.5 * (centers[i+1] + centers[i])
-
-    if mid is None:
+    diffs = np.diff(centers)
+    gi = int(diffs.argmax())
+    max_gap = float(diffs[gi])
+    if max_gap <= 0.0:
         return items, [], None
+    mid = 0.5 * float(centers[gi + 1] + centers[gi])
 
     # Stronger interior checks
     if not (EDGE_MARGIN_RATIO * page_width < mid < (1.0 - EDGE_MARGIN_RATIO) * page_width):
@@ -185,12 +261,9 @@ def _items_to_columns(items: List[dict], page_width: float):
         return items, [], None
 
     # Split by center (not x+100)
-    left, right = [], []
-    for it in items:
-        x0 = it.get("x", 0.0)
-        x1 = it.get("x1", None)
-        c  = 0.5 * (x0 + x1) if isinstance(x1, (int, float)) else float(x0)
-        (left if c <= mid else right).append(it)
+    is_left = centers_all <= mid
+    left = [it for it, l in zip(items, is_left) if l]
+    right = [it for it, l in zip(items, is_left) if not l]
 
     if len(left) < MIN_BLOCKS_PER_COLUMN or len(right) < MIN_BLOCKS_PER_COLUMN:
         return items, [], None
@@ -198,30 +271,44 @@ def _items_to_columns(items: List[dict], page_width: float):
     return left, right, mid
 
 
+@njit(cache=True)
+def _row_ids(ys_sorted: np.ndarray, y_tol: float) -> np.ndarray:
+    # Walk y-sorted lines; a line joins the current row while it is within
+    # y_tol of the row's running mean y, otherwise it starts a new row.
+    n = ys_sorted.shape[0]
+    rows = np.empty(n, dtype=np.int64)
+    row = 0
+    last_y = ys_sorted[0]
+    rows[0] = 0
+    for j in range(1, n):
+        y = ys_sorted[j]
+        if abs(y - last_y) <= y_tol:
+            last_y = (last_y + y) / 2.0
+        else:
+            row += 1
+            last_y = y
+        rows[j] = row
+    return rows
+
 def _sort_items(items: List[dict]):
     if not items:
         return []
-    items = sorted(items, key=lambda it: it["y"])
-    rows, cur = [], []
-    last_y = None
-    for it in items:
-        if last_y is None or abs(it["y"] - last_y) <= Y_TOL:
-            cur.append(it)
-            last_y = it["y"] if last_y is None else (last_y + it["y"]) / 2.0
-        else:
-            cur.sort(key=lambda z: (round(z["x"], 2), z["bidx"]))
-            rows.append(cur)
-            cur = [it]
-            last_y = it["y"]
-    if cur:
-        cur.sort(key=lambda z: (round(z["x"], 2), z["bidx"]))
-        rows.append(cur)
-    return [it for row in rows for it in row]
-
-def page_text_layout(page: fitz.Page) -> str:
-    items = _collect_items_dict(page)
+    n = len(items)
+    ys = np.fromiter((it["y"] for it in items), dtype=np.float64, count=n)
+    xs = np.fromiter((round(it["x"], 2) for it in items), dtype=np.float64, count=n)
+    bs = np.fromiter((it["bidx"] for it in items), dtype=np.int64, count=n)
+
+    order = np.argsort(ys, kind="stable")
+    rows = _row_ids(ys[order], Y_TOL)
+    # Reading order: row, then x, then block index (lexsort is stable, last key is primary)
+    perm = order[np.lexsort((bs[order], xs[order], rows))]
+    return [items[i] for i in perm]
+
+def page_text_layout(page: fitz.Page) -> Tuple[str, int]:
+    """Return (layout-ordered text, number of text lines found) for a page."""
+    items = _collect_items(page)
     if not items:
-        return ""
+        return "", 0
     left, right, gutter = _items_to_columns(items, page.rect.width)
 
     def join_items(its: List[dict]) -> str:
@@ -229,136 +316,302 @@ def page_text_layout(page: fitz.Page) -> str:
         return "\n".join(it["text"] for it in ordered if it["text"].strip())
 
     if gutter is None:
-        return join_items(items).strip()
-    return "\n\n".join(s for s in (join_items(left), join_items(right)) if s).strip()
+        return join_items(items).strip(), len(items)
+    return "\n\n".join(s for s in (join_items(left), join_items(right)) if s).strip(), len(items)
 
 # ------------------------ Enumerator cleaner ------------------------
 
+# One multiline scan over the whole page: a line is a "bare enumerator" if,
+# ignoring surrounding whitespace, it is only a list marker like "A." or "(iv)"
 _BARE_ENUM_RE = re.compile(
-    r'^([A-Z]\.|\([A-Za-z]\)|\d+\.|\([0-9]{1,3}\)|[ivxlcdm]+\.|\([ivxlcdm]+\))\s*$',
-    re.IGNORECASE
+    r'^[^\S\n]*([A-Z]\.|\([A-Za-z]\)|\d+\.|\([0-9]{1,3}\)|[ivxlcdm]+\.|\([ivxlcdm]+\))[^\S\n]*$',
+    re.IGNORECASE | re.MULTILINE
 )
 
+# Every bare enumerator ends in one of these; pages without any skip the regex scan
+_ENUM_TERMINATORS = frozenset(".)")
+
+def _orphan_enum_keep(lines: List[str], joined: str) -> List[bool]:
+    """Keep-mask for lines; joined must be "\n".join(lines)."""
+    n = len(lines)
+    if not any(t in joined for t in _ENUM_TERMINATORS):
+        return [True] * n
+    # Map regex hits back to line indices via line start offsets
+    starts = np.zeros(n, dtype=np.int64)
+    np.cumsum(np.fromiter((len(ln) + 1 for ln in lines[:-1]), dtype=np.int64, count=n - 1), out=starts[1:])
+    hits = np.fromiter((m.start() for m in _BARE_ENUM_RE.finditer(joined)), dtype=np.int64)
+    if not hits.size:
+        return [True] * n
+    mask = np.zeros(n, dtype=bool)
+    mask[np.searchsorted(starts, hits, side="right") - 1] = True
+    is_enum = mask.tolist()
+
+    # Backward pass on indices only: nxt = next non-empty line after i (-1 if none)
+    keep = [True] * n
+    nxt = -1
+    for i in range(n - 1, -1, -1):
+        if is_enum[i]:
+            keep[i] = nxt >= 0 and not is_enum[nxt]
+            nxt = i
+        elif lines[i].strip():
+            nxt = i
+    return keep
+
 def remove_orphan_enumerators(text: str) -> str:
+    """Drop bare enumerator lines that are followed by another bare enumerator or by nothing."""
     lines = str(text or "").splitlines()
-    out, i, n = [], 0, len(lines)
-
-    def is_bare_enum(s: str) -> bool:
-        return bool(_BARE_ENUM_RE.match(s.strip()))
-
-    def next_nonempty(j: int):
-        k = j
-        while k < n and not lines[k].strip():
-            k += 1
-        return k if k < n else None
-
-    while i < n:
-        raw = lines[i]
-        if is_bare_enum(raw):
-            k = next_nonempty(i + 1)
-            if k is None:
-                i += 1
-                continue
-            nxt = lines[k].strip()
-            if is_bare_enum(nxt):
-                i += 1
-                continue
-            out.append(raw)
-            i += 1
-            continue
-        out.append(raw)
-        i += 1
-    return "\n".join(out)
+    if not lines:
+        return ""
+    keep = _orphan_enum_keep(lines, "\n".join(lines))
+    return "\n".join(compress(lines, keep))
+
+def clean_and_hash(text: str, source_name: str, page_num: int) -> Tuple[str, str]:
+    """
+    Orphan-enumerator cleanup + page fingerprint in one go. The single
+    "\n"-joined copy the regex scans is returned as-is when nothing is
+    dropped (the common case), and the fingerprint is fed incrementally
+    instead of hashing a formatted "{source}|{page}|{text}" copy.
+    """
+    if APPLY_ENUMERATOR_CLEAN and text:
+        lines = text.splitlines()
+        joined = "\n".join(lines)
+        keep = _orphan_enum_keep(lines, joined)
+        text = joined if all(keep) else "\n".join(compress(lines, keep))
+    # Dedup fingerprint, not a security primitive: BLAKE2b-256 is faster than SHA-256
+    h = hashlib.blake2b(f"{source_name}|{page_num}|".encode("utf-8"), digest_size=32)
+    h.update(text.encode("utf-8"))
+    return text, h.hexdigest()
 
 # ------------------------ Extraction core ------------------------
 
-def extract_pdf_to_records(pdf_path: Path,
+def extract_pdf_to_records(pdf_path: Optional[Path],
                            env: Optional[str],
                            zone: Optional[str],
                            state: Optional[str],
-                           county: Optional[str]) -> List[Dict]:
-    source_name = pdf_path.name
-    doc_id = hashlib.sha1(str(pdf_path).encode("utf-8")).hexdigest()[:20]
-    ts = now_iso()
+                           county: Optional[str],
+                           pdf_bytes: Optional[bytes] = None,
+                           source_name: Optional[str] = None,
+                           source_uri: Optional[str] = None) -> List[Dict]:
+    """
+    Extract per-page records from a PDF on disk (pdf_path) or already in
+    memory (pdf_bytes + source_name, e.g. an S3 object body). source_uri
+    seeds doc_id for in-memory docs so it stays stable across runs.
+    """
+    if pdf_bytes is None:
+        source_name = pdf_path.name
+        doc_key = str(pdf_path)
+    else:
+        doc_key = source_uri or source_name
+    doc_id = hashlib.sha1(doc_key.encode("utf-8")).hexdigest()[:20]
+    ts = now_utc()
     records: List[Dict] = []
     ocr_used = 0
 
-    with fitz.open(str(pdf_path)) as doc:
-        for i in range(doc.page_count):
-            page = doc.load_page(i)
-            page_num = i + 1
-
-            txt = page_text_layout(page)
-            is_ocr = False
+    # Pass 1 (this thread only; PyMuPDF objects aren't thread-safe): layout text for
+    # every page, rasterizing OCR candidates and handing Tesseract to the OCR pool.
+    pages: List[Tuple[str, Optional[object]]] = []
+    opened = fitz.open(str(pdf_path)) if pdf_bytes is None else fitz.open(stream=pdf_bytes, filetype="pdf")
+    with opened as doc:
+        for page in doc:
+            txt, n_items = page_text_layout(page)
+            ocr_fut = None
 
+            # MAX_OCR_PAGES caps OCR attempts (results aren't known yet when we submit)
             needs_ocr = (
                 ALLOW_OCR
                 and len(txt.strip()) < MIN_TEXT_LEN
                 and ocr_used < MAX_OCR_PAGES
             )
-            if needs_ocr:
-                items = _collect_items_dict(page)
-                if len(items) <= 2:
-                    txt_ocr = ocr_page_to_text(page, OCR_DPI, OCR_LANG)
-                    if len(txt_ocr.strip()) > len(txt.strip()):
-                        txt = txt_ocr
-                        is_ocr = True
-                        ocr_used += 1
-
-            if APPLY_ENUMERATOR_CLEAN and txt:
-                txt = remove_orphan_enumerators(txt)
-
-            rec = {
-                "doc_id": doc_id,
-                "source_name": source_name,
-                "page": page_num,
-                "text": txt,
-                "is_ocr": is_ocr,
-                "char_len": len(txt),
-                "sha256": sha256_text(f"{source_name}|{page_num}|{txt}"),
-                "extracted_at": ts,
-                "env": as_str(env),
-                "zone": as_str(zone),
-                "state": as_str(state),
-                "county": as_str(county),
-            }
-            records.append(rec)
+            if needs_ocr and n_items <= 2:
+                ocr_fut = _ocr_pool().submit(ocr_pixels, *render_for_ocr(page, OCR_DPI), lang=OCR_LANG)
+                ocr_used += 1
+            pages.append((txt, ocr_fut))
+
+    # Pass 2: collect OCR results and build records
+    for i, (txt, ocr_fut) in enumerate(pages):
+        page_num = i + 1
+        is_ocr = False
+        if ocr_fut is not None:
+            txt_ocr = ocr_fut.result()
+            if len(txt_ocr.strip()) > len(txt.strip()):
+                txt = txt_ocr
+                is_ocr = True
+
+        txt, fingerprint = clean_and_hash(txt, source_name, page_num)
+
+        rec = {
+            "doc_id": doc_id,
+            "source_name": source_name,
+            "page": page_num,
+            "text": txt,
+            "is_ocr": is_ocr,
+            "char_len": len(txt),
+            "sha256": fingerprint,  # BLAKE2b; column name kept for schema compat
+            "extracted_at": ts,
+            "env": as_str(env),
+            "zone": as_str(zone),
+            "state": as_str(state),
+            "county": as_str(county),
+        }
+        records.append(rec)
 
     return records
 
 # ------------------------ Parquet write ------------------------
 
+SCHEMA = pa.schema([
+    ("doc_id", pa.string()),
+    ("source_name", pa.string()),
+    ("page", pa.int32()),
+    ("text", pa.large_string()),  # 64-bit offsets: a table of big pages can pass 2 GiB
+    ("is_ocr", pa.bool_()),
+    ("char_len", pa.int32()),
+    ("sha256", pa.string()),
+    ("extracted_at", pa.timestamp("us", "UTC")),
+    ("env", pa.string()),
+    ("zone", pa.string()),
+    ("state", pa.string()),
+    ("county", pa.string()),
+])
+
+# Low-cardinality columns get dictionary pages; page text (large, repetitive) gets
+# zstd-3 + DELTA_BYTE_ARRAY for shared prefixes; everything else stays snappy.
+_DICT_COLS = ["env", "zone", "state", "county", "source_name", "doc_id"]
+PARQUET_WRITE_OPTS = dict(
+    compression={name: ("zstd" if name == "text" else "snappy") for name in SCHEMA.names},
+    compression_level={"text": 3},
+    use_dictionary=_DICT_COLS,
+    column_encoding={"text": "DELTA_BYTE_ARRAY"},
+    data_page_size=1 << 20,
+    write_statistics=True,
+)
+
+def _records_to_table(records: List[Dict]) -> pa.Table:
+    # Records already match SCHEMA; skip the pandas round-trip and dtype inference
+    return pa.Table.from_pylist(records, schema=SCHEMA)
+
+@functools.lru_cache(maxsize=1)
+def _arrow_s3fs():
+    if pafs is None:
+        raise RuntimeError("pyarrow.fs is not available; cannot write to S3")
+    return pafs.S3FileSystem(
+        region=os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1")),
+        access_key=os.getenv("AWS_ACCESS_KEY_ID"),
+        secret_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        request_timeout=60,
+        connect_timeout=10,
+    )
+
 def write_parquet(records: List[Dict], out_path: str):
     if not records:
         print(f"[warn] No records to write for {out_path}")
         return
-    df = pd.DataFrame.from_records(records)
-    for col in ("env", "zone", "state", "county", "source_name"):
-        if col in df.columns:
-            df[col] = df[col].astype("string")
-    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = _records_to_table(records)
 
     if out_path.startswith("s3://"):
-        if pafs is None:
-            raise RuntimeError("pyarrow.fs is not available; cannot write to S3")
         _, _, rest = out_path.partition("s3://")
         bucket, _, key = rest.partition("/")
-        fs = pafs.S3FileSystem(
-            region=os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1")),
-            access_key=os.getenv("AWS_ACCESS_KEY_ID"),
-            secret_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        )
-        with fs.open_output_stream(f"{bucket}/{key}") as sink:
-            pq.write_table(table, sink)
-        print(f"[ok] wrote {len(df)} rows → {out_path}")
+        fs = _arrow_s3fs()
+        with fs.open_output_stream(f"{bucket}/{key}", buffer_size=S3_UPLOAD_BUFFER) as sink:
+            with pq.ParquetWriter(sink, SCHEMA, **PARQUET_WRITE_OPTS) as writer:
+                rows = max(1, table.num_rows * PARQUET_BATCH_BYTES // max(table.nbytes, 1))
+                for batch in table.to_batches(max_chunksize=rows):
+                    writer.write_batch(batch)
+        print(f"[ok] wrote {table.num_rows} rows → {out_path}")
     else:
         out_path = str(Path(out_path))
         os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        pq.write_table(table, out_path)
-        print(f"[ok] wrote {len(df)} rows → {out_path}")
+        pq.write_table(table, out_path, **PARQUET_WRITE_OPTS)
+        print(f"[ok] wrote {table.num_rows} rows → {out_path}")
+
+def write_dataset(records: List[Dict], out_dir: str, basename_template: str):
+    """
+    Write records as parquet files directly under out_dir (local dir or
+    s3:// prefix). Existing files with other basenames are left alone.
+    """
+    if not records:
+        return
+    table = _records_to_table(records)
+    if out_dir.startswith("s3://"):
+        fs = _arrow_s3fs()
+        base_dir = out_dir[len("s3://"):].rstrip("/")
+    else:
+        fs = None
+        base_dir = str(Path(out_dir))
+        os.makedirs(base_dir, exist_ok=True)
+    pads.write_dataset(
+        table,
+        base_dir=base_dir,
+        format="parquet",
+        file_options=pads.ParquetFileFormat().make_write_options(**PARQUET_WRITE_OPTS),
+        filesystem=fs,
+        basename_template=basename_template,
+        existing_data_behavior="overwrite_or_ignore",
+        max_rows_per_file=DATASET_ROWS_PER_FILE,
+        max_rows_per_group=DATASET_ROWS_PER_GROUP,
+    )
+    print(f"[ok] wrote {table.num_rows} rows → {out_dir.rstrip('/')}/{basename_template}")
+
+class DatasetWriter:
+    """
+    Buffers records across PDFs and flushes them as a few large files per
+    state=/county= partition under out_root. Partitions are laid out by hand
+    rather than with write_dataset's partitioning, which would drop state and
+    county from the files. Files are named part-<run>-<flush>-<i>.parquet with
+    a per-run id, so a run only ever adds files and never touches data
+    written by earlier runs.
+    """
+
+    def __init__(self, out_root: str, flush_rows: int = DATASET_FLUSH_ROWS):
+        self.out_root = out_root.rstrip("/")
+        self.flush_rows = flush_rows
+        self._buf: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flushes = 0
+        self._run_id = f"{now_utc():%Y%m%dT%H%M%SZ}-{os.urandom(3).hex()}"
+
+    def add(self, records: List[Dict]):
+        with self._lock:
+            self._buf.extend(records)
+            if len(self._buf) >= self.flush_rows:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+
+    def _partition_dir(self, state: Optional[str], county: Optional[str]) -> str:
+        # Records without both values (local runs without --state/--county) go in the root
+        if state and county:
+            return f"{self.out_root}/state={state}/county={county}"
+        return self.out_root
+
+    def _flush(self):
+        if not self._buf:
+            return
+        by_dir: Dict[str, List[Dict]] = {}
+        for rec in self._buf:
+            by_dir.setdefault(self._partition_dir(rec["state"], rec["county"]), []).append(rec)
+        for out_dir, records in by_dir.items():
+            write_dataset(records, out_dir, f"part-{self._run_id}-{self._flushes}-{{i}}.parquet")
+        self._flushes += 1
+        self._buf = []
 
 # ------------------------ S3 helpers ------------------------
 
+@functools.lru_cache(maxsize=1)
+def _s3_client():
+    # One client per process: construction (credential + endpoint resolution) costs 100ms+
+    return boto3.client(
+        "s3",
+        region_name=os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1")),
+        config=Config(
+            max_pool_connections=32,
+            retries={"mode": "adaptive", "max_attempts": 10},
+            tcp_keepalive=True,
+        ),
+    )
+
 def discover_local_pdfs(input_path: Path) -> List[Path]:
     if input_path.is_file() and input_path.suffix.lower() == ".pdf":
         return [input_path]
@@ -367,9 +620,8 @@ def discover_local_pdfs(input_path: Path) -> List[Path]:
     return []
 
 def list_s3_pdfs(bucket: str, prefix: str) -> List[str]:
-    s3 = boto3.client("s3", region_name=os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1")))
     keys = []
-    paginator = s3.get_paginator("list_objects_v2")
+    paginator = _s3_client().get_paginator("list_objects_v2")
     for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
         for obj in page.get("Contents", []) or []:
             k = obj["Key"]
@@ -377,12 +629,46 @@ def list_s3_pdfs(bucket: str, prefix: str) -> List[str]:
                 keys.append(k)
     return keys
 
-def download_s3_object(bucket: str, key: str, local_dir: Path) -> Path:
-    local_dir.mkdir(parents=True, exist_ok=True)
-    local_file = local_dir / slugify_filename(os.path.basename(key))
-    s3 = boto3.client("s3", region_name=os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1")))
-    s3.download_file(bucket, key, str(local_file))
-    return local_file
+def fetch_s3_bytes(bucket: str, key: str) -> bytes:
+    """Read an S3 object body straight into memory (no temp file)."""
+    return _s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+
+async def list_and_fetch(bucket: str, prefix: str, emit, max_keys: int = 0) -> int:
+    """
+    Stream PDFs under an S3 prefix with aioboto3: GETs start as soon as each
+    LIST page arrives instead of after the whole listing. emit(key, data) is
+    called off the event loop and may block for backpressure; a GET slot is
+    held until its emit returns, so at most S3_ASYNC_CONCURRENCY bodies are
+    in memory here. Returns the number of keys scheduled.
+    """
+    sem = asyncio.Semaphore(S3_ASYNC_CONCURRENCY)
+    region = os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+    async with aioboto3.Session().client("s3", region_name=region) as s3:
+
+        async def get(key: str):
+            async with sem:
+                try:
+                    resp = await s3.get_object(Bucket=bucket, Key=key)
+                    data = await resp["Body"].read()
+                except ClientError as e:
+                    print(f"[error] failed to download s3://{bucket}/{key}: {e}")
+                    return
+                await asyncio.to_thread(emit, key, data)
+
+        gets = []
+        paginator = s3.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []) or []:
+                k = obj["Key"]
+                if not k.lower().endswith(".pdf"):
+                    continue
+                if max_keys and len(gets) >= max_keys:
+                    break
+                gets.append(asyncio.create_task(get(k)))
+            if max_keys and len(gets) >= max_keys:
+                break
+        await asyncio.gather(*gets)
+    return len(gets)
 
 # ------------------------ Output mapping for S3 inputs ------------------------
 
@@ -425,6 +711,185 @@ def build_out_key_from_input(input_bucket: str, input_key: str, out_base: str) -
     out_key = f"{out_key_base}/zone=text/state={state}/county={county}/{stem}"
     return f"s3://{out_bucket}/{out_key}"
 
+def build_dataset_root(out_base: str, s3_input: bool) -> str:
+    """
+    Dataset root for the run, kept apart from the per-PDF files so neither
+    layout shows up when reading the other. S3 inputs write to
+    s3://<bucket>/env=prod/zone=text_dataset (state=/county= partitions below
+    it); local inputs write to <out>/dataset.
+    """
+    if not s3_input:
+        return f"{out_base.rstrip('/')}/dataset" if out_base.startswith("s3://") else str(Path(out_base) / "dataset")
+    if not out_base.startswith("s3://"):
+        raise ValueError("--out must be s3://... when using S3 input to auto-map env/state/county")
+    out_bucket, out_key_base = split_s3_uri(out_base)
+    out_key_base = out_key_base.strip("/")
+    if not out_key_base:
+        raise ValueError("Provide an --out like s3://<bucket>/env=prod/")
+    return f"s3://{out_bucket}/{out_key_base}/zone=text_dataset"
+
+# ------------------------ Worker ------------------------
+
+def _ocr_threads_per_worker(workers: int) -> int:
+    if OCR_THREADS > 0:
+        return OCR_THREADS
+    return max(1, (os.cpu_count() or 1) // workers)
+
+def _init_worker(allow_ocr: bool, ocr_threads: int):
+    global ALLOW_OCR, OCR_THREADS
+    ALLOW_OCR = allow_ocr
+    OCR_THREADS = ocr_threads
+
+def extract_one(task: Tuple[Optional[Path], Optional[str], Optional[str], Optional[bytes]],
+                opts: Dict) -> Tuple[Optional[str], List[Dict]]:
+    """
+    Extract one PDF and resolve its parquet destination. Runs inside a worker
+    process, so it must stay a top-level function. Returns (out_path, records);
+    failures are logged and reported as (None, []) so one bad PDF doesn't sink
+    the pool.
+    """
+    local_pdf, src_bucket, src_key, pdf_bytes = task
+    src = f"s3://{src_bucket}/{src_key}" if local_pdf is None else str(local_pdf)
+    print(f"[info] extracting: {src}")
+    try:
+        # Extract records (S3 objects arrive in memory, never hit disk)
+        if local_pdf is None:
+            records = extract_pdf_to_records(None, opts["env"], opts["zone"], opts["state"], opts["county"],
+                                             pdf_bytes=pdf_bytes,
+                                             source_name=slugify_filename(src_key),
+                                             source_uri=src)
+        else:
+            records = extract_pdf_to_records(local_pdf, opts["env"], opts["zone"], opts["state"], opts["county"])
+
+        # Dataset mode: partition values for S3 inputs come from the input key
+        if opts["dataset_root"]:
+            if src_bucket and src_key:
+                state, county = parse_state_county_from_key(src_key)
+                if not state or not county:
+                    raise ValueError(f"Could not parse state/county from input key: {src_key}")
+                for rec in records:
+                    rec["state"], rec["county"] = state, county
+            return opts["dataset_root"], records
+
+        # Decide output path
+        if src_bucket and src_key:
+            # S3 input: build out path from input key + out base (env=prod)
+            out_path = build_out_key_from_input(src_bucket, src_key, opts["out"])
+        else:
+            # Local input: generic behavior
+            stem = Path(local_pdf).stem + "_text.parquet"
+            if opts["out"].startswith("s3://"):
+                out_bucket, out_key_base = split_s3_uri(opts["out"])
+                out_key_base = out_key_base.strip("/")
+                if out_key_base and not out_key_base.endswith("/"):
+                    out_key_base = out_key_base + "/"
+                out_path = f"s3://{out_bucket}/{out_key_base}{stem}"
+            else:
+                outdir = Path(opts["out"])
+                outdir.mkdir(parents=True, exist_ok=True)
+                out_path = str(outdir / stem)
+
+        return out_path, records
+
+    except Exception as e:
+        print(f"[error] failed on {src}: {e}", file=sys.stderr)
+        return None, []
+
+def run_pipeline(tasks: List[Tuple[Optional[Path], Optional[str], Optional[str]]],
+                 opts: Dict,
+                 workers: int,
+                 dataset: Optional[DatasetWriter] = None,
+                 s3_stream: Optional[Tuple[str, str, int]] = None) -> Tuple[int, int]:
+    """
+    download (threads) → extract (processes) → upload (threads), joined by
+    bounded queues so the three stages overlap and at most ~2*workers PDFs
+    are in flight at once. Each stage ends on a None sentinel.
+    With a DatasetWriter the upload stage buffers into it instead of writing
+    one parquet per PDF, which also keeps up to DATASET_FLUSH_ROWS extracted
+    pages in memory until each flush; the caller closes it. s3_stream=(bucket, prefix,
+    max_keys) replaces the download stage with list_and_fetch, so tasks may
+    be empty. Returns (pdfs_processed, pages).
+    """
+    depth = 2 * workers
+    in_q: "queue.Queue" = queue.Queue(maxsize=depth)
+    out_q: "queue.Queue" = queue.Queue(maxsize=depth)
+
+    def fetch(task):
+        local_pdf, bucket, key = task
+        data = None
+        if local_pdf is None:
+            try:
+                data = fetch_s3_bytes(bucket, key)
+            except ClientError as e:
+                print(f"[error] failed to download s3://{bucket}/{key}: {e}")
+                return
+        in_q.put((local_pdf, bucket, key, data))  # blocks while extractors are behind
+
+    def download():
+        try:
+            if s3_stream is not None:
+                bucket, prefix, max_keys = s3_stream
+                emit = lambda key, data: in_q.put((None, bucket, key, data))
+                n = asyncio.run(list_and_fetch(bucket, prefix, emit, max_keys))
+                print(f"[info] streamed {n} PDFs from s3://{bucket}/{prefix}")
+            else:
+                with ThreadPoolExecutor(max_workers=S3_FETCH_WORKERS) as ex:
+                    list(ex.map(fetch, tasks))
+        finally:
+            in_q.put(None)
+
+    def upload() -> int:
+        pages = 0
+        while True:
+            item = out_q.get()
+            if item is None:
+                return pages
+            out_path, records = item
+            try:
+                if dataset is not None:
+                    dataset.add(records)
+                else:
+                    write_parquet(records, out_path)
+                pages += len(records)
+            except Exception as e:
+                print(f"[error] failed writing {out_path}: {e}", file=sys.stderr)
+
+    downloader = threading.Thread(target=download, name="s3-download", daemon=True)
+    downloader.start()
+
+    total_pdfs = 0
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as uploaders:
+        upload_futs = [uploaders.submit(upload) for _ in range(UPLOAD_WORKERS)]
+
+        def drain(done):
+            for fut in done:
+                out_path, records = fut.result()
+                if out_path is not None:
+                    out_q.put((out_path, records))
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_worker,
+                                     initargs=(ALLOW_OCR, _ocr_threads_per_worker(workers))) as pool:
+                pending = set()
+                while True:
+                    item = in_q.get()
+                    if item is None:
+                        break
+                    total_pdfs += 1
+                    pending.add(pool.submit(extract_one, item, opts))
+                    if len(pending) >= depth:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        drain(done)
+                drain(pending)
+        finally:
+            for _ in upload_futs:
+                out_q.put(None)
+        total_pages = sum(f.result() for f in upload_futs)
+
+    downloader.join()
+    return total_pdfs, total_pages
+
 # ------------------------ CLI ------------------------
 
 def main():
@@ -437,103 +902,81 @@ def main():
     ap.add_argument("--county", default=None)
     ap.add_argument("--no-ocr", action="store_true", help="Disable OCR fallback entirely")
     ap.add_argument("--s3-max", type=int, default=0, help="Limit PDFs processed from S3 prefix (0 = no limit)")
+    ap.add_argument("--per-pdf", action="store_true", help="Write one parquet per PDF instead of one partitioned dataset per run")
+    ap.add_argument("--workers", type=int, default=MAX_WORKERS, help="Extraction processes (default: min(cpu_count, 6))")
     args = ap.parse_args()
 
     global ALLOW_OCR
     if args.no_ocr:
         ALLOW_OCR = False
 
-    total_pdfs = 0
-    total_pages = 0
     t0 = time.time()
 
-    tmp_root = Path(tempfile.mkdtemp(prefix="pdf-extract-"))
-    tmp_in = tmp_root / "in"
-    tmp_in.mkdir(parents=True, exist_ok=True)
-
-    try:
-        tasks: List[Tuple[Path, Optional[str], Optional[str]]] = []
-        # Each task: (local_pdf_path, s3_bucket_if_any, s3_key_if_any)
-
-        if is_s3_uri(args.input):
-            in_bucket, in_key = split_s3_uri(args.input)
-            if in_key and in_key.lower().endswith(".pdf"):
-                print(f"[info] downloading single PDF from s3://{in_bucket}/{in_key}")
-                local = download_s3_object(in_bucket, in_key, tmp_in)
-                tasks.append((local, in_bucket, in_key))
-            else:
-                prefix = in_key if in_key.endswith("/") else (in_key + "/") if in_key else ""
-                print(f"[info] listing PDFs under s3://{in_bucket}/{prefix} ...")
-                keys = list_s3_pdfs(in_bucket, prefix)
-                if args.s3_max and args.s3_max > 0:
-                    keys = keys[:args.s3_max]
-                print(f"[info] found {len(keys)} PDFs under prefix")
-                for k in keys:
-                    try:
-                        local = download_s3_object(in_bucket, k, tmp_in)
-                        tasks.append((local, in_bucket, k))
-                    except ClientError as e:
-                        print(f"[error] failed to download s3://{in_bucket}/{k}: {e}")
+    # If --out is a single parquet file but multiple inputs -> error (checked below)
+    out_is_single_parquet = (
+        args.out.lower().endswith(".parquet") and not args.out.startswith("s3://")
+    ) or (
+        args.out.startswith("s3://") and args.out.lower().endswith(".parquet")
+    )
+
+    tasks: List[Tuple[Optional[Path], Optional[str], Optional[str]]] = []
+    # Each task: (local_pdf_path, s3_bucket_if_any, s3_key_if_any); S3 tasks have no local path
+    s3_stream: Optional[Tuple[str, str, int]] = None
+
+    if is_s3_uri(args.input):
+        in_bucket, in_key = split_s3_uri(args.input)
+        keys = []
+        if in_key and in_key.lower().endswith(".pdf"):
+            keys = [in_key]
+        elif aioboto3 is not None and not out_is_single_parquet:
+            # List and fetch concurrently; the key count is only known at the end
+            prefix = in_key if in_key.endswith("/") else (in_key + "/") if in_key else ""
+            print(f"[info] streaming PDFs under s3://{in_bucket}/{prefix} ...")
+            s3_stream = (in_bucket, prefix, max(args.s3_max, 0))
         else:
-            in_path = Path(args.input)
-            for p in discover_local_pdfs(in_path):
-                tasks.append((p, None, None))
-
-        if not tasks:
-            print(f"[error] No PDFs found for input: {args.input}", file=sys.stderr)
-            sys.exit(2)
-
-        # If --out is a single parquet file but multiple inputs -> error
-        out_is_single_parquet = (
-            args.out.lower().endswith(".parquet") and not args.out.startswith("s3://")
-        ) or (
-            args.out.startswith("s3://") and args.out.lower().endswith(".parquet")
-        )
-        if out_is_single_parquet and len(tasks) > 1:
-            print("[error] --out is a single file but multiple PDFs found. "
-                  "Use an s3 prefix like s3://bucket/env=prod/ or a local directory.", file=sys.stderr)
-            sys.exit(3)
-
-        for local_pdf, src_bucket, src_key in tasks:
-            total_pdfs += 1
-            print(f"[info] extracting: {local_pdf}")
-            try:
-                # Extract records
-                records = extract_pdf_to_records(local_pdf, args.env, args.zone, args.state, args.county)
-
-                # Decide output path
-                if src_bucket and src_key:
-                    # S3 input: build out path from input key + out base (env=prod)
-                    out_path = build_out_key_from_input(src_bucket, src_key, args.out)
-                else:
-                    # Local input: generic behavior
-                    stem = Path(local_pdf).stem + "_text.parquet"
-                    if args.out.startswith("s3://"):
-                        out_bucket, out_key_base = split_s3_uri(args.out)
-                        out_key_base = out_key_base.strip("/")
-                        if out_key_base and not out_key_base.endswith("/"):
-                            out_key_base = out_key_base + "/"
-                        out_path = f"s3://{out_bucket}/{out_key_base}{stem}"
-                    else:
-                        outdir = Path(args.out)
-                        outdir.mkdir(parents=True, exist_ok=True)
-                        out_path = str(outdir / stem)
-
-                # Write parquet
-                write_parquet(records, out_path)
-                total_pages += len(records)
-
-            except Exception as e:
-                print(f"[error] failed on {local_pdf}: {e}", file=sys.stderr)
-
-        dt = time.time() - t0
-        print(f"[done] processed {total_pdfs} PDFs, {total_pages} pages in {dt:.1f}s")
-
-    finally:
-        try:
-            shutil.rmtree(tmp_root)
-        except Exception:
-            pass
+            prefix = in_key if in_key.endswith("/") else (in_key + "/") if in_key else ""
+            print(f"[info] listing PDFs under s3://{in_bucket}/{prefix} ...")
+            keys = list_s3_pdfs(in_bucket, prefix)
+            if args.s3_max and args.s3_max > 0:
+                keys = keys[:args.s3_max]
+            print(f"[info] found {len(keys)} PDFs under prefix")
+        for k in keys:
+            tasks.append((None, in_bucket, k))
+    else:
+        in_path = Path(args.input)
+        for p in discover_local_pdfs(in_path):
+            tasks.append((p, None, None))
+
+    if not tasks and s3_stream is None:
+        print(f"[error] No PDFs found for input: {args.input}", file=sys.stderr)
+        sys.exit(2)
+
+    if out_is_single_parquet and len(tasks) > 1:
+        print("[error] --out is a single file but multiple PDFs found. "
+              "Use an s3 prefix like s3://bucket/env=prod/ or a local directory.", file=sys.stderr)
+        sys.exit(3)
+
+    per_pdf = args.per_pdf or out_is_single_parquet
+    dataset_root = None if per_pdf else build_dataset_root(args.out, is_s3_uri(args.input))
+    opts = {
+        "out": args.out,
+        "dataset_root": dataset_root,
+        "env": args.env,
+        "zone": args.zone,
+        "state": args.state,
+        "county": args.county,
+    }
+    workers = max(1, args.workers if s3_stream else min(args.workers, len(tasks)))
+    dataset = DatasetWriter(dataset_root) if dataset_root else None
+    total_pdfs, total_pages = run_pipeline(tasks, opts, workers, dataset, s3_stream)
+    if dataset is not None:
+        dataset.close()
+    if s3_stream is not None and total_pdfs == 0:
+        print(f"[error] No PDFs found for input: {args.input}", file=sys.stderr)
+        sys.exit(2)
+
+    dt = time.time() - t0
+    print(f"[done] processed {total_pdfs} PDFs, {total_pages} pages in {dt:.1f}s")
 
 if __name__ == "__main__":
     main()
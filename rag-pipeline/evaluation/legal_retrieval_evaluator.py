@@ -12,14 +12,35 @@ Metrics computed:
 - Metadata Accuracy: Correctness of Penalty/Fine, Prohibition, Obligation, Permission flags
 """
 
+import asyncio
+import csv
+import hashlib
 import json
 import re
+import sqlite3
+import threading
 import time
 from typing import Optional
 import pandas as pd
 import requests
-from dataclasses import dataclass, asdict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dataclasses import dataclass, fields
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import numpy as np
 from tqdm import tqdm
+from tqdm.asyncio import tqdm as tqdm_asyncio
+
+try:
+    import httpx
+except ImportError:  # optional: without it queries are evaluated one at a time
+    httpx = None
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON parsing, stdlib json otherwise
+    orjson = None
 
 
 # Configuration
@@ -28,6 +49,76 @@ NIMS_API_KEY = ""
 NIMS_ENDPOINT = "https://integrate.api.nvidia.com/v1/chat/completions"
 MODEL_NAME = "nvidia/llama-3.1-nemotron-nano-8b-v1"  # Nemotron Nano model via NIMs
 
+# Concurrency (async driver)
+MAX_CONCURRENCY = 16  # queries in flight at once; keeps NIMs under its rate limit
+
+# Batch judging (--batch): OpenAI-compatible files/batches API
+NIMS_BATCH_URL = "https://integrate.api.nvidia.com/v1"
+BATCH_POLL_INTERVAL = 30  # seconds between batch status checks
+
+# Judge response cache, keyed by (MODEL_NAME, prompt); None disables it
+JUDGE_CACHE_PATH = ".judge_cache.sqlite"
+
+# Skip the LLM judge when a cheap programmatic check is decisive (--fast-judge)
+FAST_JUDGE = False
+
+
+# Transient failures (rate limits, gateway errors) are retried with exponential backoff
+RETRY_TOTAL = 5
+RETRY_BACKOFF_FACTOR = 1.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def _build_session() -> requests.Session:
+    """Shared keep-alive session so repeated calls reuse TCP/TLS connections."""
+    # urllib3 skips POST by default; every call here is a POST
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session = _build_session()
+
+
+def _json_dumps(obj) -> bytes:
+    """Serialize to UTF-8 JSON bytes (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _json_loads(data):
+    """Parse JSON from bytes or str (orjson when available)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+# Line breaks, tabs and other C0/C1 control characters
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+
+_MULTISPACE_RE = re.compile(r'  +')
+
+# Smart quotes, dashes and ellipses normalized to ASCII
+_CSV_REPLACEMENTS = (
+    ('\u2018', "'"), ('\u2019', "'"),
+    ('\u201c', '"'), ('\u201d', '"'),
+    ('\u2013', '-'), ('\u2014', '-'),
+    ('\u2026', '...'),
+)
+
 
 def sanitize_for_csv(text: str) -> str:
     """
@@ -40,28 +131,25 @@ def sanitize_for_csv(text: str) -> str:
     if not text:
         return ""
     
-    # Replace newlines and carriage returns with spaces
-    text = text.replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
-    
-    # Normalize smart/curly quotes to standard quotes
-    text = text.replace(''', "'").replace(''', "'")
-    text = text.replace('"', '"').replace('"', '"')
+    # Replace newlines, carriage returns and other control characters with spaces
+    text = _CONTROL_CHARS_RE.sub(' ', text)
     
-    # Replace other problematic Unicode characters
-    text = text.replace('–', '-').replace('—', '-')
-    text = text.replace('…', '...')
+    # ASCII text is fully printable at this point; only non-ASCII text can
+    # carry smart quotes or other non-printable characters
+    if not text.isascii():
+        for old, new in _CSV_REPLACEMENTS:
+            text = text.replace(old, new)
+        if not text.isprintable():
+            text = ''.join(char if char.isprintable() else ' ' for char in text)
     
-    # Remove any remaining control characters (except spaces)
-    text = ''.join(char if char.isprintable() or char == ' ' else ' ' for char in text)
-    
-    # Collapse multiple spaces into one
-    while '  ' in text:
-        text = text.replace('  ', ' ')
+    # Collapse multiple spaces into one (single linear pass)
+    if '  ' in text:
+        text = _MULTISPACE_RE.sub(' ', text)
     
     return text.strip()
 
 
-@dataclass
+@dataclass(slots=True)
 class EvaluationResult:
     """Result of evaluating a single query."""
     query_id: int
@@ -87,12 +175,9 @@ class EvaluationResult:
     golden_section: str = ""
     retrieved_section: str = ""  # Section of the matched chunk
     
-    # All top 5 retrieved sections (for analysis)
-    retrieved_section_1: str = ""
-    retrieved_section_2: str = ""
-    retrieved_section_3: str = ""
-    retrieved_section_4: str = ""
-    retrieved_section_5: str = ""
+    # All top 5 retrieved sections (for analysis); written as
+    # retrieved_section_1..retrieved_section_5 columns
+    retrieved_sections: tuple[str, ...] = ("", "", "", "", "")
     
     # Chunk comparison (golden | retrieved side by side)
     golden_chunk: str = ""
@@ -123,26 +208,123 @@ class EvaluationResult:
     llm_reasoning: str = ""  # LLM's explanation
 
 
+# Negative test columns are kept internal only (not written to the output)
+OUTPUT_EXCLUDED_COLUMNS = ('system_response', 'is_negative_test', 'system_says_no_law', 'negative_test_correct')
+_RESULT_FIELD_NAMES = [f.name for f in fields(EvaluationResult) if f.name != "retrieved_sections"]
+RETRIEVED_SECTION_COLUMNS = [f"retrieved_section_{i}" for i in range(1, 6)]
+OUTPUT_COLUMNS = [
+    column
+    for f in fields(EvaluationResult) if f.name not in OUTPUT_EXCLUDED_COLUMNS
+    for column in (RETRIEVED_SECTION_COLUMNS if f.name == "retrieved_sections" else [f.name])
+]
 
 
-def query_retrieval_engine(question: str, state: str, county: str, mode: str = "hybrid") -> dict:
+def result_to_row(result: EvaluationResult) -> dict:
+    """Flatten a result into an output row (one column per retrieved section)."""
+    # All fields are primitives, so a shallow getattr copy stands in for asdict's deepcopy
+    row = {name: getattr(result, name) for name in _RESULT_FIELD_NAMES}
+    row.update(zip(RETRIEVED_SECTION_COLUMNS, result.retrieved_sections))
+    return row
+
+
+@dataclass(slots=True)
+class MetricRecord:
+    """The fields of an EvaluationResult that aggregate metrics need."""
+    difficulty: str
+    failed: bool
+    is_negative_test: bool
+    negative_test_correct: Optional[bool]
+    found_in_top5: bool
+    rank: int
+    chunk_coverage: float
+    metadata_accuracy: Optional[float]
+    penalty_fine_correct: Optional[bool]
+    prohibition_correct: Optional[bool]
+    obligation_correct: Optional[bool]
+    permission_correct: Optional[bool]
+    
+    @classmethod
+    def from_result(cls, r: EvaluationResult) -> "MetricRecord":
+        return cls(
+            difficulty=r.difficulty,
+            # Failed results are those where LLM reasoning indicates an error
+            failed=r.llm_reasoning.startswith(("Retrieval error:", "LLM error:", "Parse error:")),
+            is_negative_test=r.is_negative_test,
+            negative_test_correct=r.negative_test_correct,
+            found_in_top5=r.found_in_top5,
+            rank=r.rank,
+            chunk_coverage=r.chunk_coverage,
+            metadata_accuracy=r.metadata_accuracy,
+            penalty_fine_correct=r.penalty_fine_correct,
+            prohibition_correct=r.prohibition_correct,
+            obligation_correct=r.obligation_correct,
+            permission_correct=r.permission_correct
+        )
+
+
+class ResultWriter:
     """
-    Query the legal retrieval engine.
-    
-    Args:
-        question: The query text
-        state: State code (e.g., "CA", "GA")
-        county: County name (e.g., "Alameda")
-        mode: Retrieval mode - "hybrid" or "baseline"
+    Write per-query results as they complete.
     
-    Returns the API response containing top-5 retrieved chunks.
+    CSV rows are streamed to disk in input order (results that finish early
+    wait in a small reorder buffer), so memory stays flat no matter how large
+    the evaluation set is. Only a MetricRecord is kept per query. Excel output
+    cannot be streamed and is written on close().
     """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.metric_records = []
+        self._next = 0
+        self._waiting = {}
+        self._excel_rows = [] if path.endswith('.xlsx') else None
+        self._fp = None
+        if self._excel_rows is None:
+            self._fp = open(path, 'w', newline='', encoding='utf-8')
+            # Use proper CSV quoting to handle special characters
+            self._writer = csv.DictWriter(
+                self._fp,
+                fieldnames=OUTPUT_COLUMNS,
+                extrasaction='ignore',
+                quoting=csv.QUOTE_ALL,
+                escapechar='\\',
+                lineterminator='\n'
+            )
+            self._writer.writeheader()
+    
+    def add(self, position: int, result: EvaluationResult) -> None:
+        """Accept the result for the query at `position` in the input."""
+        self._waiting[position] = result
+        while self._next in self._waiting:
+            self._write(self._waiting.pop(self._next))
+            self._next += 1
+    
+    def _write(self, result: EvaluationResult) -> None:
+        self.metric_records.append(MetricRecord.from_result(result))
+        row = result_to_row(result)
+        if self._excel_rows is not None:
+            self._excel_rows.append(row)
+        else:
+            self._writer.writerow(row)
+            self._fp.flush()
+    
+    def close(self) -> None:
+        if self._excel_rows is not None:
+            pd.DataFrame(self._excel_rows, columns=OUTPUT_COLUMNS).to_excel(self.path, index=False)
+        else:
+            self._fp.close()
+
+
+
+
+def build_retrieval_payload(question: str, state: str, county: str, mode: str = "hybrid") -> dict:
+    """Build the retrieval API request body for a single query."""
     # Format county name for API (convert to lowercase with hyphens)
     formatted_county = county.lower().replace(" ", "-")
     if not formatted_county.endswith("-county"):
         formatted_county = f"{formatted_county}-county"
-    
-    payload = {
+
+    return {
         "query": question,
         "filters": {
             "locations": [
@@ -154,15 +336,87 @@ def query_retrieval_engine(question: str, state: str, county: str, mode: str = "
         },
         "mode": mode
     }
-    
+
+
+def query_retrieval_engine(question: str, state: str, county: str, mode: str = "hybrid") -> dict:
+    """
+    Query the legal retrieval engine.
+
+    Args:
+        question: The query text
+        state: State code (e.g., "CA", "GA")
+        county: County name (e.g., "Alameda")
+        mode: Retrieval mode - "hybrid" or "baseline"
+
+    Returns the API response containing top-5 retrieved chunks.
+    """
+    payload = build_retrieval_payload(question, state, county, mode)
+
+    try:
+        response = _session.post(RETRIEVAL_ENDPOINT, data=_json_dumps(payload), headers=_JSON_HEADERS, timeout=60)
+        response.raise_for_status()
+        return _json_loads(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return {"error": str(e)}
+
+
+async def _post_with_retry_async(client: "httpx.AsyncClient", url: str, **kwargs) -> "httpx.Response":
+    """POST through httpx with the same retry/backoff policy as the requests session."""
+    for attempt in range(RETRY_TOTAL + 1):
+        try:
+            response = await client.post(url, **kwargs)
+        except httpx.TransportError:
+            if attempt == RETRY_TOTAL:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == RETRY_TOTAL:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                await asyncio.sleep(int(retry_after))
+                continue
+        await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+
+
+async def query_retrieval_engine_async(
+    client: "httpx.AsyncClient",
+    question: str,
+    state: str,
+    county: str,
+    mode: str = "hybrid"
+) -> dict:
+    """Async variant of query_retrieval_engine sharing the caller's connection pool."""
+    payload = build_retrieval_payload(question, state, county, mode)
+
     try:
-        response = requests.post(RETRIEVAL_ENDPOINT, json=payload, timeout=60)
+        response = await _post_with_retry_async(client, RETRIEVAL_ENDPOINT, content=_json_dumps(payload), headers=_JSON_HEADERS, timeout=60)
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return _json_loads(response.content)
+    except (httpx.HTTPError, ValueError) as e:
         return {"error": str(e)}
 
 
+def get_chunk_text(chunk: dict) -> str:
+    """Text of a retrieved chunk, whichever field the API put it in (API uses 'chunk_text')."""
+    return (chunk.get("chunk_text") or
+            chunk.get("text") or
+            chunk.get("content") or
+            chunk.get("chunk") or
+            chunk.get("page_content") or
+            chunk.get("document") or "")
+
+
+def get_chunk_section(chunk: dict) -> str:
+    """Section reference of a retrieved chunk, or "" if it has none."""
+    section = chunk.get("section")
+    if section:
+        return section
+    metadata = chunk.get("metadata") or {}
+    return (chunk.get("title") or
+            metadata.get("section") or
+            metadata.get("title") or "")
+
+
 def create_evaluation_prompt(
     question: str,
     golden_answer: str,
@@ -182,19 +436,17 @@ def create_evaluation_prompt(
     For negative tests (where no law should exist), the LLM evaluates if
     the system's response correctly indicates no relevant law was found.
     """
-    chunks_text = ""
+    parts = []
     for i, chunk in enumerate(retrieved_chunks[:5], 1):
-        # API uses 'chunk_text' field for the text content
-        chunk_text = (chunk.get("chunk_text") or 
-                      chunk.get("text") or 
-                      chunk.get("content") or "")
-        chunk_section = chunk.get("section", chunk.get("metadata", {}).get("section", "Unknown"))
+        chunk_text = get_chunk_text(chunk)
+        chunk_section = get_chunk_section(chunk) or "Unknown"
         
-        chunks_text += f"""
+        parts.append(f"""
 --- Chunk {i} ---
 Section: {chunk_section}
 Text: {chunk_text[:2000]}
-"""
+""")
+    chunks_text = "".join(parts)
     
     if is_negative_test:
         # Special prompt for negative test cases - evaluate the SYSTEM'S RESPONSE
@@ -307,16 +559,9 @@ Respond ONLY with the JSON object, no additional text."""
     return prompt
 
 
-def call_llm_judge(prompt: str) -> dict:
-    """
-    Call the NVIDIA NIMs API with the evaluation prompt.
-    """
-    headers = {
-        "Authorization": f"Bearer {NIMS_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
+def build_judge_payload(prompt: str) -> dict:
+    """Build the NIMs chat-completions request body for an evaluation prompt."""
+    return {
         "model": MODEL_NAME,
         "messages": [
             {
@@ -331,34 +576,144 @@ def call_llm_judge(prompt: str) -> dict:
         "temperature": 0.1,
         "max_tokens": 1024
     }
+
+
+def _judge_headers() -> dict:
+    return {
+        "Authorization": f"Bearer {NIMS_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def _judge_result(result: dict) -> dict:
+    """Extract the completion content from a chat-completions response."""
+    content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+    return {"content": content, "raw": result}
+
+
+_judge_cache_lock = threading.Lock()
+_judge_cache_conn = None
+
+
+def _judge_cache() -> Optional[sqlite3.Connection]:
+    global _judge_cache_conn
+    if JUDGE_CACHE_PATH is None:
+        return None
+    if _judge_cache_conn is None:
+        _judge_cache_conn = sqlite3.connect(JUDGE_CACHE_PATH, check_same_thread=False, isolation_level=None)
+        _judge_cache_conn.execute("CREATE TABLE IF NOT EXISTS judge (key TEXT PRIMARY KEY, response TEXT)")
+    return _judge_cache_conn
+
+
+def _judge_cache_key(prompt: str) -> str:
+    # MODEL_NAME is part of the key so switching judges never reuses stale verdicts
+    return hashlib.sha256((MODEL_NAME + "\x00" + prompt).encode()).hexdigest()
+
+
+def judge_cache_get(prompt: str) -> Optional[dict]:
+    """Return the cached judge response for a prompt, or None."""
+    with _judge_cache_lock:
+        conn = _judge_cache()
+        if conn is None:
+            return None
+        row = conn.execute("SELECT response FROM judge WHERE key = ?", (_judge_cache_key(prompt),)).fetchone()
+    return _json_loads(row[0]) if row else None
+
+
+def judge_cache_put(prompt: str, llm_response: dict) -> None:
+    """Cache a judge response, skipping errors and unparseable content so they are retried."""
+    if "error" in llm_response or "error" in parse_llm_response(llm_response.get("content", "")):
+        return
+    with _judge_cache_lock:
+        conn = _judge_cache()
+        if conn is None:
+            return
+        conn.execute(
+            "INSERT OR REPLACE INTO judge (key, response) VALUES (?, ?)",
+            (_judge_cache_key(prompt), _json_dumps(llm_response).decode())
+        )
+
+
+def call_llm_judge(prompt: str) -> dict:
+    """
+    Call the NVIDIA NIMs API with the evaluation prompt.
     
+    Responses are served from the judge cache when the same prompt has
+    already been judged by the same model.
+    """
+    cached = judge_cache_get(prompt)
+    if cached is not None:
+        return cached
+    
+    payload = build_judge_payload(prompt)
+
     try:
-        response = requests.post(NIMS_ENDPOINT, headers=headers, json=payload, timeout=120)
+        response = _session.post(NIMS_ENDPOINT, headers=_judge_headers(), data=_json_dumps(payload), timeout=120)
         response.raise_for_status()
-        result = response.json()
-        
-        # Extract the content from the response
-        content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-        return {"content": content, "raw": result}
-        
-    except requests.exceptions.RequestException as e:
+        llm_response = _judge_result(_json_loads(response.content))
+        judge_cache_put(prompt, llm_response)
+        return llm_response
+
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return {"error": str(e)}
+
+
+async def call_llm_judge_async(client: "httpx.AsyncClient", prompt: str) -> dict:
+    """Async variant of call_llm_judge sharing the caller's connection pool."""
+    cached = judge_cache_get(prompt)
+    if cached is not None:
+        return cached
+    
+    payload = build_judge_payload(prompt)
+
+    try:
+        response = await _post_with_retry_async(client, NIMS_ENDPOINT, headers=_judge_headers(), content=_json_dumps(payload), timeout=120)
+        response.raise_for_status()
+        llm_response = _judge_result(_json_loads(response.content))
+        judge_cache_put(prompt, llm_response)
+        return llm_response
+    except (httpx.HTTPError, ValueError) as e:
         return {"error": str(e)}
 
 
+# Numeric section code, e.g. "5.08.010", "Sec. 78-38"
+_SECTION_RE = re.compile(r'\d+[.\-]\d+[.\-]?\d*')
+
+
 def normalize_section(section: str) -> str:
     """Normalize section reference for comparison."""
     if not section:
         return ""
     # Remove common variations: "5.08.010 - Running" vs "5.08.010. Running"
     # Extract just the numeric section code
-    import re
-    # Match patterns like "5.08.010", "Sec. 78-38", etc.
-    match = re.search(r'[\d]+[.\-][\d]+[.\-]?[\d]*', str(section))
+    match = _SECTION_RE.search(str(section))
     if match:
         return match.group(0).replace('-', '.').replace('..', '.')
     return str(section).lower().strip()
 
 
+# Keyword patterns for the metadata flags, used when the LLM judge is skipped
+_FLAG_PATTERNS = {
+    "penalty_fine": re.compile(r'\b(fines?|penalt(?:y|ies)|punish\w*|imprison\w*|forfeit\w*|misdemeanor|infraction)\b', re.I),
+    "prohibition": re.compile(r'\b(shall not|may not|must not|prohibit\w*|unlawful|no person shall)\b', re.I),
+    "obligation": re.compile(r'\b(must(?! not)|shall(?! not)|required|duty to)\b', re.I),
+    "permission": re.compile(r'\b(may(?! not)|authori[sz]ed|permitted|allowed|entitled to)\b', re.I),
+}
+
+
+# Phrases with which the system declines to answer, used for negative tests
+_NO_LAW_RE = re.compile(
+    r'\b(no (relevant )?(laws?|regulations?|ordinances?)|does not (explicitly )?(mention|address|cover)'
+    r'|not (found|covered)|no specific)\b',
+    re.I
+)
+
+
+def infer_flags_by_regex(text: str) -> dict:
+    """Infer the four metadata flags from legal text by keyword matching."""
+    return {flag: bool(pattern.search(text)) for flag, pattern in _FLAG_PATTERNS.items()}
+
+
 def find_matching_chunk(golden_section: str, chunks: list) -> tuple:
     """
     Find a chunk that matches the golden section programmatically.
@@ -367,8 +722,7 @@ def find_matching_chunk(golden_section: str, chunks: list) -> tuple:
     golden_norm = normalize_section(golden_section)
     
     for i, chunk in enumerate(chunks[:5], 1):
-        chunk_section = chunk.get("section", chunk.get("title", ""))
-        chunk_norm = normalize_section(chunk_section)
+        chunk_norm = normalize_section(get_chunk_section(chunk))
         
         if golden_norm and chunk_norm and golden_norm == chunk_norm:
             return (True, i, chunk)
@@ -376,6 +730,11 @@ def find_matching_chunk(golden_section: str, chunks: list) -> tuple:
     return (False, 0, None)
 
 
+# JSON in a markdown code fence, or failing that the outermost {...} span
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+_JSON_OBJECT_RE = re.compile(r'\{[\s\S]*\}')
+
+
 def parse_llm_response(response_content: str) -> dict:
     """
     Parse the LLM's JSON response.
@@ -383,35 +742,29 @@ def parse_llm_response(response_content: str) -> dict:
     try:
         # Try to extract JSON from the response
         # Sometimes the LLM wraps it in markdown code blocks
-        json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response_content)
+        json_match = _JSON_FENCE_RE.search(response_content)
         if json_match:
             json_str = json_match.group(1)
         else:
             # Try to find raw JSON
-            json_match = re.search(r'\{[\s\S]*\}', response_content)
+            json_match = _JSON_OBJECT_RE.search(response_content)
             if json_match:
                 json_str = json_match.group(0)
             else:
                 return {"error": "No JSON found in response"}
         
+        if orjson is not None:
+            try:
+                return orjson.loads(json_str)
+            except orjson.JSONDecodeError:
+                pass  # let the stdlib parser accept or report it
         return json.loads(json_str)
     except json.JSONDecodeError as e:
         return {"error": f"JSON parse error: {e}"}
 
 
-def evaluate_single_query(
-    query_id: int,
-    row: pd.Series,
-    mode: str = "hybrid"
-) -> EvaluationResult:
-    """
-    Evaluate a single query from the dataset.
-    
-    Args:
-        query_id: Index of the query
-        row: DataFrame row with query data
-        mode: Retrieval mode - "hybrid" or "baseline"
-    """
+def init_evaluation_result(query_id: int, row: dict) -> EvaluationResult:
+    """Create the result record for a query from its golden-truth row."""
     golden_answer = row['Answer']
     golden_section = row['Section']
     
@@ -431,18 +784,20 @@ def evaluate_single_query(
         golden_section=golden_section if not is_negative_test else "NO_LAW_EXISTS",
         golden_chunk=sanitize_for_csv(golden_answer) if not is_negative_test else "NO_LAW_EXISTS"
     )
+    result.is_negative_test = is_negative_test
+    return result
+
+
+def record_retrieval(result: EvaluationResult, row: dict, retrieval_response: dict) -> Optional[tuple]:
+    """
+    Record the retrieval engine's response on the result.
     
-    # Step 1: Query the retrieval engine
-    retrieval_response = query_retrieval_engine(
-        row['Question'],
-        row['State'],
-        row['County'],
-        mode=mode
-    )
-    
+    Returns (prompt, chunks) when the LLM judge still needs to be consulted,
+    or None when the result is already final.
+    """
     if "error" in retrieval_response:
         result.llm_reasoning = f"Retrieval error: {retrieval_response['error']}"
-        return result
+        return None
     
     # Extract chunks from response
     # The response structure may vary - try common patterns
@@ -453,22 +808,14 @@ def evaluate_single_query(
     # Capture the system's LLM-generated response
     system_response = retrieval_response.get("response", "")
     result.system_response = sanitize_for_csv(system_response)
-    result.is_negative_test = is_negative_test
+    is_negative_test = result.is_negative_test
     
     # Store all top 5 retrieved sections
+    sections = ["", "", "", "", ""]
     for i, chunk in enumerate(chunks[:5]):
-        section = chunk.get("section", chunk.get("title", ""))
-        section_str = sanitize_for_csv(str(section)) if section else ""
-        if i == 0:
-            result.retrieved_section_1 = section_str
-        elif i == 1:
-            result.retrieved_section_2 = section_str
-        elif i == 2:
-            result.retrieved_section_3 = section_str
-        elif i == 3:
-            result.retrieved_section_4 = section_str
-        elif i == 4:
-            result.retrieved_section_5 = section_str
+        section = get_chunk_section(chunk)
+        sections[i] = sanitize_for_csv(str(section)) if section else ""
+    result.retrieved_sections = tuple(sections)
     
     if not chunks:
         # For negative tests, no chunks is actually correct
@@ -479,19 +826,45 @@ def evaluate_single_query(
             result.llm_reasoning = "Correctly identified: No relevant law exists (no chunks returned)"
         else:
             result.llm_reasoning = "No chunks returned from retrieval"
-        return result
-    
-    # Step 2: Create evaluation prompt and call LLM judge
+        return None
+    
+    # A system response that declines to answer settles a negative test
+    if FAST_JUDGE and is_negative_test and _NO_LAW_RE.search(system_response):
+        result.found_in_top5 = False
+        result.system_says_no_law = True
+        result.negative_test_correct = True
+        result.llm_reasoning = "Correctly identified: No relevant law exists (system response declines)"
+        return None
+    
+    # A programmatic section match whose text is the golden text needs no judge
+    if FAST_JUDGE and not is_negative_test:
+        found, rank, matched_chunk = find_matching_chunk(row['Section'], chunks)
+        if found:
+            if str(get_chunk_text(matched_chunk)).strip().lower() == row['Answer'].strip().lower():
+                record_programmatic_match(result, rank, matched_chunk, row['Answer'])
+                return None
+    
+    # Step 2: Create evaluation prompt for the LLM judge
     prompt = create_evaluation_prompt(
         row['Question'],
-        golden_answer,
-        golden_section,
+        row['Answer'],
+        row['Section'],
         chunks,
         is_negative_test=is_negative_test,
         system_response=system_response
     )
-    
-    llm_response = call_llm_judge(prompt)
+    return prompt, chunks
+
+
+def record_judgement(
+    result: EvaluationResult,
+    row: dict,
+    chunks: list,
+    llm_response: dict
+) -> EvaluationResult:
+    """Score a query from the LLM judge's response and the retrieved chunks."""
+    golden_answer = row['Answer']
+    golden_section = row['Section']
     
     if "error" in llm_response:
         result.llm_reasoning = f"LLM error: {llm_response['error']}"
@@ -510,7 +883,7 @@ def evaluate_single_query(
     result.llm_reasoning = sanitize_for_csv(parsed.get("reasoning", ""))
     
     # Handle negative tests differently
-    if is_negative_test:
+    if result.is_negative_test:
         result.system_says_no_law = parsed.get("system_says_no_law", False)
         result.negative_test_correct = parsed.get("negative_test_correct", False)
         # For negative tests, we don't need to extract chunk/metadata info
@@ -535,23 +908,7 @@ def evaluate_single_query(
     
     # Extract the matched chunk text and section if found
     if result.found_in_top5 and matched_chunk:
-        # Try different field names for chunk text (API uses 'chunk_text')
-        chunk_text = (matched_chunk.get("chunk_text") or
-                      matched_chunk.get("text") or 
-                      matched_chunk.get("content") or 
-                      matched_chunk.get("chunk") or
-                      matched_chunk.get("page_content") or
-                      matched_chunk.get("document") or "")
-        
-        # Try different field names for section
-        chunk_section = (matched_chunk.get("section") or
-                        matched_chunk.get("title") or
-                        matched_chunk.get("metadata", {}).get("section") or
-                        matched_chunk.get("metadata", {}).get("title") or
-                        "Unknown")
-        
-        result.retrieved_chunk = sanitize_for_csv(str(chunk_text))  # Full chunk text
-        result.retrieved_section = sanitize_for_csv(str(chunk_section))
+        chunk_text = record_matched_chunk(result, matched_chunk)
         
         # Compute chunk coverage programmatically instead of relying on LLM estimate
         # Normalize both texts for comparison
@@ -568,11 +925,11 @@ def evaluate_single_query(
             # Retrieved is subset of golden - compute ratio
             result.chunk_coverage = len(retrieved_normalized) / len(golden_normalized) if golden_normalized else 0.0
         else:
-            # Compute word overlap for partial matches
+            # Compute word overlap for partial matches; intersecting with the
+            # token list directly avoids hashing the retrieved text into a set
             golden_words = set(golden_normalized.split())
-            retrieved_words = set(retrieved_normalized.split())
             if golden_words:
-                overlap = len(golden_words & retrieved_words) / len(golden_words)
+                overlap = len(golden_words.intersection(retrieved_normalized.split())) / len(golden_words)
                 result.chunk_coverage = min(overlap, 1.0)
             else:
                 result.chunk_coverage = parsed.get("chunk_coverage", 0.0)
@@ -596,84 +953,499 @@ def evaluate_single_query(
     
     # Only compute flag correctness if the answer was found in top 5
     if result.found_in_top5:
-        # Compare LLM's assessment of golden vs retrieved flags
-        if result.retrieved_penalty_fine is not None and result.golden_penalty_fine is not None:
-            result.penalty_fine_correct = (result.retrieved_penalty_fine == result.golden_penalty_fine)
-        if result.retrieved_prohibition is not None and result.golden_prohibition is not None:
-            result.prohibition_correct = (result.retrieved_prohibition == result.golden_prohibition)
-        if result.retrieved_obligation is not None and result.golden_obligation is not None:
-            result.obligation_correct = (result.retrieved_obligation == result.golden_obligation)
-        if result.retrieved_permission is not None and result.golden_permission is not None:
-            result.permission_correct = (result.retrieved_permission == result.golden_permission)
-        
-        # Calculate overall metadata accuracy
-        metadata_scores = []
-        if result.penalty_fine_correct is not None:
-            metadata_scores.append(1.0 if result.penalty_fine_correct else 0.0)
-        if result.prohibition_correct is not None:
-            metadata_scores.append(1.0 if result.prohibition_correct else 0.0)
-        if result.obligation_correct is not None:
-            metadata_scores.append(1.0 if result.obligation_correct else 0.0)
-        if result.permission_correct is not None:
-            metadata_scores.append(1.0 if result.permission_correct else 0.0)
-        
-        if metadata_scores:
-            result.metadata_accuracy = sum(metadata_scores) / len(metadata_scores)
+        score_metadata_flags(result)
     # If not found in top 5, flag correctness and metadata_accuracy remain None
     
     return result
 
 
-def compute_aggregate_metrics(results: list[EvaluationResult]) -> dict:
+def record_matched_chunk(result: EvaluationResult, matched_chunk: dict) -> str:
+    """Store the matched chunk's text and section on the result; returns the raw text."""
+    chunk_text = get_chunk_text(matched_chunk)
+    chunk_section = get_chunk_section(matched_chunk) or "Unknown"
+    
+    result.retrieved_chunk = sanitize_for_csv(str(chunk_text))  # Full chunk text
+    result.retrieved_section = sanitize_for_csv(str(chunk_section))
+    return chunk_text
+
+
+def record_programmatic_match(result: EvaluationResult, rank: int, matched_chunk: dict, golden_answer: str) -> None:
+    """
+    Score a query without the LLM judge when the matched chunk IS the golden text.
+    
+    With identical text the golden and retrieved flags are equal by definition,
+    so every flag comparison is correct; the flag values themselves are
+    inferred with infer_flags_by_regex.
+    """
+    result.found_in_top5 = True
+    result.rank = rank
+    record_matched_chunk(result, matched_chunk)
+    result.chunk_coverage = 1.0
+    
+    flags = infer_flags_by_regex(golden_answer)
+    result.golden_penalty_fine = result.retrieved_penalty_fine = flags["penalty_fine"]
+    result.golden_prohibition = result.retrieved_prohibition = flags["prohibition"]
+    result.golden_obligation = result.retrieved_obligation = flags["obligation"]
+    result.golden_permission = result.retrieved_permission = flags["permission"]
+    score_metadata_flags(result)
+    
+    result.llm_reasoning = (
+        f"Programmatic match: chunk {rank} has the golden section and text "
+        "(LLM judge skipped; flags inferred by regex)"
+    )
+
+
+def score_metadata_flags(result: EvaluationResult) -> None:
+    """Compare golden vs retrieved metadata flags and set metadata_accuracy."""
+    # Compare LLM's assessment of golden vs retrieved flags
+    if result.retrieved_penalty_fine is not None and result.golden_penalty_fine is not None:
+        result.penalty_fine_correct = (result.retrieved_penalty_fine == result.golden_penalty_fine)
+    if result.retrieved_prohibition is not None and result.golden_prohibition is not None:
+        result.prohibition_correct = (result.retrieved_prohibition == result.golden_prohibition)
+    if result.retrieved_obligation is not None and result.golden_obligation is not None:
+        result.obligation_correct = (result.retrieved_obligation == result.golden_obligation)
+    if result.retrieved_permission is not None and result.golden_permission is not None:
+        result.permission_correct = (result.retrieved_permission == result.golden_permission)
+    
+    # Calculate overall metadata accuracy
+    metadata_scores = []
+    if result.penalty_fine_correct is not None:
+        metadata_scores.append(1.0 if result.penalty_fine_correct else 0.0)
+    if result.prohibition_correct is not None:
+        metadata_scores.append(1.0 if result.prohibition_correct else 0.0)
+    if result.obligation_correct is not None:
+        metadata_scores.append(1.0 if result.obligation_correct else 0.0)
+    if result.permission_correct is not None:
+        metadata_scores.append(1.0 if result.permission_correct else 0.0)
+    
+    if metadata_scores:
+        result.metadata_accuracy = sum(metadata_scores) / len(metadata_scores)
+
+
+def retrieve_for_query(query_id: int, row: dict, mode: str = "hybrid") -> tuple:
+    """
+    Run the retrieval half of an evaluation.
+    
+    Returns (result, pending) where pending is the (prompt, chunks) pair still
+    awaiting the LLM judge, or None if the result is already final.
+    """
+    result = init_evaluation_result(query_id, row)
+    
+    # Step 1: Query the retrieval engine
+    retrieval_response = query_retrieval_engine(
+        row['Question'],
+        row['State'],
+        row['County'],
+        mode=mode
+    )
+    return result, record_retrieval(result, row, retrieval_response)
+
+
+def evaluate_single_query(
+    query_id: int,
+    row: dict,
+    mode: str = "hybrid"
+) -> EvaluationResult:
+    """
+    Evaluate a single query from the dataset.
+    
+    Args:
+        query_id: Index of the query
+        row: Dataset record (column name -> value) with query data
+        mode: Retrieval mode - "hybrid" or "baseline"
+    """
+    result, pending = retrieve_for_query(query_id, row, mode=mode)
+    if pending is None:
+        return result
+    
+    prompt, chunks = pending
+    return record_judgement(result, row, chunks, call_llm_judge(prompt))
+
+
+async def retrieve_for_query_async(
+    query_id: int,
+    row: dict,
+    client: "httpx.AsyncClient",
+    mode: str = "hybrid"
+) -> tuple:
+    """Async variant of retrieve_for_query."""
+    result = init_evaluation_result(query_id, row)
+    retrieval_response = await query_retrieval_engine_async(
+        client,
+        row['Question'],
+        row['State'],
+        row['County'],
+        mode=mode
+    )
+    return result, record_retrieval(result, row, retrieval_response)
+
+
+async def evaluate_single_query_async(
+    query_id: int,
+    row: dict,
+    client: "httpx.AsyncClient",
+    mode: str = "hybrid"
+) -> EvaluationResult:
+    """Async variant of evaluate_single_query."""
+    result, pending = await retrieve_for_query_async(query_id, row, client, mode=mode)
+    if pending is not None:
+        prompt, chunks = pending
+        record_judgement(result, row, chunks, await call_llm_judge_async(client, prompt))
+    return result
+
+
+class RateLimiter:
+    """
+    Paces calls to at most `rate` per second across threads and tasks.
+    
+    Each acquire reserves the next free slot on a shared schedule (a token
+    bucket of capacity 1), so waiting overlaps with in-flight requests
+    instead of being added after each one.
+    """
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+            return slot - now
+    
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+async def _run_bounded(sem: asyncio.Semaphore, delay: float, coro, on_done=None, limiter=None):
+    # Each slot is held for `delay` seconds after its query finishes to keep
+    # the request rate polite; a limiter instead paces query starts.
+    async with sem:
+        if limiter is not None:
+            await limiter.acquire_async()
+        out = await coro
+        if on_done is not None:
+            on_done(out)
+            out = None
+        if delay:
+            await asyncio.sleep(delay)
+    return out
+
+
+async def run_evaluation_async(
+    rows: list,
+    mode: str = "hybrid",
+    concurrency: int = MAX_CONCURRENCY,
+    delay: float = 0.0,
+    judge: bool = True,
+    on_result=None,
+    limiter: Optional[RateLimiter] = None
+) -> list:
+    """
+    Evaluate (query_id, row) pairs concurrently over one pooled HTTP client.
+    
+    If on_result is given it is called as on_result(position, result) as each
+    query finishes and nothing is accumulated; otherwise results are returned
+    in input order. With judge=False only retrieval runs, and (result,
+    pending) pairs are returned for batch judging.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    work = evaluate_single_query_async if judge else retrieve_for_query_async
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(120.0)) as client:
+        tasks = [
+            _run_bounded(
+                sem, delay, work(idx, row, client, mode=mode),
+                on_done=partial(on_result, position) if on_result else None,
+                limiter=limiter
+            )
+            for position, (idx, row) in enumerate(rows)
+        ]
+        return await tqdm_asyncio.gather(*tasks, desc="Evaluating" if judge else "Retrieving")
+
+
+def run_evaluation_threaded(
+    rows: list,
+    mode: str = "hybrid",
+    concurrency: int = MAX_CONCURRENCY,
+    delay: float = 0.0,
+    judge: bool = True,
+    on_result=None,
+    limiter: Optional[RateLimiter] = None
+) -> list:
+    """
+    Thread-pool variant of run_evaluation_async for when httpx is unavailable.
+    
+    The blocking requests calls release the GIL while waiting on the network,
+    and the shared session's connection pool is sized for this many workers.
+    Same on_result/judge semantics as run_evaluation_async.
+    """
+    work = evaluate_single_query if judge else retrieve_for_query
+    
+    def run_one(idx, row):
+        if limiter is not None:
+            limiter.acquire()
+        out = work(idx, row, mode=mode)
+        time.sleep(delay)
+        return out
+    
+    outputs = [None] * len(rows)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(run_one, idx, row): position
+            for position, (idx, row) in enumerate(rows)
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Evaluating" if judge else "Retrieving"):
+            position = futures.pop(future)
+            if on_result is not None:
+                on_result(position, future.result())
+            else:
+                outputs[position] = future.result()
+    return outputs
+
+
+def run_evaluation(
+    rows: list,
+    mode: str = "hybrid",
+    concurrency: int = MAX_CONCURRENCY,
+    delay: float = 0.0,
+    judge: bool = True,
+    on_result=None,
+    rps: Optional[float] = None
+) -> list:
+    """
+    Evaluate (query_id, row) pairs with the best available driver.
+    
+    asyncio + httpx when installed, a thread pool otherwise, and a plain
+    sequential loop when concurrency is 1. With rps set, query starts are
+    paced by a shared RateLimiter and the per-query delay is skipped.
+    """
+    limiter = None
+    if rps:
+        limiter = RateLimiter(rps)
+        delay = 0.0
+    
+    if concurrency > 1 and httpx is not None:
+        return asyncio.run(run_evaluation_async(
+            rows, mode=mode, concurrency=concurrency, delay=delay, judge=judge, on_result=on_result, limiter=limiter
+        ))
+    if concurrency > 1:
+        return run_evaluation_threaded(
+            rows, mode=mode, concurrency=concurrency, delay=delay, judge=judge, on_result=on_result, limiter=limiter
+        )
+    
+    work = evaluate_single_query if judge else retrieve_for_query
+    outputs = []
+    for position, (idx, row) in enumerate(tqdm(rows, desc="Evaluating" if judge else "Retrieving")):
+        if limiter is not None:
+            limiter.acquire()
+        out = work(idx, row, mode=mode)
+        if on_result is not None:
+            on_result(position, out)
+        else:
+            outputs.append(out)
+        
+        # Rate limiting
+        time.sleep(delay)
+    return outputs
+
+
+def build_batch_file(pending: list, path: str) -> None:
+    """
+    Write judge requests as an OpenAI-style batch input file.
+    
+    Args:
+        pending: (query_id, prompt) pairs still awaiting the LLM judge
+        path: Destination .jsonl path
+    """
+    with open(path, 'wb') as f:
+        for query_id, prompt in pending:
+            f.write(_json_dumps({
+                "custom_id": str(query_id),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": build_judge_payload(prompt)
+            }) + b"\n")
+
+
+def submit_judge_batch(path: str, custom_ids: list) -> dict:
+    """
+    Submit a batch input file, wait for it to finish, and collect the judgements.
+    
+    Returns {custom_id: llm_response} where each llm_response has the same
+    shape as call_llm_judge's return value.
+    """
+    auth = {"Authorization": f"Bearer {NIMS_API_KEY}"}
+    
+    try:
+        with open(path, 'rb') as f:
+            response = _session.post(
+                f"{NIMS_BATCH_URL}/files",
+                headers=auth,
+                files={"file": (path, f, "application/jsonl")},
+                data={"purpose": "batch"},
+                timeout=300
+            )
+        response.raise_for_status()
+        input_file_id = response.json()["id"]
+        
+        response = _session.post(
+            f"{NIMS_BATCH_URL}/batches",
+            headers=auth,
+            json={
+                "input_file_id": input_file_id,
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h"
+            },
+            timeout=60
+        )
+        response.raise_for_status()
+        batch = response.json()
+        print(f"Submitted judge batch {batch['id']} ({len(custom_ids)} requests)")
+        
+        while batch.get("status") not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(BATCH_POLL_INTERVAL)
+            response = _session.get(f"{NIMS_BATCH_URL}/batches/{batch['id']}", headers=auth, timeout=60)
+            response.raise_for_status()
+            batch = response.json()
+            print(f"  batch status: {batch.get('status')} {batch.get('request_counts', '')}")
+        
+        if not batch.get("output_file_id"):
+            error = f"Batch {batch.get('status')}: {batch.get('errors')}"
+            return {custom_id: {"error": error} for custom_id in custom_ids}
+        
+        response = _session.get(
+            f"{NIMS_BATCH_URL}/files/{batch['output_file_id']}/content",
+            headers=auth,
+            timeout=300
+        )
+        response.raise_for_status()
+        output = response.text
+    except (requests.exceptions.RequestException, KeyError) as e:
+        return {custom_id: {"error": str(e)} for custom_id in custom_ids}
+    
+    responses = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        item = _json_loads(line)
+        item_response = item.get("response") or {}
+        if item.get("error") or item_response.get("status_code") != 200:
+            responses[item["custom_id"]] = {"error": str(item.get("error") or item_response.get("body"))}
+        else:
+            responses[item["custom_id"]] = _judge_result(item_response.get("body", {}))
+    
+    missing = {"error": "No response in batch output"}
+    return {custom_id: responses.get(custom_id, missing) for custom_id in custom_ids}
+
+
+def run_evaluation_batch(
+    rows: list,
+    batch_path: str,
+    mode: str = "hybrid",
+    concurrency: int = MAX_CONCURRENCY,
+    delay: float = 0.0,
+    on_result=None,
+    rps: Optional[float] = None
+) -> None:
+    """
+    Two-phase evaluation: retrieve everything first, then judge in one batch.
+    
+    Retrieval still runs concurrently; only the LLM judge calls go through
+    the batch API. Finished results are passed to on_result(position,
+    result) in input order.
+    """
+    # Phase 1: retrieval
+    retrieved = run_evaluation(rows, mode=mode, concurrency=concurrency, delay=delay, judge=False, rps=rps)
+    
+    # Phase 2: judge every uncached pending prompt in a single batch
+    responses = {}
+    pending = []
+    for result, p in retrieved:
+        if p is None:
+            continue
+        cached = judge_cache_get(p[0])
+        if cached is not None:
+            responses[str(result.query_id)] = cached
+        else:
+            pending.append((result.query_id, p[0]))
+    
+    if pending:
+        build_batch_file(pending, batch_path)
+        print(f"Wrote {len(pending)} judge requests to {batch_path}")
+        batch_responses = submit_judge_batch(batch_path, [str(query_id) for query_id, _ in pending])
+        for query_id, prompt in pending:
+            judge_cache_put(prompt, batch_responses[str(query_id)])
+        responses.update(batch_responses)
+    
+    # Phase 3: join judgements back to their queries by custom_id
+    for position, ((result, p), (_, row)) in enumerate(zip(retrieved, rows)):
+        if p is not None:
+            record_judgement(result, row, p[1], responses[str(result.query_id)])
+        on_result(position, result)
+
+
+def compute_aggregate_metrics(results: list[MetricRecord]) -> dict:
     """
     Compute aggregate metrics across all evaluation results.
     """
+    # One table of the per-query fields; every metric below is a vectorized
+    # reduction over it
+    frame = pd.DataFrame(results, columns=[f.name for f in fields(MetricRecord)])
+    
     # Valid results are those where LLM reasoning doesn't indicate an error
-    valid_results = [r for r in results if not r.llm_reasoning.startswith(("Retrieval error:", "LLM error:", "Parse error:"))]
+    valid = frame[~frame["failed"].astype(bool)]
     
-    if not valid_results:
+    if valid.empty:
         return {"error": "No valid results to compute metrics"}
     
     # Separate positive and negative test cases
-    positive_results = [r for r in valid_results if not r.is_negative_test]
-    negative_results = [r for r in valid_results if r.is_negative_test]
+    is_negative = valid["is_negative_test"].astype(bool)
+    positive = valid[~is_negative]
+    negative = valid[is_negative]
+    
+    n = len(valid)
+    n_positive = len(positive)
+    n_negative = len(negative)
     
-    n = len(valid_results)
-    n_positive = len(positive_results)
-    n_negative = len(negative_results)
+    # Reciprocal rank per positive query (0 when not found)
+    ranks = pd.to_numeric(positive["rank"], errors="coerce").to_numpy(dtype=float)
+    reciprocal_ranks = np.divide(1.0, ranks, out=np.zeros_like(ranks), where=ranks > 0)
+    found_mask = positive["found_in_top5"].astype(bool).to_numpy()
     
     # === POSITIVE TEST METRICS ===
     # Top-5 Recall (only for positive tests)
     if n_positive > 0:
-        top5_hits = sum(1 for r in positive_results if r.found_in_top5)
-        top5_recall = top5_hits / n_positive
+        top5_recall = float(found_mask.mean())
         
         # MRR (Mean Reciprocal Rank)
-        reciprocal_ranks = []
-        for r in positive_results:
-            if r.rank > 0:
-                reciprocal_ranks.append(1.0 / r.rank)
-            else:
-                reciprocal_ranks.append(0.0)
-        mrr = sum(reciprocal_ranks) / n_positive
+        mrr = float(reciprocal_ranks.mean())
+        
+        # Per-flag accuracy (and the averages below) only count found queries
+        found_results = positive[found_mask]
+        n_found = len(found_results)
         
         # Average Chunk Coverage (only for queries where answer was found)
-        coverages = [r.chunk_coverage for r in positive_results if r.found_in_top5]
-        avg_coverage = sum(coverages) / len(coverages) if coverages else 0.0
+        coverages = pd.to_numeric(found_results["chunk_coverage"], errors="coerce")
+        avg_coverage = float(coverages.mean()) if n_found else 0.0
         
         # Metadata Accuracy
-        metadata_accuracies = [r.metadata_accuracy for r in positive_results 
-                              if r.found_in_top5 and r.metadata_accuracy is not None]
-        avg_metadata_accuracy = sum(metadata_accuracies) / len(metadata_accuracies) if metadata_accuracies else 0.0
+        metadata_accuracies = pd.to_numeric(found_results["metadata_accuracy"], errors="coerce").dropna()
+        avg_metadata_accuracy = float(metadata_accuracies.mean()) if len(metadata_accuracies) else 0.0
         
-        # Per-flag accuracy
-        found_results = [r for r in positive_results if r.found_in_top5]
-        n_found = len(found_results)
-        
-        penalty_correct = sum(1 for r in found_results if r.penalty_fine_correct is True)
-        prohibition_correct = sum(1 for r in found_results if r.prohibition_correct is True)
-        obligation_correct = sum(1 for r in found_results if r.obligation_correct is True)
-        permission_correct = sum(1 for r in found_results if r.permission_correct is True)
+        penalty_correct = int(found_results["penalty_fine_correct"].eq(True).sum())
+        prohibition_correct = int(found_results["prohibition_correct"].eq(True).sum())
+        obligation_correct = int(found_results["obligation_correct"].eq(True).sum())
+        permission_correct = int(found_results["permission_correct"].eq(True).sum())
     else:
         top5_recall = None
         mrr = None
@@ -686,29 +1458,26 @@ def compute_aggregate_metrics(results: list[EvaluationResult]) -> dict:
     # Evaluate based on whether system correctly said no law exists
     if n_negative > 0:
         # True Negatives: system correctly identified no relevant law
-        true_negatives = sum(1 for r in negative_results if r.negative_test_correct is True)
+        true_negatives = int(negative["negative_test_correct"].eq(True).sum())
         # False Positives: system incorrectly claimed a law exists
-        false_positives = sum(1 for r in negative_results if r.negative_test_correct is False)
-        # Pending: not yet evaluated (e.g., errors)
-        pending = sum(1 for r in negative_results if r.negative_test_correct is None)
-        negative_accuracy = true_negatives / n_negative if n_negative > 0 else None
+        false_positives = int(negative["negative_test_correct"].eq(False).sum())
+        negative_accuracy = true_negatives / n_negative
     else:
         true_negatives = 0
         false_positives = 0
-        pending = 0
         negative_accuracy = None
     
     # By difficulty
     difficulty_metrics = {}
+    difficulty = positive["difficulty"].to_numpy()
     for diff in ['Easy', 'Medium', 'Hard']:
-        diff_results = [r for r in positive_results if r.difficulty == diff]
-        if diff_results:
-            diff_hits = sum(1 for r in diff_results if r.found_in_top5)
-            diff_mrr_values = [1.0/r.rank if r.rank > 0 else 0.0 for r in diff_results]
+        diff_mask = difficulty == diff
+        diff_count = int(diff_mask.sum())
+        if diff_count:
             difficulty_metrics[diff] = {
-                "count": len(diff_results),
-                "top5_recall": diff_hits / len(diff_results),
-                "mrr": sum(diff_mrr_values) / len(diff_results)
+                "count": diff_count,
+                "top5_recall": float(found_mask[diff_mask].mean()),
+                "mrr": float(reciprocal_ranks[diff_mask].mean())
             }
     
     # Composite Score (weighted average) - only for positive tests
@@ -756,6 +1525,7 @@ def main():
     """
     Main evaluation pipeline.
     """
+    global JUDGE_CACHE_PATH, FAST_JUDGE
     import argparse
     
     parser = argparse.ArgumentParser(description="Legal Retrieval Engine Evaluator")
@@ -786,15 +1556,46 @@ def main():
         default=1.0,
         help="Delay between API calls in seconds"
     )
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=None,
+        help="Cap on queries started per second across all workers (replaces --delay)"
+    )
     parser.add_argument(
         "--mode", "-m",
         default="hybrid",
         choices=["hybrid", "baseline"],
         help="Retrieval mode: 'hybrid' or 'baseline'"
     )
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help="Maximum number of queries evaluated concurrently (1 = sequential)"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Judge all queries through the batch API instead of one call per query"
+    )
+    parser.add_argument(
+        "--fast-judge",
+        action="store_true",
+        help="Skip the LLM judge when the matched chunk is the golden text (flags inferred by regex)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Always call the LLM judge instead of reusing responses cached in {JUDGE_CACHE_PATH}"
+    )
     
     args = parser.parse_args()
     
+    if args.no_cache:
+        JUDGE_CACHE_PATH = None
+    FAST_JUDGE = args.fast_judge
+    
     # Load dataset
     print(f"Loading evaluation dataset from {args.input}...")
     if args.input.endswith('.xlsx') or args.input.endswith('.xls'):
@@ -809,39 +1610,47 @@ def main():
         df = df.head(args.limit)
         print(f"Limited to {len(df)} queries")
     
-    # Evaluate each query
-    results = []
-    for idx, row in tqdm(df.iterrows(), total=len(df), desc="Evaluating"):
-        result = evaluate_single_query(idx, row, mode=args.mode)
-        results.append(result)
-        
-        # Rate limiting
-        time.sleep(args.delay)
-    
-    # Convert results to DataFrame
-    results_data = [asdict(r) for r in results]
-    results_df = pd.DataFrame(results_data)
-    
-    # Remove negative test columns from output (keep logic internal only)
-    columns_to_drop = ['system_response', 'is_negative_test', 'system_says_no_law', 'negative_test_correct']
-    results_df = results_df.drop(columns=[c for c in columns_to_drop if c in results_df.columns])
-    
-    # Save per-query results
-    print(f"\nSaving per-query results to {args.output}...")
-    if args.output.endswith('.xlsx'):
-        results_df.to_excel(args.output, index=False)
+    # Plain dict records are much cheaper to index than iterrows() Series
+    rows = list(zip(df.index, df.to_dict('records')))
+    
+    # Evaluate each query, streaming per-query results to disk as they finish
+    print(f"Writing per-query results to {args.output}...")
+    writer = ResultWriter(args.output)
+    
+    if args.batch:
+        batch_path = args.output.rsplit('.', 1)[0] + "_judge_batch.jsonl"
+        run_evaluation_batch(
+            rows,
+            batch_path,
+            mode=args.mode,
+            concurrency=args.concurrency,
+            delay=args.delay,
+            on_result=writer.add,
+            rps=args.rps
+        )
     else:
-        # Use proper CSV quoting to handle special characters
-        import csv
-        results_df.to_csv(args.output, index=False, quoting=csv.QUOTE_ALL, escapechar='\\')
+        print(f"Concurrency: {args.concurrency}")
+        run_evaluation(
+            rows,
+            mode=args.mode,
+            concurrency=args.concurrency,
+            delay=args.delay,
+            on_result=writer.add,
+            rps=args.rps
+        )
+    
+    writer.close()
     
     # Compute and save aggregate metrics
     print("Computing aggregate metrics...")
-    metrics = compute_aggregate_metrics(results)
+    metrics = compute_aggregate_metrics(writer.metric_records)
     
     print(f"\nSaving summary metrics to {args.summary}...")
     with open(args.summary, 'w') as f:
-        json.dump(metrics, f, indent=2)
+        if orjson is not None:
+            f.write(orjson.dumps(metrics, option=orjson.OPT_INDENT_2).decode())
+        else:
+            json.dump(metrics, f, indent=2)
     
     # Print summary
     print("\n" + "="*60)
@@ -0,0 +1,46 @@
+from typing import List, Optional, Tuple
+import polars as pl
+
+# Rough characters-per-token ratio for English legal text
+CHARS_PER_TOKEN = 4
+
+
+def batched_by_tokens(
+    df: pl.DataFrame,
+    text_col: str = "chunk_text",
+    max_tokens: Optional[int] = 8192,
+    max_items: int = 96,
+) -> List[Tuple[int, int]]:
+    """Greedily pack consecutive rows into batches under a token budget.
+
+    Token counts are estimated from character length. A row longer than the
+    budget still gets its own batch (the embed call truncates it).
+
+    Args:
+        df: Polars DataFrame containing text data
+        text_col: Name of the column containing text data
+        max_tokens: Estimated token budget per batch (None = only max_items applies)
+        max_items: Maximum number of rows per batch
+
+    Returns:
+        List of (start, end) row ranges covering df in order
+    """
+
+    n = len(df)
+    if max_tokens is None:
+        return [(i, min(i + max_items, n)) for i in range(0, n, max_items)]
+
+    token_est = (df[text_col].str.len_chars().fill_null(0) // CHARS_PER_TOKEN + 1).to_list()
+
+    batches = []
+    start = 0
+    tokens = 0
+    for i, est in enumerate(token_est):
+        if i > start and (i - start >= max_items or tokens + est > max_tokens):
+            batches.append((start, i))
+            start = i
+            tokens = 0
+        tokens += est
+    if start < n:
+        batches.append((start, n))
+    return batches
@@ -0,0 +1,58 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+from aiolimiter import AsyncLimiter
+from tqdm import tqdm
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def run_concurrently(
+    fn: Callable[[T], R],
+    items: Sequence[T],
+    max_concurrency: int = 8,
+    max_rps: Optional[float] = None,
+    desc: Optional[str] = None,
+) -> List[R]:
+    """Apply a blocking function to every item with several calls in flight.
+
+    Calls run in worker threads so their network round-trips overlap.
+
+    Args:
+        fn: Blocking function called once per item
+        items: Inputs to fn (e.g. text batches)
+        max_concurrency: Maximum number of calls in flight at once
+        max_rps: Optional request-per-second cap, enforced with a token bucket
+        desc: tqdm progress bar label
+
+    Returns:
+        List of fn results in the same order as items
+    """
+    return asyncio.run(_gather(fn, items, max_concurrency, max_rps, desc))
+
+
+async def _gather(fn, items, max_concurrency, max_rps, desc):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = AsyncLimiter(max_rps, 1) if max_rps else None
+    progress = tqdm(total=len(items), desc=desc)
+
+    # A dedicated pool, since the loop's default executor may have fewer threads
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def run_one(item):
+        async with semaphore:
+            if limiter is not None:
+                await limiter.acquire()
+            result = await loop.run_in_executor(executor, fn, item)
+        progress.update(1)
+        return result
+
+    try:
+        # gather preserves argument order, so results line up with items
+        return await asyncio.gather(*(run_one(item) for item in items))
+    finally:
+        executor.shutdown(wait=False)
+        progress.close()
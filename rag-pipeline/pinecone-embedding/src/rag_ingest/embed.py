@@ -0,0 +1,65 @@
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+import polars as pl
+
+from rag_ingest.batching import batched_by_tokens
+from rag_ingest.concurrency import run_concurrently
+from rag_ingest.embed_dense import embed_dense_batch
+from rag_ingest.embed_sparse import embed_sparse_batch
+
+def embed_both(
+    pc,
+    df: pl.DataFrame,
+    text_col: str = "chunk_text",
+    dense_model: str = "llama-text-embed-v2",
+    sparse_model: str = "pinecone-sparse-english-v0",
+    batch_size: int = 96,
+    max_tokens: Optional[int] = 8192,
+    max_concurrency: int = 8,
+    max_rps: Optional[float] = None
+) -> Tuple[List[List[float]], List[Dict[str, List[float]]]]:
+
+    """Generate dense and sparse embeddings in a single pass over the text column.
+
+    Each batch is built once and its dense and sparse requests are in flight
+    together.
+
+    Args:
+        pc: Pinecone client instance
+        df: Polars DataFrame containing text data
+        text_col: Name of the column containing text data
+        dense_model: Name of the Pinecone dense embed model
+        sparse_model: Name of the Pinecone sparse embed model
+        batch_size: Maximum number of texts per embed request
+        max_tokens: Estimated token budget per embed request (None = batch by count only)
+        max_concurrency: Maximum number of embed requests in flight
+        max_rps: Optional cap on embed requests per second
+
+    Returns:
+        Tuple of (dense_embeddings, sparse_embeddings), aligned with df rows
+    """
+
+    all_chunks = df[text_col].to_list()
+    n = len(all_chunks)
+    batches = batched_by_tokens(df, text_col, max_tokens=max_tokens, max_items=batch_size)
+
+    embed_fns = (
+        partial(embed_dense_batch, pc, embed_model=dense_model),
+        partial(embed_sparse_batch, pc, embed_model=sparse_model),
+    )
+    jobs = [(fn, all_chunks[start:end]) for start, end in batches for fn in embed_fns]
+    results = run_concurrently(
+        lambda job: job[0](job[1]),
+        jobs,
+        max_concurrency=max_concurrency,
+        max_rps=max_rps,
+        desc="Embedding",
+    )
+
+    dense_embeddings: List[List[float]] = [None] * n
+    sparse_embeddings: List[Dict[str, List[float]]] = [None] * n
+    for k, (start, end) in enumerate(batches):
+        dense_embeddings[start:end] = results[2 * k]
+        sparse_embeddings[start:end] = results[2 * k + 1]
+
+    return dense_embeddings, sparse_embeddings
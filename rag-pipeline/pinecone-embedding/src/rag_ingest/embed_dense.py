@@ -1,51 +1,67 @@
-from typing import List
+from functools import partial
+from typing import List, Optional
 import polars as pl
-from tqdm import tqdm
+
+from rag_ingest.batching import batched_by_tokens
+from rag_ingest.concurrency import run_concurrently
+from rag_ingest.retry import pinecone_retry
+
+@pinecone_retry
+def _embed_once(pc, chunk_batch: List[str], embed_model: str):
+    return pc.inference.embed(
+        model=embed_model,
+        inputs=chunk_batch,
+        parameters={"input_type": "passage", "truncate": "END"},
+    )
+
+def embed_dense_batch(pc, chunk_batch: List[str], embed_model: str = "llama-text-embed-v2") -> List[List[float]]:
+    """Embed one batch of texts with a dense Pinecone model."""
+    result = _embed_once(pc, chunk_batch, embed_model)
+    return [x["values"] for x in result]
 
 def embed_dense(
     pc,
     df: pl.DataFrame,
     text_col:str = "chunk_text",
     embed_model: str = "llama-text-embed-v2",
-    batch_size: int = 96
+    batch_size: int = 96,
+    max_tokens: Optional[int] = 8192,
+    max_concurrency: int = 8,
+    max_rps: Optional[float] = None
 ) -> List[List[float]]:
 
     """Embed dense text data using Pinecone.
 
+    Batches are sent concurrently; the output order matches the input rows.
+
     Args:
         pc: Pinecone client instance
         df: Polars DataFrame containing text data
         text_col: Name of the column containing text data
         embed_model: Name of the Pinecone embed model to use
-        batch_size: Batch size for embedding
+        batch_size: Maximum number of texts per embed request
+        max_tokens: Estimated token budget per embed request (None = batch by count only)
+        max_concurrency: Maximum number of embed requests in flight
+        max_rps: Optional cap on embed requests per second
 
     Returns:
         List of lists of floats representing the embeddings
     """
 
     all_chunks = df[text_col].to_list()
-    dense_embeddings = []
-
-    # WRAP range() with tqdm
-    # total=len(all_chunks) allows tqdm to estimate time remaining
-    # step=batch_size ensures the bar updates correctly
-    for i in tqdm(range(0, len(all_chunks), batch_size), desc="Dense Embedding"):
-        chunk_batch = all_chunks[i:i+batch_size]
-
-        try:
-            result = pc.inference.embed(
-                model=embed_model,
-                inputs=chunk_batch,
-                parameters={"input_type": "passage", "truncate": "END"},
-            )
-            dense_embeddings.extend([x["values"] for x in result])
-
-        except Exception:
-            # single retry batch
-            result = pc.inference.embed(
-                model=embed_model,
-                inputs=chunk_batch,
-                parameters={"input_type": "passage", "truncate": "END"},
-            )
-            dense_embeddings.extend([x["values"] for x in result])
-    return dense_embeddings
\ No newline at end of file
+    ranges = batched_by_tokens(df, text_col, max_tokens=max_tokens, max_items=batch_size)
+
+    results = run_concurrently(
+        partial(embed_dense_batch, pc, embed_model=embed_model),
+        [all_chunks[start:end] for start, end in ranges],
+        max_concurrency=max_concurrency,
+        max_rps=max_rps,
+        desc="Dense Embedding",
+    )
+
+    # Fill a pre-sized list by position rather than growing it batch by batch
+    dense_embeddings: List[List[float]] = [None] * len(all_chunks)
+    for (start, end), batch_embeddings in zip(ranges, results):
+        dense_embeddings[start:end] = batch_embeddings
+
+    return dense_embeddings
@@ -1,23 +1,54 @@
-from typing import List, Dict
+from functools import partial
+from typing import List, Dict, Optional
 import polars as pl
-from tqdm import tqdm
+
+from rag_ingest.batching import batched_by_tokens
+from rag_ingest.concurrency import run_concurrently
+from rag_ingest.retry import pinecone_retry
+
+@pinecone_retry
+def _embed_once(pc, chunk_batch: List[str], embed_model: str):
+    return pc.inference.embed(
+        model=embed_model,
+        inputs=chunk_batch,
+        parameters={"input_type": "passage", "truncate": "END"},
+    )
+
+def embed_sparse_batch(pc, chunk_batch: List[str], embed_model = "pinecone-sparse-english-v0") -> List[Dict[str,List[float]]]:
+    """Embed one batch of texts with a sparse Pinecone model."""
+    result = _embed_once(pc, chunk_batch, embed_model)
+    return [
+        {
+            "indices": item.get("sparse_indices",[]),
+            "values": item.get("sparse_values",[]),
+        }
+        for item in result
+    ]
 
 def embed_sparse(
     pc,
     df: pl.DataFrame,
     text_col: str = "chunk_text",
     embed_model = "pinecone-sparse-english-v0",
-    batch_size = 96
+    batch_size = 96,
+    max_tokens: Optional[int] = 8192,
+    max_concurrency: int = 8,
+    max_rps: Optional[float] = None
 ) -> List[Dict[str,List[float]]]:
 
     """Generate sparse embeddings for text using Pinecone Inference API.
 
+    Batches are sent concurrently; the output order matches the input rows.
+
     Args:
         pc: Pinecone index object
         df: Polars DataFrame containing text data
         text_col: Name of the column containing text data
         embed_model: Name of the Pinecone embed model to use
-        batch_size: Batch size for embedding
+        batch_size: Maximum number of texts per embed request
+        max_tokens: Estimated token budget per embed request (None = batch by count only)
+        max_concurrency: Maximum number of embed requests in flight
+        max_rps: Optional cap on embed requests per second
 
     Returns:
         List of Dicts of floats representing the embeddings
@@ -25,31 +56,19 @@ def embed_sparse(
 
 
     all_chunks = df[text_col].to_list()
-    sparse_embeddings:List[Dict[str, List[float]]] = []
-
-    for i in tqdm(range(0, len(all_chunks), batch_size), desc="Sparse Embedding"):
-        chunk_batch = all_chunks[i:i + batch_size]
-
-        try:
-            result = pc.inference.embed(
-                model=embed_model,
-                inputs = chunk_batch,
-                parameters={"input_type": "passage", "truncate": "END"},
-            )
-        
-        except Exception:
-            result = pc.inference.embed(
-                model=embed_model,
-                inputs=chunk_batch,
-                parameters={"input_type": "passage", "truncate":"END"}
-            )
-
-        sparse_embeddings.extend([
-            {
-                "indices": item.get("sparse_indices",[]),
-                "values": item.get("sparse_values",[]),
-            }
-            for item in result
-        ])
-
-    return sparse_embeddings
\ No newline at end of file
+    ranges = batched_by_tokens(df, text_col, max_tokens=max_tokens, max_items=batch_size)
+
+    results = run_concurrently(
+        partial(embed_sparse_batch, pc, embed_model=embed_model),
+        [all_chunks[start:end] for start, end in ranges],
+        max_concurrency=max_concurrency,
+        max_rps=max_rps,
+        desc="Sparse Embedding",
+    )
+
+    # Fill a pre-sized list by position rather than growing it batch by batch
+    sparse_embeddings: List[Dict[str, List[float]]] = [None] * len(all_chunks)
+    for (start, end), batch_embeddings in zip(ranges, results):
+        sparse_embeddings[start:end] = batch_embeddings
+
+    return sparse_embeddings
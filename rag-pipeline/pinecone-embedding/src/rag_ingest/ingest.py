@@ -1,13 +1,39 @@
 import argparse
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import polars as pl
 
 from rag_ingest.pinecone_setup import init_pinecone
 from rag_ingest.s3_loader import load_parquet_from_s3
-from rag_ingest.embed_dense import embed_dense
-from rag_ingest.embed_sparse import embed_sparse
-from rag_ingest.upsert import build_vectors_from_df, upsert
+from rag_ingest.embed import embed_both
+from rag_ingest.upsert import build_ids_and_metadata, id_template_fields, upsert
+
+# Embedded slices allowed to wait for upload before embedding pauses
+MAX_PENDING_UPLOADS = 2
+
+# Temporary column carrying each chunk's pre-filter row number ({idx} in ids)
+ROW_INDEX_COL = "__row_idx"
+
+
+def filter_chunks(df: pl.DataFrame, text_col: str, min_chars: int = 16, dedupe: bool = False) -> pl.DataFrame:
+    """Drop null, blank and very short chunks (and optionally exact duplicates) before embedding."""
+    before = len(df)
+    df = df.filter(
+        pl.col(text_col).is_not_null()
+        & (pl.col(text_col).str.strip_chars().str.len_chars() >= min_chars)
+    )
+    short = before - len(df)
+
+    dupes = 0
+    if dedupe:
+        kept = len(df)
+        df = df.unique(subset=[text_col], keep="first", maintain_order=True)
+        dupes = kept - len(df)
+
+    print(f"Kept {len(df)} of {before} chunks ({short} empty/short, {dupes} duplicate)")
+    return df
 
 
 def parse_args():
@@ -47,6 +73,47 @@ def parse_args():
         help="Column names to attach as metadata to each vector. If omitted, all columns are used.",
     )
 
+    parser.add_argument(
+        "--embed-concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of embedding requests in flight",
+    )
+
+    parser.add_argument(
+        "--embed-rps",
+        type=float,
+        default=None,
+        help="Optional cap on embedding requests per second",
+    )
+
+    parser.add_argument(
+        "--slice-rows",
+        type=int,
+        default=5000,
+        help="Rows embedded and upserted per pipeline step",
+    )
+
+    parser.add_argument(
+        "--upsert-concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of upsert requests in flight",
+    )
+
+    parser.add_argument(
+        "--min-chars",
+        type=int,
+        default=16,
+        help="Skip chunks with fewer than this many characters after trimming whitespace",
+    )
+
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Skip chunks whose text exactly repeats an earlier chunk",
+    )
+
     return parser.parse_args()
 
 
@@ -60,14 +127,31 @@ def main():
         region="us-east-1",
     )
 
+    id_template = "{county}#chunk{idx}"  # customize later if needed
+
+    # Only decode the columns that are embedded, attached as metadata, or used in ids
+    columns = None
+    if args.metadata_cols:
+        columns = list(dict.fromkeys(["chunk_text", *args.metadata_cols, *id_template_fields(id_template)]))
+
     # Load parquet(s) from S3
     df = load_parquet_from_s3(
         bucket=args.bucket,
         prefix=args.prefix,
         single_key=args.single_key,
         region="us-east-1",
+        columns=columns,
     )
 
+    # Don't pay to embed and store chunks with no usable text. {idx} in ids is the
+    # row number from before filtering, so surviving chunks keep the same vector ids
+    # however many rows are dropped (re-ingesting overwrites rather than shifts)
+    df = filter_chunks(
+        df.with_row_index(ROW_INDEX_COL), "chunk_text", min_chars=args.min_chars, dedupe=args.dedupe
+    )
+    row_index = df.get_column(ROW_INDEX_COL)
+    df = df.drop(ROW_INDEX_COL)
+
     # Logic to determine metadata columns
     if not args.metadata_cols:
         # Use ALL columns (including chunk_text) if none provided
@@ -75,48 +159,54 @@ def main():
     else:
         meta_cols = args.metadata_cols
 
-    # Generate dense embeddings
-    dense_vecs = embed_dense(
-        pc=pc,
-        df=df,
-        text_col="chunk_text",
-        embed_model="llama-text-embed-v2",
-        batch_size=96,
-    )
-
-    # Generate sparse embeddings
-    sparse_vecs = embed_sparse(
-        pc=pc,
-        df=df,
-        text_col="chunk_text",
-        embed_model="pinecone-sparse-english-v0",
-        batch_size=96,
-    )
-
-    # Build metadata + vector objects
-    vectors, ids = build_vectors_from_df(
-        df=df,
-        dense_embeddings=dense_vecs,
-        sparse_embeddings=sparse_vecs,
-        metadata=meta_cols,  # Use the variable 'meta_cols' here, NOT args.metadata_cols
-        id_template="{county}#chunk{idx}",  # customize later if needed
-    )
-
-    # Extract metadata list in the same order
-    metadata_list = [v["metadata"] for v in vectors]
-
-    #  Upsert into Pinecone
-    stats = upsert(
-        index=index,
-        ids=ids,
-        dense_vectors=dense_vecs,
-        sparse_vectors=sparse_vecs,
-        metadata=metadata_list,
-        batch_size=100,
-    )
+    # Embed and upsert slice by slice: a slice uploads while the next one embeds,
+    # and at most a few slices' embeddings are held in memory at once
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=1) as uploader:
+        for offset in range(0, len(df), args.slice_rows):
+            part = df.slice(offset, args.slice_rows)
+
+            # Generate dense + sparse embeddings in one pass
+            dense_vecs, sparse_vecs = embed_both(
+                pc=pc,
+                df=part,
+                text_col="chunk_text",
+                dense_model="llama-text-embed-v2",
+                sparse_model="pinecone-sparse-english-v0",
+                batch_size=96,
+                max_concurrency=args.embed_concurrency,
+                max_rps=args.embed_rps,
+            )
+
+            # Build IDs + metadata (vectors are assembled per batch during upsert)
+            ids, metadata_list = build_ids_and_metadata(
+                df=part,
+                metadata=meta_cols,  # Use the variable 'meta_cols' here, NOT args.metadata_cols
+                id_template=id_template,
+                row_index=row_index.slice(offset, args.slice_rows),
+            )
+
+            # Backpressure: wait for older uploads before queueing more
+            while len(pending) >= MAX_PENDING_UPLOADS:
+                pending.popleft().result()
+
+            #  Upsert into Pinecone
+            pending.append(uploader.submit(
+                upsert,
+                index=index,
+                ids=ids,
+                dense_vectors=dense_vecs,
+                sparse_vectors=sparse_vecs,
+                metadata=metadata_list,
+                batch_size=100,
+                max_concurrency=args.upsert_concurrency,
+            ))
+
+        while pending:
+            pending.popleft().result()
 
     print("\nIngestion Complete!")
-    print(stats)
+    print(index.describe_index_stats())
 
 
 if __name__ == "__main__":
@@ -1,7 +1,14 @@
 import os
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import ServerlessSpec
 from dotenv import load_dotenv
 
+# gRPC (protobuf over HTTP/2) cuts per-request overhead on bulk upserts;
+# needs the pinecone[grpc] extra, otherwise fall back to the REST client
+try:
+    from pinecone.grpc import PineconeGRPC as Pinecone
+except ImportError:
+    from pinecone import Pinecone
+
 load_dotenv()
 
 def init_pinecone(index_name: str, dimension: int = 1024, region: str = 'us-east-1', metric = 'dotproduct'):
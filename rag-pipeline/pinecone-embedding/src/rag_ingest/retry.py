@@ -0,0 +1,33 @@
+import urllib3
+from pinecone.exceptions import PineconeApiException, PineconeException
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+try:
+    import grpc
+except ImportError:
+    grpc = None
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_GRPC_CODES = (
+    {grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED}
+    if grpc is not None else set()
+)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Retry throttling, transient server errors and dropped connections; fail fast on anything else."""
+    if isinstance(exc, PineconeApiException):
+        return exc.status in RETRYABLE_STATUS
+    if grpc is not None and isinstance(exc, PineconeException) and isinstance(exc.__cause__, grpc.RpcError):
+        # The gRPC client wraps RpcErrors; it only retries UNAVAILABLE itself
+        return exc.__cause__.code() in RETRYABLE_GRPC_CODES
+    return isinstance(exc, urllib3.exceptions.HTTPError)
+
+
+# Jittered exponential backoff so concurrent workers don't retry in lockstep
+pinecone_retry = retry(
+    retry=retry_if_exception(is_retryable),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
@@ -1,66 +1,110 @@
+import os
+
 import boto3
 import polars as pl
 from io import BytesIO
 from typing import Optional, List
 
+from rag_ingest.concurrency import run_concurrently
+
+
+def _scan_parquet_object(
+    s3_client,
+    bucket: str,
+    key: str,
+    etag: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+) -> pl.LazyFrame:
+    if cache_dir:
+        return pl.scan_parquet(_cached_parquet_path(s3_client, bucket, key, etag, cache_dir))
+
+    obj = s3_client.get_object(Bucket=bucket, Key=key)
+    parquet_data = obj['Body'].read()
+    return pl.scan_parquet(BytesIO(parquet_data))
+
+
+def _cached_parquet_path(s3_client, bucket: str, key: str, etag: Optional[str], cache_dir: str) -> str:
+    """Local copy of an S3 object, downloaded only if this ETag isn't cached yet."""
+    if etag is None:
+        etag = s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+
+    # Keying on the ETag means a re-uploaded shard is fetched again
+    version = etag.strip('"')
+    path = os.path.join(cache_dir, bucket, f"{key}.{version}")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.part"
+        s3_client.download_file(bucket, key, tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _collect(lazy: pl.LazyFrame, columns: Optional[List[str]]) -> pl.DataFrame:
+    """Collect a scan, decoding only the requested columns that actually exist."""
+    if columns is not None:
+        wanted = set(columns)
+        lazy = lazy.select([c for c in lazy.collect_schema().names() if c in wanted])
+    return lazy.collect()
+
 
 def load_parquet_from_s3(
     bucket: str,
     prefix: Optional[str] = None,
     single_key: Optional[str] = None,
     region: str = "us-east-1",
+    max_workers: int = 16,
+    columns: Optional[List[str]] = None,
+    cache_dir: Optional[str] = None,
 ) -> pl.DataFrame:
     """
     Load parquet data from S3.
 
     Mode A: if `single_key` is provided -> load just that parquet file
     Mode B: if prefix provided and no single_key -> walk prefix, concat all parquet files
+            (shards are downloaded concurrently with up to max_workers requests)
+
+    Shards are scanned lazily and concatenated in one plan, so only `columns`
+    (all columns if None) are decoded and there is no separate concat copy.
+
+    If `cache_dir` (or the RAG_CACHE_DIR env var) is set, shards are kept on
+    local disk keyed by ETag, so re-runs read unchanged shards from disk.
 
     Returns: Polars DataFrame
     """
     s3_client = boto3.client('s3', region_name=region)
+    cache_dir = cache_dir or os.getenv("RAG_CACHE_DIR")
 
     # Mode A: single file
     if single_key:
-        obj = s3_client.get_object(Bucket=bucket, Key=single_key)
-        parquet_data = obj['Body'].read()
-        return pl.read_parquet(BytesIO(parquet_data))
+        return _collect(_scan_parquet_object(s3_client, bucket, single_key, cache_dir=cache_dir), columns)
 
     # Mode B: multiple files
-    parquet_files = []
-    continuation_token = None
-    while True:
-        list_params = {
-            'Bucket': bucket
-            }
+    list_params = {
+        'Bucket': bucket
+        }
 
-        if prefix:
-            list_params['Prefix'] = prefix
+    if prefix:
+        list_params['Prefix'] = prefix
 
-        if continuation_token:
-            list_params['ContinuationToken'] = continuation_token
-
-        response = s3_client.list_objects_v2(**list_params)
-        if "Contents" not in response:
-            raise FileNotFoundError(f"No parquet files found in S3://{bucket}/{prefix}")
-
-        for obj in response['Contents']:
+    parquet_files = []
+    etags = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(**list_params):
+        for obj in page.get('Contents', []):
             key = obj['Key']
             if key.endswith('.parquet'):
                 parquet_files.append(key)
-
-        if response.get("IsTruncated", False):
-            continuation_token = response.get("NextContinuationToken", None)
-        else:
-            break
+                etags[key] = obj.get('ETag')
 
     if not parquet_files:
         raise FileNotFoundError(f"No parquet files found in S3://{bucket}/{prefix}")
 
-    dfs = []
-    for key in parquet_files:
-        obj = s3_client.get_object(Bucket=bucket, Key=key)
-        parquet_data = obj['Body'].read()
-        dfs.append(pl.read_parquet(BytesIO(parquet_data)))
+    # Shards are independent, so fetch them concurrently (boto3 clients are thread-safe)
+    scans = run_concurrently(
+        lambda key: _scan_parquet_object(s3_client, bucket, key, etags[key], cache_dir),
+        parquet_files,
+        max_concurrency=max_workers,
+        desc="Downloading parquet",
+    )
 
-    return pl.concat(dfs, how='vertical')
+    return _collect(pl.concat(scans, how='vertical'), columns)
@@ -1,58 +1,142 @@
-from typing import List, Dict, Any, Tuple
+from string import Formatter
+from typing import List, Dict, Any, Optional, Tuple
 import polars as pl
-from tqdm import tqdm
 
+from rag_ingest.concurrency import run_concurrently
+from rag_ingest.retry import pinecone_retry
 
 
-def build_vectors_from_df(
-    df: pl.DataFrame, 
-    dense_embeddings: List[List[float]],
-    sparse_embeddings: List[Dict[str, List[float]]],
+# Per-column cap (characters) keeping vectors under Pinecone's 40KB metadata limit
+META_MAX = 8000
+
+
+def _as_text(df: pl.DataFrame, col: str) -> pl.Expr:
+    """Polars expression rendering a column as strings the way str() would (nulls kept)."""
+    dtype = df.schema[col]
+    if dtype == pl.Boolean:
+        # "True"/"False" rather than Polars' "true"/"false"
+        return pl.col(col).replace_strict({True: "True", False: "False"}, return_dtype=pl.Utf8)
+    if dtype.is_nested() or dtype == pl.Object:
+        # No native cast for nested values; fall back to str() per cell
+        values = [None if v is None else str(v) for v in df[col].to_list()]
+        return pl.lit(pl.Series(col, values, dtype=pl.Utf8))
+    return pl.col(col).cast(pl.Utf8)
+
+
+def _metadata_expr(df: pl.DataFrame, col: str, max_len: Optional[int] = META_MAX) -> pl.Expr:
+    """Metadata value expression for one column (missing columns and nulls become "")."""
+    if col not in df.columns:
+        return pl.repeat(pl.lit(""), pl.len()).alias(col)
+    expr = _as_text(df, col).fill_null("")
+    if max_len is not None:
+        expr = expr.str.slice(0, max_len)
+    return expr.alias(col)
+
+
+def id_template_fields(id_template: str) -> List[str]:
+    """Column names referenced by an id_template (excluding {idx})."""
+    try:
+        return [field for _, field, _, _ in Formatter().parse(id_template) if field and field != "idx"]
+    except ValueError:
+        return []
+
+
+def _id_expr(
+    df: pl.DataFrame,
+    id_template: str,
+    start_idx: int = 0,
+    row_index: Optional[pl.Series] = None,
+) -> Optional[pl.Expr]:
+    """Compile a "{field}...{idx}" id_template into a pl.format expression.
+
+    Returns None when the template needs Python formatting (format specs,
+    conversions, escaped braces), in which case ids are formatted per row.
+    """
+    try:
+        parsed = list(Formatter().parse(id_template))
+    except ValueError:
+        return None
+
+    if row_index is not None:
+        idx = pl.lit(row_index)
+    else:
+        idx = pl.int_range(start_idx, start_idx + pl.len())
+
+    fmt: List[str] = []
+    args: List[pl.Expr] = []
+    for literal, field, spec, conversion in parsed:
+        if "{" in literal or "}" in literal:
+            return None
+        fmt.append(literal)
+        if field is None:
+            continue
+        if spec or conversion:
+            return None
+        if field == "idx":
+            args.append(idx)
+        elif field in df.columns:
+            args.append(_as_text(df, field).fill_null("None"))
+        else:
+            # str.format raises for every row, which falls back to chunk{idx}
+            return pl.format("chunk{}", idx)
+        fmt.append("{}")
+
+    if not args:
+        return None
+    return pl.format("".join(fmt), *args)
+
+
+def build_ids_and_metadata(
+    df: pl.DataFrame,
     metadata: List[str],
     id_template: str = "{county}#chunk{idx}",
-) -> Tuple[List[Dict[str, Any]], List[str]]:
+    max_len: Optional[int] = META_MAX,
+    start_idx: int = 0,
+    row_index: Optional[pl.Series] = None,
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+
+    """Build Pinecone vector IDs and metadata dicts from a Polars DataFrame.
 
-    """Build Pinecone vectors objects and corresponding IDs from Polars DataFrame.
+    The vectors themselves are assembled per batch inside upsert, so no
+    full list of vector dicts is ever held in memory.
 
     Args:
-        df: Polars DataFrame containing text data (rows accessed with .iter_rows(named=True))
-        dense_embeddings: dense embeddings vectors (length matches number of rows in df)
-        sparse_embeddings: sparse embedding vectors (length matches number of rows in df)
+        df: Polars DataFrame containing text data
         metadata: List columns to include in metadata
         id_template: a python format string for generating unique vector IDs
+        max_len: Truncate each metadata value to this many characters (None = no cap)
+        start_idx: Value of {idx} for the first row (when df is a slice of a larger frame)
+        row_index: Explicit {idx} value per row, e.g. row numbers from before
+            filtering; overrides start_idx
 
     Returns:
-        Tuple of (vectors, ids) where:
-            - vectors: List[dict] each with keys "id","values","sparse_values","metadata"
-            - ids: List[str] alignment list of ids (same order as vectors)
+        Tuple of (ids, metas) aligned with the rows of df
     """
 
-    if not (len(df) == len(dense_embeddings) == len(sparse_embeddings)):
-        raise ValueError("df, dense_embeddings, and sparse_embeddings must have the same length")
+    # Stringify every metadata column in one columnar pass instead of per cell
+    if metadata:
+        metas = df.select([_metadata_expr(df, col, max_len) for col in metadata]).to_dicts()
+    else:
+        metas = [{} for _ in range(len(df))]
 
+    id_expr = _id_expr(df, id_template, start_idx, row_index)
+    if id_expr is not None:
+        ids = df.select(id_expr.alias("id"))["id"].to_list()
+    else:
+        ids = []
+        idxs = row_index.to_list() if row_index is not None else range(start_idx, start_idx + len(df))
+        for idx, row in zip(idxs, df.iter_rows(named=True)):
+            try:
+                ids.append(id_template.format(**row, idx=idx))
+            except Exception:
+                ids.append(f"chunk{idx}")
 
+    return ids, metas
 
-    vectors: List[Dict[str, Any]] = []
-    ids: List[str] = []
 
-    for idx, row in enumerate(df.iter_rows(named=True)):
-        try:
-            id_str = id_template.format(**row, idx=idx)
-        except Exception:
-            id_str = f"chunk{idx}"
-
-        # Simplified metadata extraction
-        meta = {col: str(row.get(col, "")) for col in metadata}
-        
-        vectors.append({
-            "id": id_str,
-            "values": dense_embeddings[idx],
-            "sparse_values": sparse_embeddings[idx],
-            "metadata": meta
-        })
-        ids.append(id_str)
-
-    return vectors, ids
+@pinecone_retry
+def _upsert_batch(index, batch: List[Dict[str, Any]]) -> None:
+    index.upsert(vectors=batch)
 
 
 def upsert(
@@ -61,9 +145,16 @@ def upsert(
     dense_vectors: List[List[float]],
     sparse_vectors: List[Dict[str, List[float]]],
     metadata: List[Dict[str, Any]],
-    batch_size: int = 100
-) -> Dict[str, Any]:
-    """Upsert dense & sparse vectors into Pinecone index in batches."""
+    batch_size: int = 100,
+    max_concurrency: int = 8,
+    return_stats: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """Upsert dense & sparse vectors into Pinecone index in batches.
+
+    Batches are sent with up to max_concurrency requests in flight;
+    429/5xx responses are retried with exponential backoff. Index stats
+    cost an extra round-trip, so they are only fetched when return_stats is set.
+    """
 
     total = len(ids)
 
@@ -71,26 +162,26 @@ def upsert(
     if not len(dense_vectors) == total == len(sparse_vectors) == len(metadata):
         raise ValueError("dense_vectors, sparse_vectors, and metadata must have the same length as ids")
 
-    for i in tqdm(range(0, total, batch_size), desc="Upserting to Pinecone"):
-
-        
-        batch_ids = ids[i:i + batch_size]
-        
-        # Slicing logic for the other lists to match batch_ids
-        batch_dense = dense_vectors[i:i + batch_size]
-        batch_sparse = sparse_vectors[i:i + batch_size]
-        batch_meta = metadata[i:i + batch_size]
-
-        batch = []
-        for j, vec_id in enumerate(batch_ids):
-            batch.append({
-                "id": vec_id,
-                "values": batch_dense[j],
-                "sparse_values": batch_sparse[j],
-                "metadata": batch_meta[j],
-            })
-
-        if batch:
-            index.upsert(vectors=batch)
-
-    return index.describe_index_stats()
+    def upsert_batch(start: int) -> None:
+        # Assemble the vector dicts only while this batch is in flight
+        end = min(start + batch_size, total)
+        _upsert_batch(index, [
+            {
+                "id": ids[j],
+                "values": dense_vectors[j],
+                "sparse_values": sparse_vectors[j],
+                "metadata": metadata[j],
+            }
+            for j in range(start, end)
+        ])
+
+    run_concurrently(
+        upsert_batch,
+        range(0, total, batch_size),
+        max_concurrency=max_concurrency,
+        desc="Upserting to Pinecone",
+    )
+
+    if return_stats:
+        return index.describe_index_stats()
+    return None
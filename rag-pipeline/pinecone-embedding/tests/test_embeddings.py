@@ -1,8 +1,12 @@
+import time
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import polars as pl
+from pinecone.exceptions import PineconeApiException
 from rag_ingest.embed_dense import embed_dense
 from rag_ingest.embed_sparse import embed_sparse
+from rag_ingest.embed import embed_both
+from rag_ingest.batching import batched_by_tokens
 
 class TestEmbeddings(unittest.TestCase):
 
@@ -10,11 +14,12 @@ class TestEmbeddings(unittest.TestCase):
         self.mock_pc = MagicMock()
         self.df = pl.DataFrame({"chunk_text": ["doc1", "doc2"]})
 
-    def test_embed_dense_retry_logic(self):
-        """Test that dense embedding retries once on failure"""
-        # First call raises Exception, Second call returns data
+    @patch("time.sleep")
+    def test_embed_dense_retry_logic(self, mock_sleep):
+        """Test that dense embedding retries on a transient failure"""
+        # First call raises a 503, Second call returns data
         self.mock_pc.inference.embed.side_effect = [
-            Exception("API Error"),
+            PineconeApiException(status=503),
             [{"values": [0.1, 0.2]}, {"values": [0.3, 0.4]}]
         ]
 
@@ -24,6 +29,15 @@ class TestEmbeddings(unittest.TestCase):
         self.assertEqual(self.mock_pc.inference.embed.call_count, 2)
         self.assertEqual(len(res), 2)
 
+    def test_embed_dense_no_retry_on_client_error(self):
+        """Test that non-transient errors are raised without retrying"""
+        self.mock_pc.inference.embed.side_effect = PineconeApiException(status=400)
+
+        with self.assertRaises(PineconeApiException):
+            embed_dense(self.mock_pc, self.df, text_col="chunk_text", batch_size=2)
+
+        self.assertEqual(self.mock_pc.inference.embed.call_count, 1)
+
     def test_embed_sparse_success(self):
         """Test normal sparse embedding flow"""
         self.mock_pc.inference.embed.return_value = [
@@ -46,3 +60,53 @@ class TestEmbeddings(unittest.TestCase):
         embed_dense(self.mock_pc, large_df, batch_size=5)
         
         self.assertEqual(self.mock_pc.inference.embed.call_count, 2)
+
+    def test_embed_dense_concurrent_preserves_order(self):
+        """Test that concurrent batches are reassembled in input order"""
+        df = pl.DataFrame({"chunk_text": [str(i) for i in range(20)]})
+
+        def fake_embed(model, inputs, parameters):
+            # Earlier batches finish last
+            time.sleep(0.01 * (20 - int(inputs[0])) / 20)
+            return [{"values": [float(x)]} for x in inputs]
+
+        self.mock_pc.inference.embed.side_effect = fake_embed
+
+        res = embed_dense(self.mock_pc, df, batch_size=3, max_concurrency=4)
+
+        self.assertEqual(self.mock_pc.inference.embed.call_count, 7)
+        self.assertEqual(res, [[float(i)] for i in range(20)])
+
+    def test_embed_both_aligns_dense_and_sparse(self):
+        """Test that the fused pass calls each model once per batch and keeps row order"""
+        df = pl.DataFrame({"chunk_text": ["a", "b", "c"]})
+
+        def fake_embed(model, inputs, parameters):
+            if model == "dense":
+                return [{"values": [float(ord(x))]} for x in inputs]
+            return [{"sparse_indices": [ord(x)], "sparse_values": [1.0]} for x in inputs]
+
+        self.mock_pc.inference.embed.side_effect = fake_embed
+
+        dense, sparse = embed_both(
+            self.mock_pc, df, dense_model="dense", sparse_model="sparse", batch_size=2
+        )
+
+        # 2 batches x 2 models
+        self.assertEqual(self.mock_pc.inference.embed.call_count, 4)
+        self.assertEqual(dense, [[97.0], [98.0], [99.0]])
+        self.assertEqual([s["indices"] for s in sparse], [[97], [98], [99]])
+
+    def test_batched_by_tokens_packs_to_budget(self):
+        """Test that batches close on the token budget or the item cap"""
+        # 40 chars -> ~11 tokens each; 400 chars -> ~101 tokens
+        df = pl.DataFrame({"chunk_text": ["x" * 40, "x" * 40, "x" * 400, "x" * 40, "x" * 40, "x" * 40]})
+
+        self.assertEqual(
+            batched_by_tokens(df, max_tokens=25, max_items=96),
+            [(0, 2), (2, 3), (3, 5), (5, 6)],
+        )
+        self.assertEqual(
+            batched_by_tokens(df, max_tokens=None, max_items=4),
+            [(0, 4), (4, 6)],
+        )
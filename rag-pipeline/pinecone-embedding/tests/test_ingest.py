@@ -10,9 +10,8 @@ from rag_ingest import ingest
 class TestIngestPipeline(unittest.TestCase):
 
     @patch("rag_ingest.ingest.upsert")
-    @patch("rag_ingest.ingest.build_vectors_from_df")
-    @patch("rag_ingest.ingest.embed_sparse")
-    @patch("rag_ingest.ingest.embed_dense")
+    @patch("rag_ingest.ingest.build_ids_and_metadata")
+    @patch("rag_ingest.ingest.embed_both")
     @patch("rag_ingest.ingest.load_parquet_from_s3")
     @patch("rag_ingest.ingest.init_pinecone")
     @patch("rag_ingest.ingest.parse_args")
@@ -21,9 +20,8 @@ class TestIngestPipeline(unittest.TestCase):
         mock_parse_args,
         mock_init_pinecone,
         mock_load_parquet,
-        mock_embed_dense,
-        mock_embed_sparse,
-        mock_build_vectors,
+        mock_embed_both,
+        mock_build_ids,
         mock_upsert,
     ):
         # --- 1. Setup Mocks ---
@@ -35,6 +33,9 @@ class TestIngestPipeline(unittest.TestCase):
         mock_args.prefix = "data/"
         mock_args.single_key = None
         mock_args.metadata_cols = ["county", "state"]
+        mock_args.slice_rows = 5000
+        mock_args.min_chars = 1
+        mock_args.dedupe = False
         mock_parse_args.return_value = mock_args
 
         # Mock Pinecone Client & Index
@@ -53,24 +54,23 @@ class TestIngestPipeline(unittest.TestCase):
         )
         mock_load_parquet.return_value = fake_df
 
-        # Mock Embeddings
-        mock_embed_dense.return_value = [[0.1, 0.2], [0.3, 0.4]]
-        mock_embed_sparse.return_value = [
-            {"indices": [1, 2], "values": [0.5, 0.6]},
-            {"indices": [3, 4], "values": [0.7, 0.8]},
-        ]
-
-        # Mock Vector Builder
-        # (vectors, ids)
-        fake_vectors = [
-            {"id": "1", "metadata": {"county": "Alameda"}, "values": [0.1, 0.2]},
-            {"id": "2", "metadata": {"county": "San Francisco"}, "values": [0.3, 0.4]},
-        ]
+        # Mock Embeddings (dense, sparse)
+        mock_embed_both.return_value = (
+            [[0.1, 0.2], [0.3, 0.4]],
+            [
+                {"indices": [1, 2], "values": [0.5, 0.6]},
+                {"indices": [3, 4], "values": [0.7, 0.8]},
+            ],
+        )
+
+        # Mock ID + Metadata Builder
+        # (ids, metas)
+        fake_metas = [{"county": "Alameda"}, {"county": "San Francisco"}]
         fake_ids = ["1", "2"]
-        mock_build_vectors.return_value = (fake_vectors, fake_ids)
+        mock_build_ids.return_value = (fake_ids, fake_metas)
 
-        # Mock Upsert stats return
-        mock_upsert.return_value = {"upserted_count": 2}
+        # Upsert returns nothing unless stats are requested
+        mock_upsert.return_value = None
 
         # --- 2. Execute Code Under Test ---
         ingest.main()
@@ -84,22 +84,23 @@ class TestIngestPipeline(unittest.TestCase):
 
         # Verify S3 Load
         mock_load_parquet.assert_called_once_with(
-            bucket="test-bucket", prefix="data/", single_key=None, region="us-east-1"
+            bucket="test-bucket",
+            prefix="data/",
+            single_key=None,
+            region="us-east-1",
+            columns=["chunk_text", "county", "state"],
         )
 
-        # Verify Embed Dense
-        mock_embed_dense.assert_called_once()
-        # Check that the DF passed to embed_dense is our fake_df
-        call_args = mock_embed_dense.call_args
+        # Verify Embeddings (dense + sparse in one call)
+        mock_embed_both.assert_called_once()
+        # Check that the DF passed to embed_both is our fake_df
+        call_args = mock_embed_both.call_args
         self.assertTrue(call_args.kwargs["df"].equals(fake_df))
 
-        # Verify Embed Sparse
-        mock_embed_sparse.assert_called_once()
-
-        # Verify Build Vectors
-        mock_build_vectors.assert_called_once()
+        # Verify Build IDs + Metadata
+        mock_build_ids.assert_called_once()
         self.assertEqual(
-            mock_build_vectors.call_args.kwargs["metadata"], ["county", "state"]
+            mock_build_ids.call_args.kwargs["metadata"], ["county", "state"]
         )
 
         # Verify Upsert
@@ -113,8 +114,103 @@ class TestIngestPipeline(unittest.TestCase):
         self.assertEqual(upsert_kwargs["index"], mock_index)
         self.assertEqual(upsert_kwargs["metadata"], expected_metadata_list)
 
+        # Index stats are fetched once, after all slices are uploaded
+        mock_index.describe_index_stats.assert_called_once()
+
         print("\nTest Passed: Ingest pipeline flow verified.")
 
+    @patch("rag_ingest.ingest.upsert")
+    @patch("rag_ingest.ingest.embed_both")
+    @patch("rag_ingest.ingest.load_parquet_from_s3")
+    @patch("rag_ingest.ingest.init_pinecone")
+    @patch("rag_ingest.ingest.parse_args")
+    def test_main_streams_slices(
+        self,
+        mock_parse_args,
+        mock_init_pinecone,
+        mock_load_parquet,
+        mock_embed_both,
+        mock_upsert,
+    ):
+        """Each slice is embedded and upserted separately with global ids"""
+        mock_args = MagicMock()
+        mock_args.metadata_cols = ["county"]
+        mock_args.slice_rows = 2
+        mock_args.min_chars = 1
+        mock_args.dedupe = False
+        mock_parse_args.return_value = mock_args
+        mock_init_pinecone.return_value = (MagicMock(), MagicMock())
+
+        mock_load_parquet.return_value = pl.DataFrame(
+            {"chunk_text": ["a", "b", "c"], "county": ["X", "X", "Y"]}
+        )
+        mock_embed_both.side_effect = lambda df, **kwargs: (
+            [[0.0]] * len(df), [{"indices": [], "values": []}] * len(df)
+        )
+
+        ingest.main()
+
+        self.assertEqual(mock_embed_both.call_count, 2)
+        self.assertEqual(mock_upsert.call_count, 2)
+        upserted_ids = [c.kwargs["ids"] for c in mock_upsert.call_args_list]
+        self.assertEqual(upserted_ids, [["X#chunk0", "X#chunk1"], ["Y#chunk2"]])
+
+    @patch("rag_ingest.ingest.upsert")
+    @patch("rag_ingest.ingest.embed_both")
+    @patch("rag_ingest.ingest.load_parquet_from_s3")
+    @patch("rag_ingest.ingest.init_pinecone")
+    @patch("rag_ingest.ingest.parse_args")
+    def test_main_ids_stable_under_filtering(
+        self,
+        mock_parse_args,
+        mock_init_pinecone,
+        mock_load_parquet,
+        mock_embed_both,
+        mock_upsert,
+    ):
+        """Dropped chunks don't shift the ids of the chunks that remain"""
+        mock_args = MagicMock()
+        mock_args.metadata_cols = ["county"]
+        mock_args.slice_rows = 2
+        mock_args.min_chars = 1
+        mock_args.dedupe = False
+        mock_parse_args.return_value = mock_args
+        mock_init_pinecone.return_value = (MagicMock(), MagicMock())
+
+        mock_load_parquet.return_value = pl.DataFrame(
+            {"chunk_text": ["a", " ", "c", None, "e"], "county": ["X", "X", "Y", "Y", "Z"]}
+        )
+        mock_embed_both.side_effect = lambda df, **kwargs: (
+            [[0.0]] * len(df), [{"indices": [], "values": []}] * len(df)
+        )
+
+        ingest.main()
+
+        self.assertEqual(mock_embed_both.call_args_list[0].kwargs["df"].columns, ["chunk_text", "county"])
+        upserted_ids = [c.kwargs["ids"] for c in mock_upsert.call_args_list]
+        self.assertEqual(upserted_ids, [["X#chunk0", "Y#chunk2"], ["Z#chunk4"]])
+
+    def test_filter_chunks(self):
+        """Null, blank and short chunks are dropped; duplicates only with dedupe"""
+        df = pl.DataFrame(
+            {
+                "chunk_text": [
+                    "Dogs must be leashed in parks.",
+                    None,
+                    "   ",
+                    "short",
+                    "Dogs must be leashed in parks.",
+                ],
+                "county": ["A", "B", "C", "D", "E"],
+            }
+        )
+
+        kept = ingest.filter_chunks(df, "chunk_text", min_chars=16)
+        self.assertEqual(kept["county"].to_list(), ["A", "E"])
+
+        deduped = ingest.filter_chunks(df, "chunk_text", min_chars=16, dedupe=True)
+        self.assertEqual(deduped["county"].to_list(), ["A"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 from io import BytesIO
@@ -33,18 +34,12 @@ class TestS3Loader(unittest.TestCase):
         mock_boto.return_value = mock_s3
 
         # Setup Pagination responses
-        # Page 1: file1.parquet, NextToken present
-        # Page 2: file2.parquet, No NextToken
-        mock_s3.list_objects_v2.side_effect = [
-            {
-                "Contents": [{"Key": "file1.parquet"}],
-                "IsTruncated": True,
-                "NextContinuationToken": "token123"
-            },
-            {
-                "Contents": [{"Key": "file2.parquet"}],
-                "IsTruncated": False
-            }
+        # Page 1: file1.parquet (+ a non-parquet key)
+        # Page 2: file2.parquet
+        mock_paginator = mock_s3.get_paginator.return_value
+        mock_paginator.paginate.return_value = [
+            {"Contents": [{"Key": "file1.parquet"}, {"Key": "_SUCCESS"}]},
+            {"Contents": [{"Key": "file2.parquet"}]},
         ]
 
         # Mock get_object to return valid parquet bytes
@@ -56,13 +51,50 @@ class TestS3Loader(unittest.TestCase):
 
         result = load_parquet_from_s3("bucket", prefix="data/")
 
-        # Should have listed twice
-        self.assertEqual(mock_s3.list_objects_v2.call_count, 2)
+        # Should have listed through the paginator
+        mock_s3.get_paginator.assert_called_once_with("list_objects_v2")
+        mock_paginator.paginate.assert_called_once_with(Bucket="bucket", Prefix="data/")
         # Should have fetched 2 files
         self.assertEqual(mock_s3.get_object.call_count, 2)
         # Result should be length 2 (1 row + 1 row)
         self.assertEqual(len(result), 2)
 
+    @patch('boto3.client')
+    def test_single_file_column_projection(self, mock_boto):
+        """Test that only requested (and existing) columns are loaded"""
+        mock_s3 = MagicMock()
+        mock_boto.return_value = mock_s3
+
+        df = pl.DataFrame({"chunk_text": ["a"], "county": ["X"], "raw_html": ["<p>a</p>"]})
+        buf = BytesIO()
+        df.write_parquet(buf)
+        mock_s3.get_object.return_value = {'Body': MagicMock(read=lambda: buf.getvalue())}
+
+        result = load_parquet_from_s3("bucket", single_key="file.parquet", columns=["chunk_text", "county", "missing"])
+
+        self.assertEqual(result.columns, ["chunk_text", "county"])
+
+    @patch('boto3.client')
+    def test_local_cache_skips_redownload(self, mock_boto):
+        """Test that a cached shard with the same ETag is not downloaded again"""
+        mock_s3 = MagicMock()
+        mock_boto.return_value = mock_s3
+
+        df = pl.DataFrame({"col1": [1, 2]})
+        mock_s3.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "data/file1.parquet", "ETag": '"abc"'}]}
+        ]
+        mock_s3.download_file.side_effect = lambda bucket, key, path: df.write_parquet(path)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = load_parquet_from_s3("bucket", prefix="data/", cache_dir=cache_dir)
+            second = load_parquet_from_s3("bucket", prefix="data/", cache_dir=cache_dir)
+
+        self.assertEqual(mock_s3.download_file.call_count, 1)
+        mock_s3.get_object.assert_not_called()
+        self.assertTrue(first.equals(df))
+        self.assertTrue(second.equals(df))
+
     @patch('boto3.client')
     def test_no_files_found(self, mock_boto):
         """Test error raised when no parquet files exist"""
@@ -70,7 +102,7 @@ class TestS3Loader(unittest.TestCase):
         mock_boto.return_value = mock_s3
         
         # Return empty contents
-        mock_s3.list_objects_v2.return_value = {"Contents": []} # or just empty dict if key missing
+        mock_s3.get_paginator.return_value.paginate.return_value = [{"Contents": []}, {}] # or just empty dict if key missing
 
         with self.assertRaises(FileNotFoundError):
             load_parquet_from_s3("bucket", prefix="empty/")
@@ -1,6 +1,7 @@
 import unittest
-from unittest.mock import MagicMock
-from rag_ingest.upsert import upsert, build_vectors_from_df
+from unittest.mock import MagicMock, patch
+from pinecone.exceptions import PineconeApiException
+from rag_ingest.upsert import upsert, build_ids_and_metadata
 import polars as pl
 
 
@@ -34,12 +35,42 @@ class TestUpsert(unittest.TestCase):
         # Should be called 3 times: 10, 10, 5
         self.assertEqual(mock_index.upsert.call_count, 3)
 
-        # Verify last batch size
-        args, _ = mock_index.upsert.call_args
-        # args is typically passed as keyword 'vectors', so check kwargs or args[0]
+        # Verify batch sizes (batches are sent concurrently, so order is not fixed)
         # Based on your code: index.upsert(vectors=batch)
-        last_call_vectors = mock_index.upsert.call_args.kwargs["vectors"]
-        self.assertEqual(len(last_call_vectors), 5)
+        batch_sizes = sorted(len(c.kwargs["vectors"]) for c in mock_index.upsert.call_args_list)
+        self.assertEqual(batch_sizes, [5, 10, 10])
+
+    def test_upsert_stats_opt_in(self):
+        """Index stats are only fetched when return_stats is set"""
+        mock_index = MagicMock()
+        args = (mock_index, ["1"], [[0.1]], [{"indices": [], "values": []}], [{}])
+
+        self.assertIsNone(upsert(*args))
+        mock_index.describe_index_stats.assert_not_called()
+
+        stats = upsert(*args, return_stats=True)
+        self.assertIs(stats, mock_index.describe_index_stats.return_value)
+
+    @patch("time.sleep")
+    def test_upsert_retries_throttled_batch(self, mock_sleep):
+        """Should retry a batch that is rejected with 429"""
+        mock_index = MagicMock()
+        mock_index.upsert.side_effect = [PineconeApiException(status=429), None]
+
+        upsert(mock_index, ["1"], [[0.1]], [{"indices": [], "values": []}], [{}])
+
+        self.assertEqual(mock_index.upsert.call_count, 2)
+        mock_sleep.assert_called_once()
+
+    def test_upsert_does_not_retry_client_error(self):
+        """Should surface non-retryable errors immediately"""
+        mock_index = MagicMock()
+        mock_index.upsert.side_effect = PineconeApiException(status=400)
+
+        with self.assertRaises(PineconeApiException):
+            upsert(mock_index, ["1"], [[0.1]], [{"indices": [], "values": []}], [{}])
+
+        self.assertEqual(mock_index.upsert.call_count, 1)
 
     def test_build_vectors_mismatch(self):
         """Should raise error if DataFrame length doesn't match embeddings"""
@@ -47,8 +78,57 @@ class TestUpsert(unittest.TestCase):
         dense = [[1.0], [2.0]]  # Short
         sparse = [{}, {}]
 
+        ids, metas = build_ids_and_metadata(df, metadata=[])
         with self.assertRaises(ValueError):
-            build_vectors_from_df(df, dense, sparse, metadata=[])
+            upsert(MagicMock(), ids, dense, sparse, metas)
+
+    def test_build_ids_and_metadata(self):
+        """Metadata is stringified columnar; ids follow the template"""
+        df = pl.DataFrame({
+            "county": ["Alameda", None],
+            "wc": [120, 80],
+            "flag": [True, None],
+        })
+
+        ids, metas = build_ids_and_metadata(df, metadata=["county", "wc", "flag", "absent"])
+
+        self.assertEqual(ids, ["Alameda#chunk0", "None#chunk1"])
+        self.assertEqual(metas[0], {"county": "Alameda", "wc": "120", "flag": "True", "absent": ""})
+        self.assertEqual(metas[1], {"county": "", "wc": "80", "flag": "", "absent": ""})
+
+    def test_build_metadata_truncated(self):
+        """Long metadata values are capped to max_len characters"""
+        df = pl.DataFrame({"county": ["A"], "chunk_text": ["x" * 50]})
+
+        _, metas = build_ids_and_metadata(df, metadata=["chunk_text"], max_len=10)
+        self.assertEqual(metas[0]["chunk_text"], "x" * 10)
+
+        _, metas = build_ids_and_metadata(df, metadata=["chunk_text"], max_len=None)
+        self.assertEqual(metas[0]["chunk_text"], "x" * 50)
+
+    def test_build_ids_template_fallbacks(self):
+        """Templates pl.format can't express still format like str.format"""
+        df = pl.DataFrame({"county": ["A", "B"]})
+
+        ids, _ = build_ids_and_metadata(df, metadata=[], id_template="{county:>3}-{idx}")
+        self.assertEqual(ids, ["  A-0", "  B-1"])
+
+        ids, _ = build_ids_and_metadata(df, metadata=[], id_template="{state}#{idx}")
+        self.assertEqual(ids, ["chunk0", "chunk1"])
+
+    def test_build_ids_row_index(self):
+        """An explicit row_index supplies {idx} on both id formatting paths"""
+        df = pl.DataFrame({"county": ["A", "B"]})
+        row_index = pl.Series([3, 7], dtype=pl.UInt32)
+
+        ids, _ = build_ids_and_metadata(df, metadata=[], row_index=row_index, start_idx=100)
+        self.assertEqual(ids, ["A#chunk3", "B#chunk7"])
+
+        ids, _ = build_ids_and_metadata(df, metadata=[], id_template="{county:>3}-{idx}", row_index=row_index)
+        self.assertEqual(ids, ["  A-3", "  B-7"])
+
+        ids, _ = build_ids_and_metadata(df, metadata=[], id_template="{state}#{idx}", row_index=row_index)
+        self.assertEqual(ids, ["chunk3", "chunk7"])
 
 
 if __name__ == "__main__":
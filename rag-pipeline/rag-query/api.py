@@ -1,14 +1,94 @@
-from flask import Flask, request, jsonify
+import gzip
+import threading
+
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from config import Config
+from models import initialize_llm
 from pipeline import RAGPipeline
+from retrieval import initialize_pinecone
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON encoding, stdlib json otherwise
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: binary responses for clients that ask for them
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+
+def _msgpack_default(value):
+    """Convert numpy scalars/arrays, which msgpack cannot pack directly."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (serializes numpy scalars/arrays natively)."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
-# Initialize BOTH pipelines ONCE
+# Initialize BOTH pipelines ONCE, sharing one LLM and one Pinecone connection
 print("Initializing RAG Pipelines...")
-baseline_pipeline = RAGPipeline(use_reranking=False)
-hybrid_pipeline = RAGPipeline(use_reranking=True)
+Config.validate()
+pc, pinecone_index = initialize_pinecone()
+tokenizer, model = initialize_llm()
+shared = dict(tokenizer=tokenizer, model=model, pc=pc, pinecone_index=pinecone_index)
+baseline_pipeline = RAGPipeline(use_reranking=False, **shared)
+hybrid_pipeline = RAGPipeline(use_reranking=True, **shared)
 print("Pipelines ready!")
 
+# Admission control: searches beyond this many are rejected with 429 rather
+# than piling up behind the GPU, which keeps gunicorn threads free for /health
+_query_slots = threading.BoundedSemaphore(Config.MAX_CONCURRENT_QUERIES)
+
+@app.after_request
+def _gzip_response(response):
+    """
+    Gzip buffered JSON/MessagePack responses for clients that accept it;
+    chunk lists repeat every field name, so large results shrink several-fold.
+    Streamed (SSE) responses are left alone.
+    """
+    if (
+        response.status_code != 200
+        or response.is_streamed
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in ('application/json', MSGPACK_MIMETYPE)
+        or 'gzip' not in request.accept_encodings
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < Config.GZIP_MIN_BYTES:
+        return response
+
+    response.set_data(gzip.compress(body, compresslevel=5))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _busy_response():
+    return jsonify({"error": "Server busy, retry shortly"}), 429, {"Retry-After": "1"}
+
 def serialize_chunks(chunks):
     """Convert retrieved chunks to JSON-serializable format."""
     serialized = []
@@ -23,15 +103,9 @@ def serialize_chunks(chunks):
         if 'rerank_score' in chunk:
             chunk_data['rerank_score'] = float(chunk.get('rerank_score', 0))
         
-        # Add all metadata fields
+        # Add all metadata fields (numpy values are handled by the JSON provider)
         if 'metadata' in chunk:
-            metadata = chunk['metadata']
-            for key, value in metadata.items():
-                # Convert numpy types to Python types if needed
-                if hasattr(value, 'item'):  # numpy scalar
-                    chunk_data[key] = value.item()
-                else:
-                    chunk_data[key] = value
+            chunk_data.update(chunk['metadata'])
         
         serialized.append(chunk_data)
     
@@ -41,51 +115,140 @@ def serialize_chunks(chunks):
 def health():
     return jsonify({"status": "healthy", "gpu": "available"})
 
-@app.route('/query', methods=['POST'])
-def query():
-    try:
-        # Validate request has JSON data
-        if not request.json:
-            return jsonify({"error": "No JSON data provided"}), 400
+def _parse_query_request():
+    """
+    Validate a /query or /query_stream request body.
 
-        data = request.json
+    Returns:
+        ((query_text, filters, mode), None) when valid, else (None, error_response)
+    """
+    # Validate request has JSON data
+    if not request.json:
+        return None, (jsonify({"error": "No JSON data provided"}), 400)
 
-        # Extract and validate parameters
-        query_text = data.get('query', '')
-        filters = data.get('filters', {})
-        mode = data.get('mode', 'hybrid')  # Default to hybrid
+    data = request.json
 
-        # Validate query_text
-        if not isinstance(query_text, str):
-            return jsonify({"error": "query must be a string"}), 400
-        if not query_text.strip():
-            return jsonify({"error": "query cannot be empty"}), 400
+    # Extract and validate parameters
+    query_text = data.get('query', '')
+    filters = data.get('filters', {})
+    mode = data.get('mode', 'hybrid')  # Default to hybrid
 
-        # Validate filters
-        if not isinstance(filters, dict):
-            return jsonify({"error": "filters must be a dictionary"}), 400
+    # Validate query_text
+    if not isinstance(query_text, str):
+        return None, (jsonify({"error": "query must be a string"}), 400)
+    if not query_text.strip():
+        return None, (jsonify({"error": "query cannot be empty"}), 400)
 
-        # Validate mode
-        if mode not in ['hybrid', 'baseline']:
-            return jsonify({"error": "mode must be 'hybrid' or 'baseline'"}), 400
+    # Validate filters
+    if not isinstance(filters, dict):
+        return None, (jsonify({"error": "filters must be a dictionary"}), 400)
 
-        # Select pipeline based on mode
-        pipeline = hybrid_pipeline if mode == 'hybrid' else baseline_pipeline
-        llm_output, retrieved_chunks = pipeline.run(query_text, filters)
+    # Validate mode
+    if mode not in ['hybrid', 'baseline']:
+        return None, (jsonify({"error": "mode must be 'hybrid' or 'baseline'"}), 400)
+
+    return (query_text, filters, mode), None
+
+def _sse(data, event=None):
+    """Format one Server-Sent Event with a JSON data line."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {app.json.dumps(data)}\n\n"
+
+@app.route('/query', methods=['POST'])
+def query():
+    try:
+        parsed, error = _parse_query_request()
+        if error is not None:
+            return error
+        query_text, filters, mode = parsed
+
+        if not _query_slots.acquire(blocking=False):
+            return _busy_response()
+        try:
+            # Select pipeline based on mode
+            pipeline = hybrid_pipeline if mode == 'hybrid' else baseline_pipeline
+            llm_output, retrieved_chunks = pipeline.run(query_text, filters)
+        finally:
+            _query_slots.release()
 
         # Serialize chunks to JSON-safe format
         serialized_chunks = serialize_chunks(retrieved_chunks)
 
-        return jsonify({
+        payload = {
             "response": llm_output,
             "chunks": serialized_chunks,
             "mode": mode
-        })
+        }
+
+        # MessagePack when the client prefers it (smaller, no float formatting); JSON by default
+        if msgpack is not None and request.accept_mimetypes.best_match(
+            ['application/json', MSGPACK_MIMETYPE]
+        ) == MSGPACK_MIMETYPE:
+            return Response(msgpack.packb(payload, default=_msgpack_default, use_bin_type=True), mimetype=MSGPACK_MIMETYPE)
+
+        return jsonify(payload)
 
     except Exception as e:
         # Log the error and return a 500 response
         print(f"Error processing query: {str(e)}")
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+@app.route('/query_stream', methods=['POST'])
+def query_stream():
+    """
+    Same request as /query, answered as Server-Sent Events: a "chunks" event
+    with the retrieved chunks, then one data event per piece of LLM output
+    as it is generated, then a "done" event.
+    """
+    try:
+        parsed, error = _parse_query_request()
+        if error is not None:
+            return error
+        query_text, filters, mode = parsed
+
+        if not _query_slots.acquire(blocking=False):
+            return _busy_response()
+
+    except Exception as e:
+        print(f"Error processing query: {str(e)}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+    try:
+        # Retrieval runs now, so its errors still get a normal 500 response
+        pipeline = hybrid_pipeline if mode == 'hybrid' else baseline_pipeline
+        llm_stream, retrieved_chunks = pipeline.run_stream(query_text, filters)
+        chunks_event = _sse({"chunks": serialize_chunks(retrieved_chunks), "mode": mode}, event="chunks")
+
+    except Exception as e:
+        _query_slots.release()
+        print(f"Error processing query: {str(e)}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+    def events():
+        try:
+            yield chunks_event
+            for text in llm_stream:
+                if text:
+                    yield _sse({"token": text})
+            yield _sse({}, event="done")
+        except Exception as e:
+            # Headers are already sent, so report the failure in-stream
+            print(f"Error streaming response: {str(e)}")
+            yield _sse({"error": f"Internal server error: {str(e)}"}, event="error")
+        finally:
+            # Closing the LLM stream stops generation and waits for it to
+            # exit, so the slot below is only released once the GPU is free
+            llm_stream.close()
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # The slot is held until the stream finishes or the client disconnects
+    # (events() has closed the LLM stream by then)
+    response.call_on_close(_query_slots.release)
+    return response
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000)
\ No newline at end of file
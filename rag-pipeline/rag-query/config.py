@@ -22,6 +22,7 @@ class Config:
     EMBEDDING_MODEL_DENSE: str = "llama-text-embed-v2"
     EMBEDDING_MODEL_SPARSE: str = "pinecone-sparse-english-v0"
     RERANKER_MODEL_ID: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANKER_ONNX_PATH: str = os.getenv("RERANKER_ONNX_PATH", "")  # export_reranker.py output; empty = PyTorch
     
     # Quantization Settings
     LOAD_IN_4BIT: bool = True
@@ -33,13 +34,30 @@ class Config:
     HYBRID_TOP_K: int = 100
     FILTER_ONLY_TOP_K: int = 1000
     RERANK_TOP_N: int = 5
+    PINECONE_MAX_TOP_K: int = 1000  # Largest top_k Pinecone accepts with include_metadata
+    RETRIEVAL_MAX_WORKERS: int = 16  # Per-location Pinecone queries in flight at once
+    EMBEDDING_CACHE_SIZE: int = 512  # Distinct query embeddings kept per process
+    RETRIEVAL_CACHE_SIZE: int = 256  # Distinct (query, filters) results kept per pipeline
+    RETRIEVAL_CACHE_TTL: int = 300  # Seconds before a cached result is fetched again
+    RERANK_BATCH_SIZE: int = 64
+    RERANK_HALF_PRECISION: bool = True  # FP16 cross-encoder weights when running on GPU
+    RERANK_CACHE_SIZE: int = 50000  # (query, chunk id) rerank scores kept per process
+    RERANK_CACHE_TTL: int = 3600  # Seconds before a cached rerank score is recomputed
     
     # LLM Generation Settings
     MAX_NEW_TOKENS: int = 1024
     DO_SAMPLE: bool = False
+    LLM_MAX_BATCH: int = 8  # Concurrent requests generated together in one batch
+    LLM_BATCH_WAIT_MS: int = 10  # How long the first request waits for others to join
+    
+    # API Configuration
+    # Searches the API runs at once; more get HTTP 429 instead of queueing on the GPU
+    MAX_CONCURRENT_QUERIES: int = int(os.getenv("API_MAX_CONCURRENT_QUERIES", "6"))
+    GZIP_MIN_BYTES: int = 1024  # Smaller /query responses are sent uncompressed
     
     # Output Configuration
     OUTPUT_DIR: str = "outputs"
+    DEBUG: bool = os.getenv("RAG_DEBUG", "") == "1"  # Print full retrieved-chunk tables per query
     # BASELINE_CSV_FILENAME: str = "baseline_retrieval_output.csv"
     # BASELINE_FILTER_CSV_FILENAME: str = "baseline_filter_only_output.csv"
     # HYBRID_CSV_FILENAME: str = "hybrid_retrieval_output.csv"
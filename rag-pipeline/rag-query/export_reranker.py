@@ -0,0 +1,101 @@
+"""
+One-time export of the reranker CrossEncoder to ONNX for ONNX Runtime inference.
+
+Usage:
+    python export_reranker.py onnx-reranker/ [--int8]
+    RERANKER_ONNX_PATH=onnx-reranker/ gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import argparse
+import os
+
+import torch
+from sentence_transformers.cross_encoder import CrossEncoder
+
+from config import Config
+
+
+class _ScoreModel(torch.nn.Module):
+    """Classifier logits followed by the CrossEncoder's activation, as predict() returns them."""
+
+    def __init__(self, model: torch.nn.Module, activation: torch.nn.Module):
+        super().__init__()
+        self.model = model
+        self.activation = activation
+        self.single_label = model.config.num_labels == 1
+
+    def forward(self, input_ids, attention_mask, token_type_ids=None):
+        logits = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids
+        ).logits
+        scores = self.activation(logits)
+        return scores.squeeze(-1) if self.single_label else scores
+
+
+def export_reranker(output_dir: str, int8: bool = False) -> str:
+    """
+    Export Config.RERANKER_MODEL_ID to output_dir/model.onnx with dynamic
+    batch and sequence dimensions, next to the tokenizer files.
+
+    Args:
+        output_dir: Directory to write the model and tokenizer to
+        int8: Also apply dynamic INT8 quantization (for CPU inference)
+
+    Returns:
+        Path of the written ONNX model
+    """
+    print(f"Loading reranker model: {Config.RERANKER_MODEL_ID}")
+    reranker_model = CrossEncoder(Config.RERANKER_MODEL_ID, device="cpu")
+    max_length = getattr(reranker_model, "max_seq_length", None) or reranker_model.max_length
+    activation = (
+        getattr(reranker_model, "activation_fn", None)
+        or getattr(reranker_model, "default_activation_function", None)
+        or torch.nn.Identity()
+    )
+    score_model = _ScoreModel(reranker_model.model, activation).eval()
+
+    # The tokenizer is saved with the CrossEncoder's max length so inference truncates the same way
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = reranker_model.tokenizer
+    tokenizer.model_max_length = max_length
+    tokenizer.save_pretrained(output_dir)
+
+    features = tokenizer(["example query"], ["example chunk text"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in features]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["scores"] = {0: "batch"}
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    print(f"Exporting to {model_path}...")
+    torch.onnx.export(
+        score_model,
+        tuple(features[name] for name in input_names),
+        model_path,
+        input_names=input_names,
+        output_names=["scores"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17
+    )
+
+    if int8:
+        import onnx
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print("Quantizing weights to INT8...")
+        # Intermediate shapes recorded from the batch-1 example trip the quantizer's
+        # shape inference; drop them and let it re-infer with the dynamic axes
+        onnx_model = onnx.load(model_path)
+        del onnx_model.graph.value_info[:]
+        onnx.save(onnx_model, model_path)
+        quantize_dynamic(model_path, model_path, weight_type=QuantType.QInt8)
+
+    print(f"Reranker exported. Set RERANKER_ONNX_PATH={output_dir} to use it.")
+    return model_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the reranker to ONNX")
+    parser.add_argument("output_dir", help="Directory for model.onnx and the tokenizer files")
+    parser.add_argument("--int8", action="store_true", help="Dynamic INT8 quantization (CPU inference)")
+    args = parser.parse_args()
+    export_reranker(args.output_dir, int8=args.int8)
@@ -1,7 +1,7 @@
 """
 Filter processing utilities for RAG pipeline.
 """
-from typing import Dict, List, Any
+from typing import Any, Callable, Dict, List, Optional
 
 
 def flatten_locations_payload(filters_payload: dict) -> dict:
@@ -19,14 +19,13 @@ def flatten_locations_payload(filters_payload: dict) -> dict:
     normalized_filters = filters_payload.copy()
     nested_locations = normalized_filters.pop("locations", [])
 
-    flat_locations = []
-    if nested_locations:
-        print("\n--- Flattening nested location payload ---")
-        for loc_group in nested_locations:
-            state = loc_group['state']
-            for county in loc_group['county']:
-                flat_locations.append({"state": state, "county": county})
-                print(f"Added to queue: (state={state}, county={county})")
+    flat_locations = [
+        {"state": loc_group['state'], "county": county}
+        for loc_group in nested_locations
+        for county in loc_group['county']
+    ]
+    if flat_locations:
+        print(f"\n--- Flattened nested location payload: {len(flat_locations)} locations ---")
 
     # Add flattened list back into the filters
     normalized_filters['locations'] = flat_locations
@@ -34,6 +33,42 @@ def flatten_locations_payload(filters_payload: dict) -> dict:
     return normalized_filters
 
 
+def _multi_select(value: Any) -> Optional[dict]:
+    """Multi-select fields (e.g., state, county): match any of the chosen values."""
+    if isinstance(value, list) and len(value) > 0:
+        return {"$in": value}
+    return None
+
+
+def _binary(value: Any) -> Optional[dict]:
+    """Binary Y/N fields."""
+    if value in ('Y', 'N'):
+        return {"$eq": value}
+    return None
+
+
+def _numeric(value: Any) -> Optional[dict]:
+    """Numeric fields: optional inclusive min/max range."""
+    range_query = {}
+    if 'min' in value and value['min'] is not None:
+        range_query["$gte"] = value['min']
+    if 'max' in value and value['max'] is not None:
+        range_query["$lte"] = value['max']
+    return range_query or None  # Only add if min or max was set
+
+
+MULTI_SELECT_FIELDS = frozenset({'state', 'county'})
+BINARY_FIELDS = frozenset({'penalty', 'obligation', 'permission', 'prohibition'})
+NUMERIC_FIELDS = frozenset({'fk_grade', 'fre', 'wc', 'pct_complex'})
+
+# Frontend filter key -> handler returning the Pinecone condition (or None to skip)
+_FILTER_HANDLERS: Dict[str, Callable[[Any], Optional[dict]]] = {
+    **dict.fromkeys(MULTI_SELECT_FIELDS, _multi_select),
+    **dict.fromkeys(BINARY_FIELDS, _binary),
+    **dict.fromkeys(NUMERIC_FIELDS, _numeric),
+}
+
+
 def build_pinecone_filter(frontend_filters: dict) -> dict:
     """
     Converts a JSON filter object from the frontend into a
@@ -45,31 +80,13 @@ def build_pinecone_filter(frontend_filters: dict) -> dict:
     Returns:
         Pinecone-compatible filter dictionary
     """
-    multi_select_fields = ['state', 'county']
-    binary_fields = ['penalty', 'obligation', 'permission', 'prohibition']
-    numeric_fields = ['fk_grade', 'fre', 'wc', 'pct_complex']
-
     pinecone_filter = {}
     for key, value in frontend_filters.items():
-        # --- Handle Multi-Select fields (e.g., state, county) ---
-        if key in multi_select_fields:
-            if isinstance(value, list) and len(value) > 0:
-                pinecone_filter[key] = {"$in": value}
-
-        # --- Handle Binary Y/N fields ---
-        elif key in binary_fields:
-            if value in ('Y', 'N'):
-                pinecone_filter[key] = {"$eq": value}
-
-        # --- Handle Numeric fields ---
-        elif key in numeric_fields:
-            range_query = {}
-            if 'min' in value and value['min'] is not None:
-                range_query["$gte"] = value['min']
-            if 'max' in value and value['max'] is not None:
-                range_query["$lte"] = value['max']
-
-            if range_query:  # Only add if min or max was set
-                pinecone_filter[key] = range_query
+        handler = _FILTER_HANDLERS.get(key)
+        if handler is None:
+            continue
+        condition = handler(value)
+        if condition is not None:
+            pinecone_filter[key] = condition
 
     return pinecone_filter
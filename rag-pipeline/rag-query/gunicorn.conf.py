@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration for the RAG Query API.
+
+One worker process holds the models on the GPU; its threads share the
+pipelines, so retrieval, filtering and serialization for one request
+overlap with LLM generation for another.
+"""
+import os
+
+bind = "0.0.0.0:8000"
+
+# A second worker would load another copy of every model onto the GPU
+workers = 1
+worker_class = "gthread"
+threads = int(os.getenv("API_THREADS", "8"))
+
+# LLM generation can take well over gunicorn's 30s default
+timeout = int(os.getenv("API_TIMEOUT", "300"))
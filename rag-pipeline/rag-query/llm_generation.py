@@ -1,12 +1,300 @@
 """
 LLM generation utilities for RAG pipeline.
 """
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
 import torch
-from typing import List, Dict, Any, Optional
+from transformers import DynamicCache, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from typing import Iterator, List, Dict, Any, Optional
 
 from config import Config
 
 
+# Static system prompts, shared by every query
+SYSTEM_PROMPT = """
+    You are a highly intelligent legal analyst. Your goal is to help a user understand the legal information provided.
+    You will be given the user's original question and a list of 'Retrieved Chunks' from a legal database.
+
+    Your task is to generate a natural language response. You MUST follow these rules:
+    1. Base your answer *ONLY* on the information inside the "Retrieved Chunks". Do not use any outside knowledge.
+    2. Use the 'Score, State, County, Section, Tags' fields for quick understanding, but use the full 'Text' field to find the specific answer.
+    3. If the chunks do not contain a clear answer to the user's question, you MUST respond *only* with the text: 'The information was not found in the provided documents.'
+    4. If the chunks *do* contain an answer, summarize it and use the template below to explain the generation process.
+
+    ---
+    TEMPLATE FOR A SUCCESSFUL ANSWER:
+    ### Summary of Findings
+    [Your summary of the answer found in the chunks. Cite the chunks, e.g., "The law prohibits owners from letting their dog disturb the peace [Chunk 1]."]
+
+    ### How This Was Generated
+    To answer your question, this tool performed a search on the UnBarred 2.0 legal database. The "Retrieved Chunks" (which are provided in your CSV file) represent the top 10 most relevant sections of the law found by our search. This summary is based *only* on the information in those chunks. You can review the full text of each chunk in the CSV to verify the information for yourself.
+    ---
+  """
+
+FILTER_ONLY_SYSTEM_PROMPT = """
+    You are a highly intelligent legal analyst.
+    You will be given a *sample* of the top-retrieved legal documents.
+    Your task is to **provide a high-level summary of the main themes** found in this sample.
+
+    - DO NOT try to answer a question.
+    - DO NOT say "I cannot find an answer."
+    - Simply summarize what you see. Group similar topics together.
+    - Start your response with: "The documents in this sample primarily discuss..."
+  """
+
+# Serializes generate calls from different models' batchers sharing the GPU
+_GENERATE_LOCK = threading.Lock()
+
+# Binary metadata flags surfaced as tags in the LLM context, in display order
+_TAG_FIELDS = (
+    ('obligation', 'Obligation'),
+    ('penalty', 'Penalty'),
+    ('permission', 'Permission'),
+    ('prohibition', 'Prohibition'),
+)
+
+# Stand-in for the user turn when splitting the rendered chat template
+_USER_SLOT = "<<USER_PROMPT>>"
+
+
+class ChatPrompt:
+    """
+    Chat template for one system prompt, tokenized once per pipeline.
+
+    The system turn and the template scaffolding around the user turn are
+    tokenized up front, so each query only tokenizes its own user prompt.
+    With a model, the system turn is also prefilled once and its KV cache
+    reused, so generation only runs prefill over the per-query tokens.
+    """
+
+    def __init__(self, tokenizer: Any, system_prompt: str, model: Optional[Any] = None):
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f" {_USER_SLOT} "},
+        ]
+        rendered = tokenizer.apply_chat_template(
+            messages,
+            add_generation_prompt=True,
+            tokenize=False
+        )
+
+        # Templates that trim message content (e.g. Llama 3.1) drop the padding around the slot
+        self.trim_user = f" {_USER_SLOT} " not in rendered
+        slot = _USER_SLOT if self.trim_user else f" {_USER_SLOT} "
+        prefix, suffix = rendered.split(slot)
+
+        self.prefix_ids = self._encode(tokenizer, prefix)
+        self.suffix_ids = self._encode(tokenizer, suffix)
+
+        self.prefix_cache = None
+        if model is not None:
+            with torch.no_grad():
+                self.prefix_cache = model(
+                    self.prefix_ids.to(model.device),
+                    past_key_values=DynamicCache(),
+                    use_cache=True
+                ).past_key_values
+
+    @staticmethod
+    def _encode(tokenizer: Any, text: str) -> torch.Tensor:
+        # The rendered template already contains the special tokens
+        return tokenizer(text, add_special_tokens=False, return_tensors="pt").input_ids
+
+    def build_input_ids(self, tokenizer: Any, user_prompt: str) -> torch.Tensor:
+        """Token ids for the full chat (system + user + generation prompt), shape (1, seq_len)."""
+        if self.trim_user:
+            user_prompt = user_prompt.strip()
+        user_ids = self._encode(tokenizer, user_prompt)
+        return torch.cat([self.prefix_ids, user_ids, self.suffix_ids], dim=1)
+
+    def new_cache(self) -> Optional[DynamicCache]:
+        """Private copy of the system-prefix KV cache (generate extends it in place), or None."""
+        if self.prefix_cache is None:
+            return None
+        return copy.deepcopy(self.prefix_cache)
+
+
+
+class _StopOnEvent(StoppingCriteria):
+    """Stops generate at the next decoding step once the event is set."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class GenerateBatcher:
+    """
+    Runs concurrent generate calls on one model as a single padded batch.
+
+    Requests that arrive within Config.LLM_BATCH_WAIT_MS of each other (up
+    to Config.LLM_MAX_BATCH) and share a ChatPrompt go through one
+    model.generate call. Decoding one sequence at a time leaves the GPU
+    mostly idle, so concurrent API requests finish together instead of
+    queueing behind each other.
+    """
+
+    def __init__(self, tokenizer: Any, model: Any):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = model.device
+        self.max_batch = Config.LLM_MAX_BATCH
+        self.max_wait = Config.LLM_BATCH_WAIT_MS / 1000
+
+        # Resolved once per model rather than on every request
+        self.pad_token_id = tokenizer.eos_token_id
+        self.terminators = [
+            tokenizer.eos_token_id,
+            tokenizer.convert_tokens_to_ids("<|eot_id|>")
+        ]
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._worker.start()
+
+    def generate(self, chat_prompt: ChatPrompt, input_ids: torch.Tensor) -> torch.Tensor:
+        """Generated token ids (prompt excluded) for one chat; blocks until its batch finishes."""
+        future = Future()
+        self._queue.put((chat_prompt, input_ids, future))
+        return future.result()
+
+    def stream(self, chat_prompt: ChatPrompt, input_ids: torch.Tensor) -> Iterator[str]:
+        """
+        Yield decoded text for one chat as it is generated.
+
+        Streaming runs its own batch-size-1 generate call (the streamer only
+        supports one sequence), still serialized with other generate calls.
+        Closing the iterator early (client disconnect) stops generation at
+        the next token and returns once the generate thread has exited.
+        """
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stop = threading.Event()
+        errors = []
+
+        def run() -> None:
+            try:
+                with _GENERATE_LOCK:
+                    if stop.is_set():  # abandoned while waiting for the lock
+                        return
+                    self.model.generate(
+                        input_ids.to(self.device),
+                        attention_mask=torch.ones_like(input_ids).to(self.device),
+                        pad_token_id=self.pad_token_id,
+                        past_key_values=chat_prompt.new_cache(),
+                        max_new_tokens=Config.MAX_NEW_TOKENS,
+                        eos_token_id=self.terminators,
+                        do_sample=Config.DO_SAMPLE,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop)])
+                    )
+            except BaseException as e:
+                errors.append(e)
+                streamer.end()  # unblock the consumer
+
+        thread = threading.Thread(target=run, name="llm-stream", daemon=True)
+        thread.start()
+        try:
+            yield from streamer
+        finally:
+            # On GeneratorExit this stops an abandoned generate instead of
+            # letting it run to MAX_NEW_TOKENS while holding _GENERATE_LOCK
+            stop.set()
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            # Only chats with the same system prompt can share its prefix cache
+            groups: Dict[int, list] = {}
+            for item in batch:
+                groups.setdefault(id(item[0]), []).append(item)
+
+            for items in groups.values():
+                futures = [future for _, _, future in items]
+                try:
+                    outputs = self._generate_batch(items[0][0], [ids for _, ids, _ in items])
+                except BaseException as e:
+                    for future in futures:
+                        future.set_exception(e)
+                else:
+                    for future, output in zip(futures, outputs):
+                        future.set_result(output)
+
+    def _generate_batch(self, chat_prompt: ChatPrompt, rows: List[torch.Tensor]) -> List[torch.Tensor]:
+        # Keep the shared system prefix in place and pad between it and each
+        # row's own tokens, so the cached prefix lines up for every row
+        prefix_len = chat_prompt.prefix_ids.shape[-1]
+        tails = [ids[0, prefix_len:] for ids in rows]
+        width = max(len(tail) for tail in tails)
+
+        input_ids = torch.full((len(rows), prefix_len + width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        input_ids[:, :prefix_len] = chat_prompt.prefix_ids
+        attention_mask[:, :prefix_len] = 1
+        for i, tail in enumerate(tails):
+            input_ids[i, prefix_len + width - len(tail):] = tail
+            attention_mask[i, prefix_len + width - len(tail):] = 1
+
+        cache = chat_prompt.new_cache()
+        if cache is not None and len(rows) > 1:
+            cache.batch_repeat_interleave(len(rows))
+
+        with _GENERATE_LOCK:
+            outputs = self.model.generate(
+                input_ids.to(self.device),
+                attention_mask=attention_mask.to(self.device),
+                pad_token_id=self.pad_token_id,
+                past_key_values=cache,
+                max_new_tokens=Config.MAX_NEW_TOKENS,
+                eos_token_id=self.terminators,
+                do_sample=Config.DO_SAMPLE
+            )
+
+        return list(outputs[:, input_ids.shape[-1]:])
+
+
+# One batcher and one set of chat prompts per loaded model; models live for the life of the process
+_BATCHERS: Dict[int, GenerateBatcher] = {}
+_CHAT_PROMPTS: Dict[tuple, ChatPrompt] = {}
+_BATCHERS_LOCK = threading.Lock()
+
+
+def get_chat_prompt(tokenizer: Any, model: Any, system_prompt: str) -> ChatPrompt:
+    """Return the shared, prefilled ChatPrompt for a model and system prompt, building it on first use."""
+    key = (id(model), system_prompt)
+    with _BATCHERS_LOCK:
+        chat_prompt = _CHAT_PROMPTS.get(key)
+        if chat_prompt is None:
+            chat_prompt = _CHAT_PROMPTS[key] = ChatPrompt(tokenizer, system_prompt, model)
+    return chat_prompt
+
+
+def get_batcher(tokenizer: Any, model: Any) -> GenerateBatcher:
+    """Return the shared GenerateBatcher for a model, creating it on first use."""
+    with _BATCHERS_LOCK:
+        batcher = _BATCHERS.get(id(model))
+        if batcher is None:
+            batcher = _BATCHERS[id(model)] = GenerateBatcher(tokenizer, model)
+    return batcher
+
 def build_context_string(retrieved_chunks: List[dict], max_chunks: Optional[int] = None) -> str:
     """
     Send only useful metadata to the LLM.
@@ -18,7 +306,6 @@ def build_context_string(retrieved_chunks: List[dict], max_chunks: Optional[int]
     Returns:
         Formatted context string for LLM
     """
-    context_string = ""
     if not retrieved_chunks:
         return "No documents were retrieved."
 
@@ -26,6 +313,9 @@ def build_context_string(retrieved_chunks: List[dict], max_chunks: Optional[int]
     if max_chunks is not None:  # filter-only search, only send the first N chunks to LLM
         matches_to_process = matches_to_process[:max_chunks]
 
+    # Collect the pieces and join once, rather than re-copying the string per +=
+    parts = []
+    append = parts.append
     for i, match in enumerate(matches_to_process):
         metadata = match.get('metadata', {})
         score = match.get('score', 0)
@@ -35,32 +325,59 @@ def build_context_string(retrieved_chunks: List[dict], max_chunks: Optional[int]
         county = metadata.get('county', 'N/A')
         section = metadata.get('section', 'N/A')
 
-        tags = []
-        if metadata.get('obligation') == 'Y':
-            tags.append("Obligation")
-        if metadata.get('penalty') == 'Y':
-            tags.append("Penalty")
-        if metadata.get('permission') == 'Y':
-            tags.append("Permission")
-        if metadata.get('prohibition') == 'Y':
-            tags.append("Prohibition")
+        tags = [label for field, label in _TAG_FIELDS if metadata.get(field) == 'Y']
 
         # --- Build the new, enriched context string ---
-        context_string += f"[Chunk {i+1}]\n"
-        context_string += f"Score: {score:.4f}\n"
-        context_string += f"State: {state}\n"
-        context_string += f"County: {county}\n"
-        context_string += f"Section: {section}\n"
+        append(
+            f"[Chunk {i+1}]\n"
+            f"Score: {score:.4f}\n"
+            f"State: {state}\n"
+            f"County: {county}\n"
+            f"Section: {section}\n"
+        )
 
         if tags:
-            context_string += f"Tags: {', '.join(tags)}\n"
+            append(f"Tags: {', '.join(tags)}\n")
 
-        context_string += f"Text: \"{chunk_text}\"\n\n"
+        append(f"Text: \"{chunk_text}\"\n\n")
 
-    return context_string
+    return "".join(parts)
+
+def _answer_user_prompt(query_text: str, context_string: str) -> str:
+    """User turn for standard search queries."""
+    return f"""
+    **User's Question:**
+    {query_text}
+
+    **Retrieved Chunks:**
+    {context_string}
+  """
 
 
-def generate_llm_response(query_text: str, context_string: str, tokenizer: Any, model: Any) -> str:
+def _summary_user_prompt(context_string: str) -> str:
+    """User turn for filter-only searches."""
+    return f"""
+    **Retrieved Chunks (Sample):**
+    {context_string}
+  """
+
+
+def _summary_header(num_total_chunks: int) -> str:
+    """Fixed lead-in placed before the LLM's filter-only summary."""
+    return (
+        f"Found {num_total_chunks} laws matching your filters. "
+        f"A full list is available in the generated CSV file.\n\n"
+        f"Here is a quick summary of the first 10 results:\n\n"
+    )
+
+
+def generate_llm_response(
+    query_text: str,
+    context_string: str,
+    tokenizer: Any,
+    model: Any,
+    chat_prompt: Optional[ChatPrompt] = None
+) -> str:
     """
     Generate LLM response for standard search queries.
     
@@ -69,67 +386,17 @@ def generate_llm_response(query_text: str, context_string: str, tokenizer: Any,
         context_string: Context from retrieved chunks
         tokenizer: LLM tokenizer
         model: LLM model
+        chat_prompt: Pre-tokenized SYSTEM_PROMPT template (built per call if omitted)
         
     Returns:
         Generated response text
     """
-    system_prompt = """
-    You are a highly intelligent legal analyst. Your goal is to help a user understand the legal information provided.
-    You will be given the user's original question and a list of 'Retrieved Chunks' from a legal database.
-
-    Your task is to generate a natural language response. You MUST follow these rules:
-    1. Base your answer *ONLY* on the information inside the "Retrieved Chunks". Do not use any outside knowledge.
-    2. Use the 'Score, State, County, Section, Tags' fields for quick understanding, but use the full 'Text' field to find the specific answer.
-    3. If the chunks do not contain a clear answer to the user's question, you MUST respond *only* with the text: 'The information was not found in the provided documents.'
-    4. If the chunks *do* contain an answer, summarize it and use the template below to explain the generation process.
-
-    ---
-    TEMPLATE FOR A SUCCESSFUL ANSWER:
-    ### Summary of Findings
-    [Your summary of the answer found in the chunks. Cite the chunks, e.g., "The law prohibits owners from letting their dog disturb the peace [Chunk 1]."]
-
-    ### How This Was Generated
-    To answer your question, this tool performed a search on the UnBarred 2.0 legal database. The "Retrieved Chunks" (which are provided in your CSV file) represent the top 10 most relevant sections of the law found by our search. This summary is based *only* on the information in those chunks. You can review the full text of each chunk in the CSV to verify the information for yourself.
-    ---
-  """
-
-    user_prompt = f"""
-    **User's Question:**
-    {query_text}
-
-    **Retrieved Chunks:**
-    {context_string}
-  """
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ]
-
-    input_ids = tokenizer.apply_chat_template(
-        messages,
-        add_generation_prompt=True,
-        return_tensors="pt"
-    ).to(model.device)
-
-    terminators = [
-        tokenizer.eos_token_id,
-        tokenizer.convert_tokens_to_ids("<|eot_id|>")
-    ]
-
-    attention_mask = torch.ones_like(input_ids).to(model.device)
-    pad_token_id = tokenizer.eos_token_id
-
-    outputs = model.generate(
-        input_ids,
-        attention_mask=attention_mask,
-        pad_token_id=pad_token_id,
-        max_new_tokens=Config.MAX_NEW_TOKENS,
-        eos_token_id=terminators,
-        do_sample=Config.DO_SAMPLE
-    )
+    if chat_prompt is None:
+        chat_prompt = ChatPrompt(tokenizer, SYSTEM_PROMPT)
+    input_ids = chat_prompt.build_input_ids(tokenizer, _answer_user_prompt(query_text, context_string))
 
-    response = outputs[0][input_ids.shape[-1]:]
+    # Batched with any other requests generating at the same time
+    response = get_batcher(tokenizer, model).generate(chat_prompt, input_ids)
     response_text = tokenizer.decode(response, skip_special_tokens=True)
 
     return response_text
@@ -140,7 +407,8 @@ def generate_llm_response_filter_only_search(
     context_string: str, 
     tokenizer: Any, 
     model: Any, 
-    num_total_chunks: int
+    num_total_chunks: int,
+    chat_prompt: Optional[ChatPrompt] = None
 ) -> str:
     """
     Generate LLM response for filter-only searches.
@@ -151,62 +419,53 @@ def generate_llm_response_filter_only_search(
         tokenizer: LLM tokenizer
         model: LLM model
         num_total_chunks: Total number of chunks retrieved
+        chat_prompt: Pre-tokenized FILTER_ONLY_SYSTEM_PROMPT template (built per call if omitted)
         
     Returns:
         Generated response text with summary
     """
-    system_prompt = """
-    You are a highly intelligent legal analyst.
-    You will be given a *sample* of the top-retrieved legal documents.
-    Your task is to **provide a high-level summary of the main themes** found in this sample.
+    if chat_prompt is None:
+        chat_prompt = ChatPrompt(tokenizer, FILTER_ONLY_SYSTEM_PROMPT)
+    input_ids = chat_prompt.build_input_ids(tokenizer, _summary_user_prompt(context_string))
 
-    - DO NOT try to answer a question.
-    - DO NOT say "I cannot find an answer."
-    - Simply summarize what you see. Group similar topics together.
-    - Start your response with: "The documents in this sample primarily discuss..."
-  """
+    # Batched with any other requests generating at the same time
+    response = get_batcher(tokenizer, model).generate(chat_prompt, input_ids)
+    response_text = tokenizer.decode(response, skip_special_tokens=True)
 
-    user_prompt = f"""
-    **Retrieved Chunks (Sample):**
-    {context_string}
-  """
+    return _summary_header(num_total_chunks) + response_text
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ]
-
-    input_ids = tokenizer.apply_chat_template(
-        messages,
-        add_generation_prompt=True,
-        return_tensors="pt"
-    ).to(model.device)
-
-    terminators = [
-        tokenizer.eos_token_id,
-        tokenizer.convert_tokens_to_ids("<|eot_id|>")
-    ]
-
-    attention_mask = torch.ones_like(input_ids).to(model.device)
-    pad_token_id = tokenizer.eos_token_id
-
-    outputs = model.generate(
-        input_ids,
-        attention_mask=attention_mask,
-        pad_token_id=pad_token_id,
-        max_new_tokens=Config.MAX_NEW_TOKENS,
-        eos_token_id=terminators,
-        do_sample=Config.DO_SAMPLE
-    )
 
-    response = outputs[0][input_ids.shape[-1]:]
-    response_text = tokenizer.decode(response, skip_special_tokens=True)
+def stream_llm_response(
+    query_text: str,
+    context_string: str,
+    tokenizer: Any,
+    model: Any,
+    chat_prompt: Optional[ChatPrompt] = None
+) -> Iterator[str]:
+    """
+    Streaming variant of generate_llm_response: yields the answer text as it is generated.
+    """
+    if chat_prompt is None:
+        chat_prompt = ChatPrompt(tokenizer, SYSTEM_PROMPT)
+    input_ids = chat_prompt.build_input_ids(tokenizer, _answer_user_prompt(query_text, context_string))
 
-    llm_output = (
-        f"Found {num_total_chunks} laws matching your filters. "
-        f"A full list is available in the generated CSV file.\n\n"
-        f"Here is a quick summary of the first 10 results:\n\n"
-        f"{response_text}"
-    )
+    yield from get_batcher(tokenizer, model).stream(chat_prompt, input_ids)
+
+
+def stream_llm_response_filter_only_search(
+    query_text: str,
+    context_string: str,
+    tokenizer: Any,
+    model: Any,
+    num_total_chunks: int,
+    chat_prompt: Optional[ChatPrompt] = None
+) -> Iterator[str]:
+    """
+    Streaming variant of generate_llm_response_filter_only_search.
+    """
+    if chat_prompt is None:
+        chat_prompt = ChatPrompt(tokenizer, FILTER_ONLY_SYSTEM_PROMPT)
+    input_ids = chat_prompt.build_input_ids(tokenizer, _summary_user_prompt(context_string))
 
-    return llm_output
+    yield _summary_header(num_total_chunks)
+    yield from get_batcher(tokenizer, model).stream(chat_prompt, input_ids)
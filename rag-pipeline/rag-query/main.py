@@ -5,6 +5,7 @@ import argparse
 import json
 from typing import Dict, Any
 
+from config import Config
 from pipeline import RAGPipeline
 
 
@@ -111,6 +112,9 @@ def main():
         print("No query provided. Running example...")
         query, filters = run_example()
     
+    # The CLI is for inspecting results, so always print the chunk tables
+    Config.DEBUG = True
+
     # Initialize pipeline
     use_reranking = (args.mode == 'hybrid')
     pipeline = RAGPipeline(use_reranking=use_reranking)
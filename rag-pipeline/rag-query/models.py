@@ -1,14 +1,21 @@
 """
 Model loading and initialization for RAG pipeline.
 """
+import os
+import numpy as np
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 from sentence_transformers.cross_encoder import CrossEncoder
 from huggingface_hub import login
-from typing import Tuple
+from typing import List, Tuple, Union
 
 from config import Config
 
+try:
+    import onnxruntime as ort
+except ImportError:  # optional: ONNX Runtime reranker (Config.RERANKER_ONNX_PATH)
+    ort = None
+
 
 def initialize_llm() -> Tuple[AutoTokenizer, AutoModelForCausalLM]:
     """
@@ -44,14 +51,91 @@ def initialize_llm() -> Tuple[AutoTokenizer, AutoModelForCausalLM]:
     return tokenizer, model
 
 
-def initialize_reranker() -> CrossEncoder:
+class OnnxCrossEncoder:
+    """
+    ONNX Runtime stand-in for CrossEncoder.predict, loaded from a directory
+    written by export_reranker.py (model.onnx plus the tokenizer files).
+    """
+
+    def __init__(self, model_dir: str):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=providers
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.provider = self.session.get_providers()[0]
+
+    def predict(
+        self,
+        pairs: List[Tuple[str, str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        **kwargs
+    ) -> np.ndarray:
+        """Score (query, text) pairs; same output as CrossEncoder.predict."""
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            features = self.tokenizer(
+                [query for query, _ in batch],
+                [text for _, text in batch],
+                padding=True,
+                truncation="longest_first",
+                return_tensors="np"
+            )
+            feeds = {name: features[name].astype(np.int64) for name in self.input_names}
+            scores.append(self.session.run(None, feeds)[0])
+        return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+
+class _Float32Activation(torch.nn.Module):
+    """
+    Applies the CrossEncoder's activation to FP32 logits. In FP16 the sigmoid
+    rounds every logit above ~8 to 1.0, which would tie all strong matches.
+    """
+
+    def __init__(self, activation: torch.nn.Module):
+        super().__init__()
+        self.activation = activation
+
+    def forward(self, logits: torch.Tensor) -> torch.Tensor:
+        return self.activation(logits.float())
+
+
+def initialize_reranker() -> Union[CrossEncoder, OnnxCrossEncoder]:
     """
     Initialize and load the reranker model.
     
     Returns:
-        CrossEncoder model for reranking
+        CrossEncoder model for reranking (an OnnxCrossEncoder when
+        Config.RERANKER_ONNX_PATH points at an exported model)
     """
+    if Config.RERANKER_ONNX_PATH:
+        if ort is None:
+            raise ImportError("RERANKER_ONNX_PATH is set but onnxruntime is not installed")
+        print(f"Loading ONNX reranker model: {Config.RERANKER_ONNX_PATH}")
+        reranker_model = OnnxCrossEncoder(Config.RERANKER_ONNX_PATH)
+        print(f"Reranker model loaded successfully on {reranker_model.provider}.")
+        return reranker_model
+
     print(f"Loading reranker model: {Config.RERANKER_MODEL_ID}")
-    reranker_model = CrossEncoder(Config.RERANKER_MODEL_ID)
-    print("Reranker model loaded successfully.")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    reranker_model = CrossEncoder(Config.RERANKER_MODEL_ID, device=device)
+
+    # Half precision halves weight traffic and uses tensor cores; CPUs keep FP32
+    if device == "cuda" and Config.RERANK_HALF_PRECISION:
+        reranker_model.model.half()
+        # sentence-transformers >= 4 names it activation_fn, older versions default_activation_function
+        attr = "activation_fn" if hasattr(reranker_model, "activation_fn") else "default_activation_function"
+        activation = getattr(reranker_model, attr, None) or torch.nn.Identity()
+        setattr(reranker_model, attr, _Float32Activation(activation))
+    reranker_model.model.eval()
+
+    print(f"Reranker model loaded successfully on {device}.")
     return reranker_model
@@ -1,7 +1,11 @@
 """
 Main RAG pipeline orchestration.
 """
-from typing import Dict, Any, Tuple, Optional
+import json
+import threading
+from typing import Callable, Dict, Any, Iterator, List, Tuple, Optional
+
+from cachetools import TTLCache
 
 from config import Config
 from models import initialize_llm, initialize_reranker
@@ -11,9 +15,14 @@ from retrieval import (
     run_query_for_each_location_reranking
 )
 from llm_generation import (
+    SYSTEM_PROMPT,
+    FILTER_ONLY_SYSTEM_PROMPT,
+    get_chat_prompt,
     build_context_string,
     generate_llm_response,
-    generate_llm_response_filter_only_search
+    generate_llm_response_filter_only_search,
+    stream_llm_response,
+    stream_llm_response_filter_only_search
 )
 from filters import flatten_locations_payload
 from utils import (
@@ -27,25 +36,52 @@ from utils import (
 class RAGPipeline:
     """Main RAG Pipeline class."""
     
-    def __init__(self, use_reranking: bool = False):
+    def __init__(
+        self,
+        use_reranking: bool = False,
+        tokenizer: Optional[Any] = None,
+        model: Optional[Any] = None,
+        pc: Optional[Any] = None,
+        pinecone_index: Optional[Any] = None
+    ):
         """
         Initialize RAG Pipeline.
         
         Args:
             use_reranking: Whether to use hybrid search with reranking
+            tokenizer: Already-loaded LLM tokenizer to share (loaded here if omitted)
+            model: Already-loaded LLM to share (loaded here if omitted)
+            pc: Already-initialized Pinecone client to share
+            pinecone_index: Already-connected Pinecone index to share
         """
-        Config.validate()
+        if model is None or pinecone_index is None:
+            Config.validate()
         
         self.use_reranking = use_reranking
+
+        # Recent retrieval results keyed by (query, filters); LLM output is never cached
+        self._retrieval_cache = TTLCache(
+            maxsize=Config.RETRIEVAL_CACHE_SIZE,
+            ttl=Config.RETRIEVAL_CACHE_TTL
+        )
+        self._retrieval_cache_lock = threading.Lock()
         
-        # Initialize Pinecone
-        self.pc, self.pinecone_index = initialize_pinecone()
+        # Initialize Pinecone (unless a shared client was passed in)
+        if pc is None or pinecone_index is None:
+            pc, pinecone_index = initialize_pinecone()
+        self.pc, self.pinecone_index = pc, pinecone_index
         
-        # Initialize models
-        print("\n" + "="*50)
-        print("Initializing Models...")
-        print("="*50)
-        self.tokenizer, self.model = initialize_llm()
+        # Initialize models (unless a shared LLM was passed in)
+        if tokenizer is None or model is None:
+            print("\n" + "="*50)
+            print("Initializing Models...")
+            print("="*50)
+            tokenizer, model = initialize_llm()
+        self.tokenizer, self.model = tokenizer, model
+
+        # Tokenized and prefilled system prompts, shared by every pipeline on this model
+        self.answer_prompt = get_chat_prompt(self.tokenizer, self.model, SYSTEM_PROMPT)
+        self.summary_prompt = get_chat_prompt(self.tokenizer, self.model, FILTER_ONLY_SYSTEM_PROMPT)
         
         if use_reranking:
             self.reranker_model = initialize_reranker()
@@ -56,62 +92,160 @@ class RAGPipeline:
         print("Pipeline Initialization Complete")
         print("="*50 + "\n")
     
-    def run_baseline_search(
+    def _cached_retrieval(
         self,
         query: str,
-        filters: Dict[str, Any]
-    ) -> Tuple[str, list]:
+        filters: Dict[str, Any],
+        retrieve: Callable[[], List[dict]]
+    ) -> List[dict]:
         """
-        Run baseline search (dense embedding only).
+        Return retrieved chunks for (query, filters), calling retrieve() only on a cache miss.
+
+        Args:
+            query: Query string
+            filters: Filter dictionary as received (before flattening)
+            retrieve: Runs the Pinecone retrieval for this request
+
+        Returns:
+            List of retrieved chunks
+        """
+        key = (query, json.dumps(filters, sort_keys=True, separators=(',', ':'), default=str))
+        with self._retrieval_cache_lock:
+            cached = self._retrieval_cache.get(key)
+        if cached is not None:
+            print("Using cached retrieval results")
+            return list(cached)
+
+        retrieved_chunks = retrieve()
+        with self._retrieval_cache_lock:
+            self._retrieval_cache[key] = retrieved_chunks
+        return list(retrieved_chunks)
+
+    def _retrieve(
+        self,
+        query: str,
+        filters: Dict[str, Any],
+        label: str,
+        retrieve: Callable[[Dict[str, Any], bool], List[dict]],
+        print_results: Callable[[List[dict]], None]
+    ) -> List[dict]:
+        """
+        Flatten the filters and retrieve chunks with the given retrieval function.
 
         Args:
             query: Query string (empty for filter-only search)
             filters: Filter dictionary with locations and other criteria
+            label: Search name for log output
+            retrieve: run_query_for_each_location or its reranking variant,
+                called as retrieve(normalized_filters, filter_only_search)
+            print_results: Debug table printer for the retrieved chunks
 
         Returns:
-            Tuple of (llm_output, retrieved_chunks)
+            List of retrieved chunks
         """
         print("\n" + "="*50)
-        print("RUNNING BASELINE SEARCH")
+        print(f"RUNNING {label}")
         print("="*50)
         
-        # Flatten locations
-        normalized_filters = flatten_locations_payload(filters)
-        
         # Determine if this is a filter-only search
         filter_only_search = not bool(query)
         
-        # Run retrieval
-        retrieved_chunks = run_query_for_each_location(
-            self.pc,
-            self.pinecone_index,
+        # Flatten locations and run retrieval; both are skipped for a repeated
+        # identical request, whose results come from the retrieval cache
+        retrieved_chunks = self._cached_retrieval(
             query,
-            normalized_filters,
-            filter_only_search
+            filters,
+            lambda: retrieve(flatten_locations_payload(filters), filter_only_search)
         )
         
-        # Print results
-        print("\n\n--- BASELINE RESULTS ---")
-        print_chunks(retrieved_chunks)
+        # Print results (full tables only in debug mode; they cover up to 1000 chunks)
+        print(f"\n\n--- {label} RESULTS: {len(retrieved_chunks)} chunks ---")
+        if Config.DEBUG:
+            print_results(retrieved_chunks)
+
+        return retrieved_chunks
+
+    def _search(
+        self,
+        query: str,
+        filters: Dict[str, Any],
+        label: str,
+        retrieve: Callable[[Dict[str, Any], bool], List[dict]],
+        print_results: Callable[[List[dict]], None]
+    ) -> Tuple[str, list]:
+        """
+        Retrieve chunks with the given retrieval function, then generate the LLM output.
+
+        Args:
+            query: Query string (empty for filter-only search)
+            filters: Filter dictionary with locations and other criteria
+            label: Search name for log output
+            retrieve: Retrieval function, see _retrieve
+            print_results: Debug table printer for the retrieved chunks
+
+        Returns:
+            Tuple of (llm_output, retrieved_chunks)
+        """
+        retrieved_chunks = self._retrieve(query, filters, label, retrieve, print_results)
         
         # Generate output
         if query:  # Standard search
             context_string = build_context_string(retrieved_chunks)
-            # csv_filename = Config.BASELINE_CSV_FILENAME
-            # generate_csv(csv_filename, retrieved_chunks)
-            llm_output = generate_llm_response(query, context_string, self.tokenizer, self.model)
+            llm_output = generate_llm_response(
+                query, context_string, self.tokenizer, self.model, self.answer_prompt
+            )
         else:  # Filter-only search
             context_string = build_context_string(retrieved_chunks, 10)
-            # csv_filename = Config.BASELINE_FILTER_CSV_FILENAME
-            # generate_csv(csv_filename, retrieved_chunks)
             llm_output = generate_llm_response_filter_only_search(
-                query, context_string, self.tokenizer, self.model, len(retrieved_chunks)
+                query, context_string, self.tokenizer, self.model, len(retrieved_chunks),
+                self.summary_prompt
             )
         
         print("\n--- FINAL LLM OUTPUT ---")
         print(llm_output)
         
         return llm_output, retrieved_chunks
+
+    def _baseline_search_args(self, query: str) -> tuple:
+        """(label, retrieve, print_results) for baseline search."""
+        return (
+            "BASELINE SEARCH",
+            lambda normalized_filters, filter_only_search: run_query_for_each_location(
+                self.pc, self.pinecone_index, query, normalized_filters, filter_only_search
+            ),
+            print_chunks
+        )
+
+    def _hybrid_search_args(self, query: str) -> tuple:
+        """(label, retrieve, print_results) for hybrid search with reranking."""
+        if not self.use_reranking:
+            raise ValueError("Pipeline was not initialized with reranking enabled")
+
+        return (
+            "HYBRID SEARCH WITH RERANKING",
+            lambda normalized_filters, filter_only_search: run_query_for_each_location_reranking(
+                self.pc, self.pinecone_index, self.reranker_model,
+                query, normalized_filters, filter_only_search
+            ),
+            print_chunks_reranking
+        )
+
+    def run_baseline_search(
+        self,
+        query: str,
+        filters: Dict[str, Any]
+    ) -> Tuple[str, list]:
+        """
+        Run baseline search (dense embedding only).
+
+        Args:
+            query: Query string (empty for filter-only search)
+            filters: Filter dictionary with locations and other criteria
+
+        Returns:
+            Tuple of (llm_output, retrieved_chunks)
+        """
+        return self._search(query, filters, *self._baseline_search_args(query))
     
     def run_hybrid_search(
         self,
@@ -128,51 +262,7 @@ class RAGPipeline:
         Returns:
             Tuple of (llm_output, retrieved_chunks)
         """
-        if not self.use_reranking:
-            raise ValueError("Pipeline was not initialized with reranking enabled")
-        
-        print("\n" + "="*50)
-        print("RUNNING HYBRID SEARCH WITH RERANKING")
-        print("="*50)
-        
-        # Flatten locations
-        normalized_filters = flatten_locations_payload(filters)
-        
-        # Determine if this is a filter-only search
-        filter_only_search = not bool(query)
-        
-        # Run retrieval with reranking
-        retrieved_chunks = run_query_for_each_location_reranking(
-            self.pc,
-            self.pinecone_index,
-            self.reranker_model,
-            query,
-            normalized_filters,
-            filter_only_search
-        )
-        
-        # Print results
-        print("\n\n--- HYBRID + RERANKING RESULTS ---")
-        print_chunks_reranking(retrieved_chunks)
-        
-        # Generate output
-        if query:  # Standard search
-            context_string = build_context_string(retrieved_chunks)
-            # csv_filename = Config.HYBRID_CSV_FILENAME
-            # generate_csv_reranking(csv_filename, retrieved_chunks)
-            llm_output = generate_llm_response(query, context_string, self.tokenizer, self.model)
-        else:  # Filter-only search
-            context_string = build_context_string(retrieved_chunks, 10)
-            # csv_filename = Config.HYBRID_FILTER_CSV_FILENAME
-            # generate_csv_reranking(csv_filename, retrieved_chunks)
-            llm_output = generate_llm_response_filter_only_search(
-                query, context_string, self.tokenizer, self.model, len(retrieved_chunks)
-            )
-        
-        print("\n--- FINAL LLM OUTPUT ---")
-        print(llm_output)
-        
-        return llm_output, retrieved_chunks
+        return self._search(query, filters, *self._hybrid_search_args(query))
     
     def run(
         self,
@@ -193,3 +283,41 @@ class RAGPipeline:
             return self.run_hybrid_search(query, filters)
         else:
             return self.run_baseline_search(query, filters)
+
+    def run_stream(
+        self,
+        query: str,
+        filters: Dict[str, Any]
+    ) -> Tuple[Iterator[str], list]:
+        """
+        Like run(), but the LLM output is returned as an iterator of text pieces.
+
+        Retrieval happens before returning; generation starts when the
+        iterator is first consumed.
+
+        Args:
+            query: Query string (empty for filter-only search)
+            filters: Filter dictionary with locations and other criteria
+
+        Returns:
+            Tuple of (llm_output_stream, retrieved_chunks)
+        """
+        if self.use_reranking:
+            search_args = self._hybrid_search_args(query)
+        else:
+            search_args = self._baseline_search_args(query)
+        retrieved_chunks = self._retrieve(query, filters, *search_args)
+
+        if query:  # Standard search
+            context_string = build_context_string(retrieved_chunks)
+            llm_stream = stream_llm_response(
+                query, context_string, self.tokenizer, self.model, self.answer_prompt
+            )
+        else:  # Filter-only search
+            context_string = build_context_string(retrieved_chunks, 10)
+            llm_stream = stream_llm_response_filter_only_search(
+                query, context_string, self.tokenizer, self.model, len(retrieved_chunks),
+                self.summary_prompt
+            )
+
+        return llm_stream, retrieved_chunks
@@ -1,13 +1,24 @@
 """
 Retrieval functions for querying Pinecone index.
 """
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional
 from pinecone import Pinecone
+import threading
 import time
+import numpy as np
+import torch
+from cachetools import LRUCache, TTLCache
 
 from config import Config
 from filters import build_pinecone_filter
 
+# Shared by all requests: per-location queries are network-bound, so they run concurrently
+_QUERY_POOL = ThreadPoolExecutor(
+    max_workers=Config.RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix="pinecone-query"
+)
+
 
 def initialize_pinecone() -> tuple:
     """
@@ -28,7 +39,73 @@ def initialize_pinecone() -> tuple:
     return pc, pinecone_index
 
 
-def retrieve_chunks(pc: Pinecone, pinecone_index: Any, query: str, filter_object: dict) -> dict:
+# Placeholder vector for filter-only search: the query is served by the metadata filter,
+# and Pinecone has no filtered list/fetch, so one shared zero vector stands in
+_FILTER_ONLY_VECTOR = [0.0] * Config.VECTOR_DIMENSION
+
+# Query embeddings keyed by (model, query); embedding is deterministic, so entries never go stale
+_EMBEDDING_CACHE = LRUCache(maxsize=Config.EMBEDDING_CACHE_SIZE)
+_EMBEDDING_CACHE_LOCK = threading.Lock()
+
+# Cross-encoder scores keyed by (query, chunk id); the TTL bounds staleness after re-ingestion
+_RERANK_CACHE = TTLCache(maxsize=Config.RERANK_CACHE_SIZE, ttl=Config.RERANK_CACHE_TTL)
+_RERANK_CACHE_LOCK = threading.Lock()
+
+
+def _embed(pc: Pinecone, model: str, query: str) -> dict:
+    """Embed one query string with a Pinecone-hosted model, reusing earlier results."""
+    key = (model, query)
+    with _EMBEDDING_CACHE_LOCK:
+        embedding = _EMBEDDING_CACHE.get(key)
+    if embedding is not None:
+        return embedding
+
+    embedding = pc.inference.embed(
+        model=model,
+        inputs=query,
+        parameters={"input_type": "query", "truncate": "END"}
+    )[0]
+    with _EMBEDDING_CACHE_LOCK:
+        _EMBEDDING_CACHE[key] = embedding
+    return embedding
+
+
+def embed_query(pc: Pinecone, query: str, sparse: bool = False) -> tuple:
+    """
+    Embed a query for search. The vectors do not depend on the filters, so
+    callers embed once and reuse them for every location.
+    
+    Args:
+        pc: Pinecone client
+        query: Query string
+        sparse: Also compute the sparse embedding (hybrid search)
+        
+    Returns:
+        Tuple of (dense_vector, sparse_vector); sparse_vector is a dict with
+        'indices' and 'values', or None when not requested
+    """
+    # The sparse embedding is fetched concurrently with the dense one
+    sparse_future = _QUERY_POOL.submit(_embed, pc, Config.EMBEDDING_MODEL_SPARSE, query) if sparse else None
+    dense_vector = _embed(pc, Config.EMBEDDING_MODEL_DENSE, query)['values']
+
+    sparse_vector = None
+    if sparse_future is not None:
+        sparse_data = sparse_future.result()  # Contains 'sparse_indices' and 'sparse_values'
+        sparse_vector = {
+            'indices': sparse_data['sparse_indices'],
+            'values': sparse_data['sparse_values']
+        }
+    return dense_vector, sparse_vector
+
+
+def retrieve_chunks(
+    pc: Pinecone,
+    pinecone_index: Any,
+    query: str,
+    filter_object: dict,
+    query_vector: Optional[List[float]] = None,
+    top_k: Optional[int] = None
+) -> dict:
     """
     Baseline retrieval: Dense embedding only.
     
@@ -37,22 +114,20 @@ def retrieve_chunks(pc: Pinecone, pinecone_index: Any, query: str, filter_object
         pinecone_index: Pinecone index object
         query: Query string (empty string for filter-only search)
         filter_object: Pinecone filter dictionary
+        query_vector: Precomputed dense embedding of query (embedded here if omitted)
+        top_k: Number of matches to return (defaults to Config.BASELINE_TOP_K)
         
     Returns:
         Pinecone query response
     """
     if query:
         print("Querying Pinecone...Standard Semantic Search")
-        dense_query_embedding = pc.inference.embed(
-            model=Config.EMBEDDING_MODEL_DENSE,
-            inputs=query,
-            parameters={"input_type": "query", "truncate": "END"}
-        )
-        query_vector = dense_query_embedding[0]['values']
-        results_k = Config.BASELINE_TOP_K
+        if query_vector is None:
+            query_vector, _ = embed_query(pc, query)
+        results_k = top_k or Config.BASELINE_TOP_K
     else:
         print("Querying Pinecone...Filter-Only Search")
-        query_vector = [0.0] * Config.VECTOR_DIMENSION
+        query_vector = _FILTER_ONLY_VECTOR
         results_k = Config.FILTER_ONLY_TOP_K
 
     query_response = pinecone_index.query(
@@ -66,7 +141,14 @@ def retrieve_chunks(pc: Pinecone, pinecone_index: Any, query: str, filter_object
     return query_response
 
 
-def retrieve_chunks_hybrid_reranking(pc: Pinecone, pinecone_index: Any, query: str, filter_object: dict) -> dict:
+def retrieve_chunks_hybrid_reranking(
+    pc: Pinecone,
+    pinecone_index: Any,
+    query: str,
+    filter_object: dict,
+    query_vectors: Optional[tuple] = None,
+    top_k: Optional[int] = None
+) -> dict:
     """
     Hybrid retrieval: Dense + Sparse embeddings.
     
@@ -75,52 +157,37 @@ def retrieve_chunks_hybrid_reranking(pc: Pinecone, pinecone_index: Any, query: s
         pinecone_index: Pinecone index object
         query: Query string (empty string for filter-only search)
         filter_object: Pinecone filter dictionary
+        query_vectors: Precomputed (dense, sparse) embeddings of query from
+            embed_query(..., sparse=True) (embedded here if omitted)
+        top_k: Number of matches to return (defaults to Config.HYBRID_TOP_K)
         
     Returns:
         Pinecone query response
     """
     if query:
         print("Querying Pinecone...Hybrid Search (Dense + Sparse)")
-        
-        # Get dense embedding
-        dense_query_embedding = pc.inference.embed(
-            model=Config.EMBEDDING_MODEL_DENSE,
-            inputs=query,
-            parameters={"input_type": "query", "truncate": "END"}
-        )
-        
-        # Get sparse embedding
-        sparse_query_embedding = pc.inference.embed(
-            model=Config.EMBEDDING_MODEL_SPARSE,
-            inputs=query,
-            parameters={"input_type": "query", "truncate": "END"}
-        )
-
-        dense_vector = dense_query_embedding[0]['values']
-        sparse_data = sparse_query_embedding[0]  # Contains 'sparse_indices' and 'sparse_values'
-        results_k = Config.HYBRID_TOP_K
+        if query_vectors is None:
+            query_vectors = embed_query(pc, query, sparse=True)
+        dense_vector, sparse_vector = query_vectors
+        results_k = top_k or Config.HYBRID_TOP_K
 
         query_response = pinecone_index.query(
             namespace=Config.PINECONE_NAMESPACE,
             top_k=results_k,
             vector=dense_vector,
-            sparse_vector={
-                'indices': sparse_data['sparse_indices'], 
-                'values': sparse_data['sparse_values']
-            },
+            sparse_vector=sparse_vector,
             include_values=False,
             include_metadata=True,
             filter=filter_object
         )
     else:
         print("Querying Pinecone...Filter-Only Search")
-        dummy_vector = [0.0] * Config.VECTOR_DIMENSION
         results_k = Config.FILTER_ONLY_TOP_K
 
         query_response = pinecone_index.query(
             namespace=Config.PINECONE_NAMESPACE,
             top_k=results_k,
-            vector=dummy_vector,
+            vector=_FILTER_ONLY_VECTOR,
             include_values=False,
             include_metadata=True,
             filter=filter_object
@@ -129,6 +196,109 @@ def retrieve_chunks_hybrid_reranking(pc: Pinecone, pinecone_index: Any, query: s
     return query_response
 
 
+def _location_filter_objects(base_filters: dict, locations: List[dict]) -> List[dict]:
+    """
+    Build one Pinecone filter object per (state, county) location.
+    
+    Args:
+        base_filters: Normalized filters without 'locations'
+        locations: List of {state, county} pairs
+        
+    Returns:
+        List of Pinecone filter dictionaries, in location order
+    """
+    filter_objects = []
+    for loc in locations:
+        print(f"\nQuerying for location: {loc['state']}, county: {loc['county']}")
+        loop_filter = base_filters.copy()
+        loop_filter['state'] = [loc['state']]
+        loop_filter['county'] = [loc['county']]
+        filter_objects.append(build_pinecone_filter(loop_filter))
+    return filter_objects
+
+
+def _fused_location_filter(base_filters: dict, locations: List[dict]) -> dict:
+    """
+    Build one Pinecone filter matching any of the (state, county) locations.
+    
+    Args:
+        base_filters: Normalized filters without 'locations'
+        locations: List of {state, county} pairs
+        
+    Returns:
+        Pinecone filter dictionary
+    """
+    base_filters = {k: v for k, v in base_filters.items() if k not in ('state', 'county')}
+    base_filter_object = build_pinecone_filter(base_filters)
+    location_filter = {"$or": [
+        {"state": {"$eq": loc['state']}, "county": {"$eq": loc['county']}}
+        for loc in locations
+    ]}
+    if not base_filter_object:
+        return location_filter
+    return {"$and": [base_filter_object, location_filter]}
+
+
+def _matches_by_location(
+    query_location: Callable[[dict, Optional[int]], dict],
+    base_filters: dict,
+    locations: List[dict],
+    top_k: int
+) -> List[List[dict]]:
+    """
+    Retrieve the top_k matches of each location.
+    
+    When the combined result fits in one query, all locations are fetched
+    with a single $or-filtered query and split by (state, county). The
+    global top hits include every match that would make a location's own
+    top_k, so only locations left short of top_k by a full fused result are
+    queried again on their own. Otherwise every location is queried
+    concurrently.
+    
+    Args:
+        query_location: Runs one Pinecone query, called as
+            query_location(filter_object, top_k)
+        base_filters: Normalized filters without 'locations'
+        locations: List of {state, county} pairs
+        top_k: Matches to keep per location
+        
+    Returns:
+        One list of matches per location, in location order
+    """
+    fused_k = len(locations) * top_k
+    if len(locations) < 2 or fused_k > Config.PINECONE_MAX_TOP_K:
+        responses = _QUERY_POOL.map(
+            lambda filter_object: query_location(filter_object, top_k),
+            _location_filter_objects(base_filters, locations)
+        )
+        return [response.get('matches', []) for response in responses]
+
+    print(f"\nQuerying {len(locations)} locations in one request (top_k={fused_k})")
+    response = query_location(_fused_location_filter(base_filters, locations), fused_k)
+    fused_matches = response.get('matches', [])
+
+    grouped = {(loc['state'], loc['county']): [] for loc in locations}
+    for match in fused_matches:
+        metadata = match.get('metadata', {})
+        group = grouped.get((metadata.get('state'), metadata.get('county')))
+        if group is not None and len(group) < top_k:
+            group.append(match)
+
+    # A fused result shorter than fused_k already holds every matching chunk
+    if len(fused_matches) >= fused_k:
+        short = [key for key, group in grouped.items() if len(group) < top_k]
+        if short:
+            short_locations = [{'state': state, 'county': county} for state, county in short]
+            responses = _QUERY_POOL.map(
+                lambda filter_object: query_location(filter_object, top_k),
+                _location_filter_objects(base_filters, short_locations)
+            )
+            for key, response in zip(short, responses):
+                grouped[key] = response.get('matches', [])
+
+    return [grouped[(loc['state'], loc['county'])] for loc in locations]
+
+
 def run_query_for_each_location(
     pc: Pinecone, 
     pinecone_index: Any, 
@@ -164,17 +334,18 @@ def run_query_for_each_location(
 
         print(f"\n--- Starting baseline query loop for {len(locations_to_search)} locations ---")
 
-        for loc in locations_to_search:
-            print(f"\nQuerying for location: {loc['state']}, county: {loc['county']}")
-
-            # Build a Pinecone filter object for each location.
-            loop_filter = base_filters.copy()
-            loop_filter['state'] = [loc['state']]
-            loop_filter['county'] = [loc['county']]
-            pinecone_filter_object = build_pinecone_filter(loop_filter)
-
-            response = retrieve_chunks(pc, pinecone_index, query_text, pinecone_filter_object)
-            retrieved_chunks.extend(response.get('matches', []))
+        # Embed once, then query the locations; results come back in location order
+        query_vector, _ = embed_query(pc, query_text)
+        matches_by_location = _matches_by_location(
+            lambda filter_object, top_k: retrieve_chunks(
+                pc, pinecone_index, query_text, filter_object, query_vector, top_k
+            ),
+            base_filters,
+            locations_to_search,
+            Config.BASELINE_TOP_K
+        )
+        for matches in matches_by_location:
+            retrieved_chunks.extend(matches)
 
         print(f"\n--- Loop finished. Total chunks retrieved: {len(retrieved_chunks)} ---")
 
@@ -218,24 +389,94 @@ def run_query_for_each_location_reranking(
 
         print(f"\n--- Starting Hybrid + Reranking query loop for {len(locations_to_search)} locations ---")
 
-        for loc in locations_to_search:
-            print(f"\nQuerying for location: {loc['state']}, county: {loc['county']}")
-
-            # Build a filter object for each location.
-            loop_filter = base_filters.copy()
-            loop_filter['state'] = [loc['state']]
-            loop_filter['county'] = [loc['county']]
-            pinecone_filter_object = build_pinecone_filter(loop_filter)
-
-            response = retrieve_chunks_hybrid_reranking(pc, pinecone_index, query_text, pinecone_filter_object)
-            reranked_chunks = rerank_chunks(reranker_model, query, response.get('matches', []))
-            retrieved_chunks.extend(reranked_chunks)
+        # Embed once, then query the locations; the shared reranker runs on this thread
+        query_vectors = embed_query(pc, query_text, sparse=True)
+        matches_by_location = _matches_by_location(
+            lambda filter_object, top_k: retrieve_chunks_hybrid_reranking(
+                pc, pinecone_index, query_text, filter_object, query_vectors, top_k
+            ),
+            base_filters,
+            locations_to_search,
+            Config.HYBRID_TOP_K
+        )
+        retrieved_chunks.extend(rerank_chunks_by_location(reranker_model, query, matches_by_location))
 
         print(f"\n--- Loop finished. Total chunks retrieved: {len(retrieved_chunks)} ---")
 
     return retrieved_chunks
 
 
+def _score_pairs(reranker_model: Any, query: str, pinecone_matches: List[dict]) -> np.ndarray:
+    """
+    Score (query, chunk_text) pairs with the Cross-Encoder in one predict call,
+    reusing scores cached from earlier requests with the same query.
+
+    Args:
+        reranker_model: CrossEncoder model
+        query: The user's original query
+        pinecone_matches: Matches whose metadata holds the chunk_text
+
+    Returns:
+        Array of scores, aligned with pinecone_matches
+    """
+    scores = np.empty(len(pinecone_matches), dtype=np.float64)
+
+    # A score depends only on (query, chunk), so it carries over to requests with other filters
+    missing = []
+    with _RERANK_CACHE_LOCK:
+        for i, match in enumerate(pinecone_matches):
+            cached = _RERANK_CACHE.get((query, match.get('id')))
+            if cached is None:
+                missing.append(i)
+            else:
+                scores[i] = cached
+    if len(missing) < len(pinecone_matches):
+        print(f"Reusing {len(pinecone_matches) - len(missing)} cached rerank scores")
+    if not missing:
+        # Nothing to score; some models fail on an empty batch
+        return scores
+
+    texts = [pinecone_matches[i].get('metadata', {}).get('chunk_text', '') for i in missing]
+
+    # Score in length order so each batch pads to similar lengths, then restore the order
+    order = np.argsort([len(text) for text in texts], kind='stable')
+    pairs = [(query, texts[i]) for i in order]
+
+    start_time = time.time()
+    with torch.inference_mode():
+        sorted_scores = reranker_model.predict(
+            pairs,
+            batch_size=Config.RERANK_BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+    end_time = time.time()
+    print(f"Reranking took {end_time - start_time:.4f} seconds")
+
+    missing_scores = np.empty(len(missing), dtype=np.float64)
+    missing_scores[order] = sorted_scores
+    scores[missing] = missing_scores
+
+    with _RERANK_CACHE_LOCK:
+        for i, score in zip(missing, missing_scores.tolist()):
+            chunk_id = pinecone_matches[i].get('id')
+            if chunk_id is not None:
+                _RERANK_CACHE[(query, chunk_id)] = score
+    return scores
+
+
+def _top_by_rerank_score(pinecone_matches: List[dict], scores: np.ndarray, top_n: int) -> List[dict]:
+    """Attach rerank_score to each match and return the top_n by that score."""
+    # Add rerank_score to original matches
+    for match, score in zip(pinecone_matches, scores.tolist()):
+        match['rerank_score'] = score
+
+    # Highest scores first; the stable sort keeps equal scores in retrieval order
+    top = np.argsort(-scores, kind='stable')[:top_n]
+
+    return [pinecone_matches[i] for i in top.tolist()]
+
+
 def rerank_chunks(reranker_model: Any, query: str, pinecone_matches: List[dict], top_n: Optional[int] = None) -> List[dict]:
     """
     Reranks the retrieved chunks using a Cross-Encoder model.
@@ -254,22 +495,53 @@ def rerank_chunks(reranker_model: Any, query: str, pinecone_matches: List[dict],
         
     print(f"Reranking {len(pinecone_matches)} chunks... ")
 
-    # Create pairs of [query, chunk_text] for the model
-    pairs = []
-    for match in pinecone_matches:
-        chunk_text = match.get('metadata', {}).get('chunk_text', '')
-        pairs.append((query, chunk_text))
+    scores = _score_pairs(reranker_model, query, pinecone_matches)
+    return _top_by_rerank_score(pinecone_matches, scores, top_n)
 
-    start_time = time.time()
-    scores = reranker_model.predict(pairs)
-    end_time = time.time()
-    print(f"Reranking took {end_time - start_time:.4f} seconds")
 
-    # Add rerank_score to original matches
-    for i in range(len(scores)):
-        pinecone_matches[i]['rerank_score'] = float(scores[i])
+def rerank_chunks_by_location(
+    reranker_model: Any,
+    query: str,
+    matches_by_location: List[List[dict]],
+    top_n: Optional[int] = None
+) -> List[dict]:
+    """
+    Reranks each location's chunks, scoring all locations in a single
+    Cross-Encoder call. Same result as calling rerank_chunks per location.
 
-    # Sort by rerank_score
-    reranked_matches = sorted(pinecone_matches, key=lambda x: x['rerank_score'], reverse=True)
+    Args:
+        reranker_model: CrossEncoder model
+        query: The user's original query
+        matches_by_location: One list of Pinecone 'matches' per location
+        top_n: Chunks to keep per location (defaults to Config.RERANK_TOP_N)
+
+    Returns:
+        The top_n reranked matches of each location, in location order
+    """
+    if top_n is None:
+        top_n = Config.RERANK_TOP_N
 
-    return reranked_matches[:top_n]
+    all_matches = [match for matches in matches_by_location for match in matches]
+
+    # A chunk returned for more than one location (e.g. a county selected twice) is scored once
+    unique_matches = []
+    unique_index = {}
+    positions = []
+    for match in all_matches:
+        key = match.get('id', id(match))
+        position = unique_index.get(key)
+        if position is None:
+            position = unique_index[key] = len(unique_matches)
+            unique_matches.append(match)
+        positions.append(position)
+
+    print(f"Reranking {len(unique_matches)} chunks across {len(matches_by_location)} locations... ")
+    scores = _score_pairs(reranker_model, query, unique_matches)[positions]
+
+    reranked = []
+    start = 0
+    for matches in matches_by_location:
+        end = start + len(matches)
+        reranked.extend(_top_by_rerank_score(matches, scores[start:end], top_n))
+        start = end
+    return reranked
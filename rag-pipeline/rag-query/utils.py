@@ -1,12 +1,67 @@
 """
 Utility functions for RAG pipeline.
 """
+import csv
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 from config import Config
 
 
+# Shown for metadata fields a chunk does not have
+_NA = 'N/A'
+
+# Metadata columns shown after the preview in the printed chunk tables
+_TABLE_FLAG_FIELDS = (
+    'penalty', 'obligation', 'permission', 'prohibition',
+    'fk_grade', 'fre', 'wc', 'pct_complex'
+)
+
+
+def _preview(value: Any, length: int) -> Any:
+    """First length characters plus '...' (non-string values are left empty)."""
+    return value[:length] + '...' if isinstance(value, str) else None
+
+
+def _chunk_table(retrieved_chunks: List[dict], include_rerank_score: bool) -> pd.DataFrame:
+    """
+    Build the printed chunk table one column list at a time.
+    
+    Args:
+        retrieved_chunks: List of retrieved chunk dictionaries
+        include_rerank_score: Whether to add the rerank_score column
+        
+    Returns:
+        DataFrame with score, [rerank_score,] county, section, preview and flag columns
+    """
+    n = len(retrieved_chunks)
+    scores = [None] * n
+    rerank_scores = [None] * n
+    counties = [None] * n
+    sections = [None] * n
+    previews = [None] * n
+    flags = {field: [None] * n for field in _TABLE_FLAG_FIELDS}
+
+    for i, c in enumerate(retrieved_chunks):
+        scores[i] = c.get('score', 0)
+        rerank_scores[i] = c.get('rerank_score', 0)
+
+        metadata = c.get('metadata') or {}
+        get = metadata.get
+        counties[i] = get('county', _NA)
+        sections[i] = _preview(get('section', _NA), 20)
+        previews[i] = _preview(get('chunk_text', _NA), 30)
+        for field, column in flags.items():
+            column[i] = get(field, _NA)
+
+    columns = {'score': scores}
+    if include_rerank_score:
+        columns['rerank_score'] = rerank_scores
+    columns.update(county=counties, section=sections, preview=previews)
+    columns.update(flags)
+    return pd.DataFrame(columns)
+
+
 def print_chunks(retrieved_chunks: List[dict]) -> None:
     """
     Print retrieved chunks in a formatted table.
@@ -14,41 +69,7 @@ def print_chunks(retrieved_chunks: List[dict]) -> None:
     Args:
         retrieved_chunks: List of retrieved chunk dictionaries
     """
-    results = []
-    for c in retrieved_chunks:
-        result = {}
-
-        result['score'] = c.get('score', 0)
-
-        metadata = c.get('metadata', {})
-        result['county'] = metadata.get('county', 'N/A')
-        result['section'] = metadata.get('section', 'N/A')
-        result['text'] = metadata.get('chunk_text', 'N/A')
-
-        result['penalty'] = metadata.get('penalty', 'N/A')
-        result['obligation'] = metadata.get('obligation', 'N/A')
-        result['permission'] = metadata.get('permission', 'N/A')
-        result['prohibition'] = metadata.get('prohibition', 'N/A')
-        result['fk_grade'] = metadata.get('fk_grade', 'N/A')
-        result['fre'] = metadata.get('fre', 'N/A')
-        result['wc'] = metadata.get('wc', 'N/A')
-        result['pct_complex'] = metadata.get('pct_complex', 'N/A')
-
-        results.append(result)
-
-    df = pd.DataFrame(results)
-
-    # Safely add preview and section columns
-    if 'text' in df.columns and len(df) > 0:
-        df['preview'] = df['text'].str.slice(0, 30) + '...'
-    if 'section' in df.columns and len(df) > 0:
-        df['section'] = df['section'].str.slice(0, 20) + '...'
-
-    output_df = df[[
-        'score', 'county', 'section', 'preview', 
-        'penalty', 'obligation', 'permission', 'prohibition', 
-        'fk_grade', 'fre', 'wc', 'pct_complex'
-    ]]
+    output_df = _chunk_table(retrieved_chunks, include_rerank_score=False)
 
     print(f"Total number of chunks: {len(retrieved_chunks)}")
     print(output_df.to_string())
@@ -65,83 +86,61 @@ def print_chunks_reranking(retrieved_chunks: List[dict]) -> None:
         print("No chunks retrieved.")
         return
         
-    results = []
-    for c in retrieved_chunks:
-        result = {}
-
-        result['score'] = c.get('score', 0)
-        result['rerank_score'] = c.get('rerank_score', 0)
-
-        metadata = c.get('metadata', {})
-        result['county'] = metadata.get('county', 'N/A')
-        result['section'] = metadata.get('section', 'N/A')
-        result['text'] = metadata.get('chunk_text', 'N/A')
-
-        result['penalty'] = metadata.get('penalty', 'N/A')
-        result['obligation'] = metadata.get('obligation', 'N/A')
-        result['permission'] = metadata.get('permission', 'N/A')
-        result['prohibition'] = metadata.get('prohibition', 'N/A')
-        result['fk_grade'] = metadata.get('fk_grade', 'N/A')
-        result['fre'] = metadata.get('fre', 'N/A')
-        result['wc'] = metadata.get('wc', 'N/A')
-        result['pct_complex'] = metadata.get('pct_complex', 'N/A')
-
-        results.append(result)
-
-    df = pd.DataFrame(results)
-
-    # Safely add preview and section columns
-    if 'text' in df.columns and len(df) > 0:
-        df['preview'] = df['text'].str.slice(0, 30) + '...'
-    if 'section' in df.columns and len(df) > 0:
-        df['section'] = df['section'].str.slice(0, 20) + '...'
-
-    output_df = df[[
-        'score', 'rerank_score', 'county', 'section', 'preview', 
-        'penalty', 'obligation', 'permission', 'prohibition', 
-        'fk_grade', 'fre', 'wc', 'pct_complex'
-    ]]
+    output_df = _chunk_table(retrieved_chunks, include_rerank_score=True)
 
     print(f"Total number of chunks: {len(retrieved_chunks)}")
     print(output_df.to_string())
 
 
-def generate_csv(csv_filename: str, retrieved_chunks: List[dict]) -> None:
+def _write_chunks_csv(csv_filename: str, chunks: List[dict], score_fields: Tuple[str, ...]) -> None:
     """
-    Generate CSV file from retrieved chunks.
+    Stream chunks to a CSV file: id, the score fields, then every metadata field.
     
     Args:
         csv_filename: Name of the CSV file to generate
-        retrieved_chunks: List of retrieved chunk dictionaries
+        chunks: List of retrieved chunk dictionaries
+        score_fields: Top-level chunk fields written after the id
     """
     filename = Config.get_output_path(csv_filename)
 
     print(f"\n--- Generating CSV File: {filename} ---")
     try:
-        processed_data = []
-        for chunk in retrieved_chunks:
-            # Create a flat dictionary for each row
-            row_data = {
-                'id': chunk.get('id'),
-                'score': chunk.get('score')
-            }
-            # Add all metadata fields as separate columns
-            if 'metadata' in chunk:
-                row_data.update(chunk['metadata'])
-            processed_data.append(row_data)
-
-        if not processed_data:
+        if not chunks:
             print("No matches found to generate CSV.")
-        else:
-            # Convert to Pandas DataFrame and save to CSV
-            df = pd.DataFrame(processed_data)
-            df.to_csv(filename, index=False, encoding='utf-8')
-            print(f"Successfully generated CSV with {len(df)} rows at: {filename}")
+            return
+
+        # Columns are the union of all metadata keys, in first-seen order
+        fieldnames = dict.fromkeys(('id',) + score_fields)
+        metadatas = [chunk.get('metadata') or {} for chunk in chunks]
+        for metadata in metadatas:
+            fieldnames.update(dict.fromkeys(metadata))
+
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(fieldnames), lineterminator='\n')
+            writer.writeheader()
+            for chunk, metadata in zip(chunks, metadatas):
+                # Create a flat dictionary for each row
+                row_data = {field: chunk.get(field) for field in ('id',) + score_fields}
+                # Add all metadata fields as separate columns
+                row_data.update(metadata)
+                writer.writerow(row_data)
+        print(f"Successfully generated CSV with {len(chunks)} rows at: {filename}")
 
     except Exception as e:
         print(f"Error generating CSV: {e}")
 
 
+def generate_csv(csv_filename: str, retrieved_chunks: List[dict]) -> None:
+    """
+    Generate CSV file from retrieved chunks.
+    
+    Args:
+        csv_filename: Name of the CSV file to generate
+        retrieved_chunks: List of retrieved chunk dictionaries
+    """
+    _write_chunks_csv(csv_filename, retrieved_chunks, ('score',))
+
+
 def generate_csv_reranking(csv_filename: str, reranked_chunks: List[dict]) -> None:
     """
     Generate CSV file from reranked chunks (includes rerank_score).
@@ -150,30 +149,4 @@ def generate_csv_reranking(csv_filename: str, reranked_chunks: List[dict]) -> No
         csv_filename: Name of the CSV file to generate
         reranked_chunks: List of reranked chunk dictionaries
     """
-    filename = Config.get_output_path(csv_filename)
-
-    print(f"\n--- Generating CSV File: {filename} ---")
-    try:
-        processed_data = []
-        for chunk in reranked_chunks:
-            # Create a flat dictionary for each row
-            row_data = {
-                'id': chunk.get('id'),
-                'score': chunk.get('score'),
-                'rerank_score': chunk.get('rerank_score'),
-            }
-            # Add all metadata fields as separate columns
-            if 'metadata' in chunk:
-                row_data.update(chunk['metadata'])
-            processed_data.append(row_data)
-
-        if not processed_data:
-            print("No matches found to generate CSV.")
-        else:
-            # Convert to Pandas DataFrame and save to CSV
-            df = pd.DataFrame(processed_data)
-            df.to_csv(filename, index=False, encoding='utf-8')
-            print(f"Successfully generated CSV with {len(df)} rows at: {filename}")
-
-    except Exception as e:
-        print(f"Error generating CSV: {e}")
+    _write_chunks_csv(csv_filename, reranked_chunks, ('score', 'rerank_score'))
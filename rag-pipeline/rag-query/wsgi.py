@@ -0,0 +1,4 @@
+"""
+WSGI entry point for serving the RAG Query API with gunicorn.
+"""
+from api import app
@@ -1,11 +1,18 @@
-import os, json, time, uuid, re
+import os, io, csv, json, time, uuid, re
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 import logging
 
+try:
+    import orjson
+except ImportError:  # optional: faster JSON for backend payloads, stdlib json otherwise
+    orjson = None
+
 # Setup logging at the top of your file
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -41,26 +48,34 @@ st.markdown(
 # =========================
 # County data
 # =========================
+_COUNTY_SUFFIX_RE = re.compile(r"\s+County$", flags=re.I)
+_APOSTROPHE_RE = re.compile(r"'")
+_DOT_RE = re.compile(r"[\.]")
+_WHITESPACE_RE = re.compile(r"\s+")
+_NON_SLUG_CHAR_RE = re.compile(r"[^a-z0-9\-]")
+_DASH_RUN_RE = re.compile(r"-+")
+
+
 def _as_county_label(name: str) -> str:
     n = name.strip()
-    n = re.sub(r"\s+County$", "", n, flags=re.I)
+    n = _COUNTY_SUFFIX_RE.sub("", n)
     return f"{n} County"
 
 
 def _to_slug(label: str) -> str:
     base = label.strip().lower()
     base = base.replace("&", "and")
-    base = re.sub(r"'", "", base)
-    base = re.sub(r"[\.]", "", base)
-    base = re.sub(r"\s+", "-", base)
-    base = re.sub(r"[^a-z0-9\-]", "-", base)
-    base = re.sub(r"-+", "-", base).strip("-")
+    base = _APOSTROPHE_RE.sub("", base)
+    base = _DOT_RE.sub("", base)
+    base = _WHITESPACE_RE.sub("-", base)
+    base = _NON_SLUG_CHAR_RE.sub("-", base)
+    base = _DASH_RUN_RE.sub("-", base).strip("-")
     if not base.endswith("-county"):
         base += "-county"
     return base
 
 
-_FL_SRC = [
+_FL_SRC = (
     "Alachua",
     "Baker",
     "Bay",
@@ -128,10 +143,10 @@ _FL_SRC = [
     "Wakulla",
     "Walton",
     "Washington",
-]
-FL_LABELS = [_as_county_label(x) for x in _FL_SRC]
+)
+FL_LABELS = tuple(_as_county_label(x) for x in _FL_SRC)
 
-_GA_SRC = [
+_GA_SRC = (
     "Appling County",
     "Atkinson County",
     "Bacon County",
@@ -291,10 +306,10 @@ _GA_SRC = [
     "Wilbarger County",
     "Wilkinson County",
     "Worth County",
-]
-GA_LABELS = _GA_SRC[:]
+)
+GA_LABELS = _GA_SRC
 
-_CA_SRC = [
+_CA_SRC = (
     "Alameda",
     "Alpine",
     "Amador",
@@ -353,10 +368,10 @@ _CA_SRC = [
     "Ventura",
     "Yolo",
     "Yuba",
-]
-CA_LABELS = [_as_county_label(x) for x in _CA_SRC]
+)
+CA_LABELS = tuple(_as_county_label(x) for x in _CA_SRC)
 
-_TX_SRC = [
+_TX_SRC = (
     "Anderson County",
     "Andrews County",
     "Angelina County",
@@ -610,13 +625,22 @@ _TX_SRC = [
     "Young County",
     "Zapata County",
     "Zavala County",
-]
-TX_LABELS = _TX_SRC[:]
+)
+TX_LABELS = _TX_SRC
 
 STATES = {"ca": "California", "fl": "Florida", "ga": "Georgia", "tx": "Texas"}
 
 
-def _labels_to_slug_map(labels: List[str]) -> Dict[str, str]:
+# State picker labels, e.g. "California (CA)"; formatted once per process
+@st.cache_resource
+def _state_labels() -> Dict[str, str]:
+    return {s: f"{name} ({s.upper()})" for s, name in STATES.items()}
+
+
+STATE_LABELS = _state_labels()
+
+
+def _labels_to_slug_map(labels: Tuple[str, ...]) -> Dict[str, str]:
     mapping = {}
     for lab in labels:
         label = _as_county_label(lab) if not lab.lower().endswith("county") else lab
@@ -624,52 +648,168 @@ def _labels_to_slug_map(labels: List[str]) -> Dict[str, str]:
     return dict(sorted(mapping.items(), key=lambda kv: kv[1]))
 
 
-COUNTY_LABELS_BY_STATE: Dict[str, Dict[str, str]] = {
-    "fl": _labels_to_slug_map(FL_LABELS),
-    "ga": _labels_to_slug_map(GA_LABELS),
-    "ca": _labels_to_slug_map(CA_LABELS),
-    "tx": _labels_to_slug_map(TX_LABELS),
-}
+# Streamlit re-runs this script on every interaction; build the slug maps once per process
+@st.cache_resource
+def _county_labels_by_state() -> Dict[str, Dict[str, str]]:
+    return {
+        "fl": _labels_to_slug_map(FL_LABELS),
+        "ga": _labels_to_slug_map(GA_LABELS),
+        "ca": _labels_to_slug_map(CA_LABELS),
+        "tx": _labels_to_slug_map(TX_LABELS),
+    }
+
+
+COUNTY_LABELS_BY_STATE: Dict[str, Dict[str, str]] = _county_labels_by_state()
+
+
+# Every county slug per state, sent when a state's county selection is empty
+@st.cache_resource
+def _all_county_slugs() -> Dict[str, Tuple[str, ...]]:
+    return {s: tuple(slug_to_label) for s, slug_to_label in COUNTY_LABELS_BY_STATE.items()}
+
+
+ALL_COUNTY_SLUGS = _all_county_slugs()
+
+
+@st.cache_resource
+def _county_indexes(state: str) -> Tuple[Dict[str, str], Dict[str, str], Tuple[str, ...]]:
+    """(slug -> label, label -> slug, sorted labels) for one state's county picker."""
+    slug_to_label = COUNTY_LABELS_BY_STATE.get(state, {})
+    label_to_slug = {v: k for k, v in slug_to_label.items()}
+    return slug_to_label, label_to_slug, tuple(sorted(slug_to_label.values()))
 
 # =========================
 # Backend
 # =========================
 API_URL = os.getenv("UNBARRED_API", "").strip()
 API_KEY = os.getenv("UNBARRED_API_KEY", "").strip()
+# (connect, read) seconds: an unreachable backend fails fast, a slow LLM answer still has time
+API_TIMEOUT = (5, 180)
+
+
+# Cached so every rerun and session reuses the same keep-alive connections to the backend
+@st.cache_resource
+def _backend_session() -> requests.Session:
+    # Only retry what is safe for a POST that runs the LLM: failed connects and
+    # "busy"/gateway responses; never a read timeout, where the search may still be running
+    retry = Retry(
+        total=2,
+        connect=2,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=(429, 502, 503),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 def call_backend_api(payload: dict) -> dict:
     headers = {"Content-Type": "application/json"}
     if API_KEY:
         headers["Authorization"] = f"Bearer {API_KEY}"
-    r = requests.post(API_URL, json=payload, headers=headers, timeout=180)
+    if orjson is not None:
+        r = _backend_session().post(API_URL, data=orjson.dumps(payload), headers=headers, timeout=API_TIMEOUT)
+    else:
+        r = _backend_session().post(API_URL, json=payload, headers=headers, timeout=API_TIMEOUT)
     r.raise_for_status()
-    return r.json()
+    return orjson.loads(r.content) if orjson is not None else r.json()
+
+
+# Identical searches (same query and filters) within 5 minutes reuse the first answer;
+# keyed on canonical JSON so dict ordering doesn't matter. Errors are not cached.
+@st.cache_data(ttl=300, max_entries=128, show_spinner=False)
+def _cached_backend_call(payload_json: str) -> dict:
+    return call_backend_api(json.loads(payload_json))
+
+
+# =========================
+# CSV export
+# =========================
+CSV_FIELDS = (
+    "section", "state", "county", "summary", "score", "page", "raw_pdf_path", "chunk_text",
+    "fk_grade", "fre", "wc", "pct_complex",
+    "penalty", "obligation", "permission", "prohibition",
+)
+
+
+def chunks_to_csv(chunks: List[dict]) -> bytes:
+    """Write the chunks straight to CSV bytes (no intermediate DataFrame)."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore", lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(chunks)
+    return buf.getvalue().encode("utf-8")
+
+
+# Columns of the in-page chunks table (a subset of the CSV export)
+TABLE_FIELDS = CSV_FIELDS[:7]
+MAX_CHUNK_DETAILS = 25  # Expanders rendered per result
+RULE_TAG_FIELDS = ("penalty", "obligation", "permission", "prohibition")
+READABILITY_FIELDS = ("fk_grade", "fre", "wc", "pct_complex")
+
+
+def chunk_details_md(c: dict) -> str:
+    """One markdown block for a chunk's expander (one element instead of ~10 st.write calls)."""
+    return "\n".join(
+        [
+            f"**summary:** {c.get('summary')}",
+            "",
+            f"**score:** {c.get('score')} • **rerank_score:** {c.get('rerank_score')}",
+            "",
+            f"**page → end_page:** {c.get('page')} → {c.get('end_page')}",
+            "",
+            "| rule tag | value | | readability | value |",
+            "|---|---|---|---|---|",
+            *(
+                f"| {tag} | {c.get(tag)} | | {metric} | {c.get(metric)} |"
+                for tag, metric in zip(RULE_TAG_FIELDS, READABILITY_FIELDS)
+            ),
+            "",
+            f"**raw_pdf_path:** {c.get('raw_pdf_path')}",
+            "",
+            "**chunk_text:**",
+        ]
+    )
 
 
 # =========================
 # Session
 # =========================
 ss = st.session_state
+MAX_HISTORY_MESSAGES = 20  # Older turns collapse to a list of past queries
+
 if "messages" not in ss:
     ss.messages = []
+if "archived_queries" not in ss:
+    ss.archived_queries = []
 if "last_chunks" not in ss:
     ss.last_chunks = []
+if "last_chunks_csv" not in ss:
+    ss.last_chunks_csv = None
 if "run_id" not in ss:
     ss.run_id = datetime.now().strftime("%Y%m%d_%H%M%S") + "-" + uuid.uuid4().hex[:6]
 
 # =========================
 # Sidebar
 # =========================
-with st.sidebar:
+# A fragment: changing a filter reruns only the sidebar, not the chat history and results.
+# The values are kept in session state (widget keys + ss.state_to_counties) for build_payload.
+@st.fragment
+def sidebar_filters() -> None:
     st.header("UnBarred")
     st.caption(f"Run: {ss.run_id} • v{VERSION}")
 
     state_choices = st.multiselect(
         "State(s)",
-        options=list(STATES.keys()),
+        options=tuple(STATE_LABELS),
         default=["ca"],
-        format_func=lambda s: f"{STATES[s]} ({s.upper()})",
+        format_func=STATE_LABELS.__getitem__,
     )
     if len(state_choices) > 4:
         st.warning("Select up to 4 states. Using first 4.")
@@ -678,9 +818,7 @@ with st.sidebar:
     state_to_counties: Dict[str, List[str]] = {}
     for s in state_choices:
         st.subheader(f"{STATES[s]} counties")
-        slug_to_label = COUNTY_LABELS_BY_STATE.get(s, {})
-        label_to_slug = {v: k for k, v in slug_to_label.items()}
-        all_labels = list(sorted(slug_to_label.values()))
+        slug_to_label, label_to_slug, all_labels = _county_indexes(s)
 
         selected_labels = st.multiselect(
             "Choose counties (empty = ALL counties)",
@@ -691,83 +829,73 @@ with st.sidebar:
         )
         selected_slugs = [label_to_slug[lbl] for lbl in selected_labels]
         state_to_counties[s] = selected_slugs
+    ss.state_to_counties = state_to_counties
 
     st.divider()
     st.subheader("Rule filters (optional)")
-    penalty = st.checkbox("Penalty (Y)")
-    obligation = st.checkbox("Obligation (Y)")
-    permission = st.checkbox("Permission (Y)")
-    prohibition = st.checkbox("Prohibition (Y)")
+    st.checkbox("Penalty (Y)", key="penalty")
+    st.checkbox("Obligation (Y)", key="obligation")
+    st.checkbox("Permission (Y)", key="permission")
+    st.checkbox("Prohibition (Y)", key="prohibition")
 
     st.divider()
     st.subheader("Readability ranges (always included)")
-    fk_min, fk_max = st.slider("FK Grade (fk_grade)", 0.0, 80.0, (0.0, 80.0), 0.5)
-    fre_min, fre_max = st.slider("FRE (fre)", -100.0, 120.0, (-100.0, 120.0), 1.0)
-    wc_min, wc_max = st.slider("Word Count (wc)", 0, 2000, (0, 2000), 10)
-    pctc_min, pctc_max = st.slider("Pct Complex (pct_complex)", 0, 100, (0, 100), 1)
+    st.slider("FK Grade (fk_grade)", 0.0, 80.0, (0.0, 80.0), 0.5, key="fk_range")
+    st.slider("FRE (fre)", -100.0, 120.0, (-100.0, 120.0), 1.0, key="fre_range")
+    st.slider("Word Count (wc)", 0, 2000, (0, 2000), 10, key="wc_range")
+    st.slider("Pct Complex (pct_complex)", 0, 100, (0, 100), 1, key="pctc_range")
 
-    show_sources = st.checkbox("Show chunks table", value=True)
+    st.checkbox("Show chunks table", value=True, key="show_sources")
+    st.checkbox("Force refresh (skip cached results)", key="force_refresh")
 
     if ss.last_chunks:
-        df_dl = pd.DataFrame(
-            [
-                {
-                    "section": c.get("section"),
-                    "state": c.get("state"),
-                    "county": c.get("county"),
-                    "summary": c.get("summary"),
-                    "score": c.get("score"),
-                    "page": c.get("page"),
-                    "raw_pdf_path": c.get("raw_pdf_path"),
-                    "chunk_text": c.get("chunk_text"),
-                    "fk_grade": c.get("fk_grade"),
-                    "fre": c.get("fre"),
-                    "wc": c.get("wc"),
-                    "pct_complex": c.get("pct_complex"),
-                    "penalty": c.get("penalty"),
-                    "obligation": c.get("obligation"),
-                    "permission": c.get("permission"),
-                    "prohibition": c.get("prohibition"),
-                }
-                for c in ss.last_chunks
-            ]
-        )
+        # Built once per search result, not on every slider/checkbox rerun
+        if ss.last_chunks_csv is None:
+            ss.last_chunks_csv = chunks_to_csv(ss.last_chunks)
         st.download_button(
             "Download chunks CSV",
-            data=df_dl.to_csv(index=False).encode("utf-8"),
+            data=ss.last_chunks_csv,
             file_name="unbarred_chunks.csv",
             mime="text/csv",
+            on_click="ignore",  # downloading doesn't need to re-run the whole script
         )
 
 
+with st.sidebar:
+    sidebar_filters()
+
+
 # =========================
 # Payload builder
 # =========================
 def build_locations(state_to_cty: Dict[str, List[str]]) -> List[dict]:
     locs = []
     for s, selected_slugs in state_to_cty.items():
-        all_slugs = list(COUNTY_LABELS_BY_STATE.get(s, {}).keys())
         # Empty selection = ALL counties
-        counties = selected_slugs if selected_slugs else all_slugs
+        counties = selected_slugs if selected_slugs else ALL_COUNTY_SLUGS.get(s, ())
         locs.append({"state": s, "county": counties})
     return locs
 
 
 def build_payload(query_text: str) -> dict:
+    fk_min, fk_max = ss.fk_range
+    fre_min, fre_max = ss.fre_range
+    wc_min, wc_max = ss.wc_range
+    pctc_min, pctc_max = ss.pctc_range
     filters = {
-        "locations": build_locations(state_to_counties),
+        "locations": build_locations(ss.state_to_counties),
         "fk_grade": {"min": float(fk_min), "max": float(fk_max)},
         "fre": {"min": float(fre_min), "max": float(fre_max)},
         "wc": {"min": int(wc_min), "max": int(wc_max)},
         "pct_complex": {"min": int(pctc_min), "max": int(pctc_max)},
     }
-    if penalty:
+    if ss.penalty:
         filters["penalty"] = "Y"
-    if obligation:
+    if ss.obligation:
         filters["obligation"] = "Y"
-    if permission:
+    if ss.permission:
         filters["permission"] = "Y"
-    if prohibition:
+    if ss.prohibition:
         filters["prohibition"] = "Y"
     return {"query": query_text, "filters": filters}
 
@@ -778,12 +906,13 @@ def build_payload(query_text: str) -> dict:
 st.title("UnBarred Search")
 
 # Render history
+if ss.archived_queries:
+    with st.expander(f"Earlier queries ({len(ss.archived_queries)})"):
+        st.markdown("\n".join(f"- {q}" for q in ss.archived_queries))
 for m in ss.messages:
     with st.chat_message(m["role"]):
-        content = m["content"]
-        if content and m["role"] == "assistant":
-             content = content.replace("$", "\$")
-        st.markdown(content)
+        # Assistant replies are stored already escaped (see below), so reruns do no string work
+        st.markdown(m.get("markdown", m["content"]))
 
 # ---- Sticky bottom form in main ----
 st.markdown('<div class="ub-bottom">', unsafe_allow_html=True)
@@ -798,7 +927,7 @@ st.markdown("</div>", unsafe_allow_html=True)
 
 if submitted and user_text.strip():
     # 1. Log the User Query
-    logger.info(f"User Query: '{user_text}' [RunID: {ss.run_id}]")
+    logger.info("User Query: '%s' [RunID: %s]", user_text, ss.run_id)
     ss.messages.append({"role": "user", "content": user_text})
     with st.chat_message("user"):
         st.markdown(user_text)
@@ -806,28 +935,40 @@ if submitted and user_text.strip():
     payload = build_payload(user_text)
 
     # 2. Log the Filters (Optional but helpful)
-    logger.info(f"Filters Applied: {json.dumps(payload.get('filters'))} [RunID: {ss.run_id}]")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Filters Applied: %s [RunID: %s]",
+            json.dumps(payload.get("filters"), separators=(",", ":")),
+            ss.run_id,
+        )
 
     with st.spinner("Running search…"):
         try:
             t0 = time.perf_counter()
-            data = call_backend_api(payload)
+            if ss.force_refresh:
+                data = call_backend_api(payload)
+            else:
+                data = _cached_backend_call(json.dumps(payload, sort_keys=True))
             took_ms = int((time.perf_counter() - t0) * 1000)
 
             # 3. Log Success & Performance
-            logger.info(f"Search Success: {len(data.get('chunks', []))} chunks found in {took_ms}ms [RunID: {ss.run_id}]")
+            logger.info(
+                "Search Success: %d chunks found in %dms [RunID: %s]",
+                len(data.get("chunks", [])), took_ms, ss.run_id,
+            )
 
         except requests.HTTPError as e:
             # 4. Log Errors
-            logger.error(f"Backend Error: {str(e)} [RunID: {ss.run_id}]")
+            logger.error("Backend Error: %s [RunID: %s]", e, ss.run_id)
             st.error(f"Backend error: {e}\n\n{getattr(e.response, 'text', '')}")
             st.stop()
         except Exception as e:
-            logger.error(f"Unexpected Error: {str(e)} [RunID: {ss.run_id}]")
+            logger.error("Unexpected Error: %s [RunID: %s]", e, ss.run_id)
             st.error(str(e))
             st.stop()
 
     ss.last_chunks = data.get("chunks", [])
+    ss.last_chunks_csv = None
 
     with st.chat_message("assistant"):
         response_text = data.get("response", "")
@@ -845,59 +986,36 @@ if submitted and user_text.strip():
             f"Latency: {took_ms} ms • mode={data.get('mode')} • hits={len(ss.last_chunks)}"
         )
 
-        if show_sources:
+        if ss.show_sources:
             if not ss.last_chunks:
                 st.warning("No high-confidence ordinances retrieved.")
             else:
-                rows = [
-                    {
-                        "section": c.get("section"),
-                        "state": c.get("state"),
-                        "county": c.get("county"),
-                        "summary": c.get("summary"),
-                        "score": c.get("score"),
-                        "page": c.get("page"),
-                        "raw_pdf_path": c.get("raw_pdf_path"),
-                    }
-                    for c in ss.last_chunks
-                ]
-                st.dataframe(pd.DataFrame(rows), use_container_width=True)
+                st.dataframe(
+                    pd.DataFrame.from_records(ss.last_chunks, columns=TABLE_FIELDS),
+                    use_container_width=True,
+                )
 
                 st.subheader("Chunk details")
-                for i, c in enumerate(ss.last_chunks, start=1):
+                if len(ss.last_chunks) > MAX_CHUNK_DETAILS:
+                    st.caption(
+                        f"Showing the first {MAX_CHUNK_DETAILS} of {len(ss.last_chunks)} chunks; "
+                        "all of them are in the table above and the CSV download."
+                    )
+                for i, c in enumerate(ss.last_chunks[:MAX_CHUNK_DETAILS], start=1):
                     with st.expander(
                         f"{i}. {c.get('section')} ({c.get('state')}, {c.get('county')})"
                     ):
-                        st.write("summary:", c.get("summary"))
-                        st.write("score:", c.get("score"))
-                        st.write("rerank_score:", c.get("rerank_score"))
-                        st.write(
-                            "page → end_page:", c.get("page"), "→", c.get("end_page")
-                        )
-                        st.write(
-                            "rule tags:",
-                            {
-                                "penalty": c.get("penalty"),
-                                "obligation": c.get("obligation"),
-                                "permission": c.get("permission"),
-                                "prohibition": c.get("prohibition"),
-                            },
-                        )
-                        st.write(
-                            "readability:",
-                            {
-                                "fk_grade": c.get("fk_grade"),
-                                "fre": c.get("fre"),
-                                "wc": c.get("wc"),
-                                "pct_complex": c.get("pct_complex"),
-                            },
-                        )
-                        st.write("raw_pdf_path:", c.get("raw_pdf_path"))
-                        st.write("chunk_text:")
+                        st.markdown(chunk_details_md(c))
                         st.code(c.get("chunk_text", ""))
 
         st.divider()
         st.subheader("Payload sent")
         st.json(payload)
 
-    ss.messages.append({"role": "assistant", "content": data.get("response", "")})
+    ss.messages.append(
+        {"role": "assistant", "content": data.get("response", ""), "markdown": response_text}
+    )
+    if len(ss.messages) > MAX_HISTORY_MESSAGES:
+        overflow = ss.messages[:-MAX_HISTORY_MESSAGES]
+        ss.archived_queries.extend(m["content"] for m in overflow if m["role"] == "user")
+        del ss.messages[:-MAX_HISTORY_MESSAGES]
@@ -1,8 +1,11 @@
 import os
+import sys
 from dotenv import load_dotenv
+from streamlit.web import cli as stcli
 
 # Load .env file
 load_dotenv()
 
-# Launch Streamlit
-os.system("streamlit run app.py")
+# Launch Streamlit in this process (same as `streamlit run app.py`, without a shell and second interpreter)
+sys.argv = ["streamlit", "run", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")] + sys.argv[1:]
+sys.exit(stcli.main())